@@ -0,0 +1,483 @@
+from abc import ABC, abstractmethod
+from decimal import Decimal
+import struct
+import time
+
+from decoder import (GENERAL_SWAP_DECODER,
+                     MERCURIAL_SWAP_DECODER,
+                     SABER_FEES_DECODER,
+                     SABER_SWAP_DECODER,
+                     STEP_SWAP_DECODER,
+                     unpackTokenAmount)
+from encoding import decodeAccountData, verifyAccountEncoding
+from layout import (MERCURIAL_FEE_DENOMINATOR,
+                    MERCURIAL_SWAP_PROGRAM_ID,
+                    ORCA_TOKEN_SWAP_PROGRAM_ID_V2,
+                    SABER_SWAP_INSTRUCTION_IDX,
+                    SABER_SWAP_PROGRAM_ID,
+                    STEP_SWAP_PROGRAM_ID,
+                    SWAP_INSTRUCTION_FORMAT,
+                    TOKEN_SWAP_INSTRUCTION_IDX)
+from quote import (CONSTANT_PRODUCT,
+                   STABLE_SWAP,
+                   stableAmountOut,
+                   tokenSwapAmountOut)
+from sol import (MemcmpOpts,
+                 PublicKey,
+                 TOKEN_PROGRAM_ID)
+
+CLOCK_SYSVAR_ID = 'SysvarC1ock11111111111111111111111111111111'
+
+# The Step and Mercurial instruction account orders come from their public SDKs and have not
+# been checked against a mainnet swap, those adapters quote but do not trade until they are
+UNVERIFIED_SWAP = "{} swap instructions are not verified against a mainnet transaction"
+
+# Common interface for swap pools of any DEX, modeled on RaydiumAmm. Reserves follow the
+# Raydium convention, [quote, base] followed by any further pool balances, and 'buy' spends
+# the quote token for the base token, so snapshots and quotes treat every DEX the same way.
+class PoolAdapter(ABC):
+    name = None
+    curve = None
+    decoder = None
+    mint_fields = None
+    vault_fields = None
+    default_program_id = None
+
+    def __init__(self,
+                 solana,
+                 token0,
+                 token1,
+                 pool_address = None,
+                 program_id = None):
+        self.solana = solana
+        self.program_id = self.solana.publicKey(program_id or self.default_program_id)
+        if pool_address is None:
+            pool_address = self.getPoolAddress(token0, token1)
+        self.pool_address = self.solana.publicKey(pool_address)
+        pool_data, _ = self.solana.getAccountData(self.pool_address)
+        self.pool_info = self.buildPoolInfo(self.pool_address, pool_data, token0, token1)
+        self.base = self.solana.publicKey(self.pool_info["baseMint"])
+        self.quote = self.solana.publicKey(self.pool_info["quoteMint"])
+
+    def verifyEncoding(self, address, encoding):
+        verifyAccountEncoding(address, encoding)
+
+    def selectAddress(self, accounts):
+        return max(accounts, key=accounts.get)
+
+    def getPoolProgramAccounts(self, mint_a, mint_b):
+        memcmp_opts = [MemcmpOpts(offset=self.decoder.offset(self.mint_fields[0]), bytes=mint_a),
+                       MemcmpOpts(offset=self.decoder.offset(self.mint_fields[1]), bytes=mint_b)]
+        return self.solana.getProgramAccounts(self.program_id,
+                                              memcmp_opts=memcmp_opts)
+
+    def getPoolAddress(self, token0, token1):
+        token0 = str(token0)
+        token1 = str(token1)
+        accounts = self.getPoolProgramAccounts(token0, token1) + self.getPoolProgramAccounts(token1, token0)
+        if len(accounts) == 0:
+            raise ValueError("Pair of tokens {} and {} has no {} pool".format(token0, token1, self.name))
+        if len(accounts) == 1:
+            return accounts[0]['pubkey']
+        # Several pools can trade the same pair, pick the one holding the most liquidity
+        vaults = []
+        for account in accounts:
+            data = self.decoder.parse(decodeAccountData(account['account']['data']))
+            vaults.append([self.solana.publicKey(data[field]) for field in self.vault_fields[:2]])
+        vault_datas, _ = self.solana.getMultipleAccountsData([vault for pair in vaults for vault in pair])
+        amounts = [unpackTokenAmount(decodeAccountData(data))[0] if data[0] else 0 for data in vault_datas]
+        return self.selectAddress({account['pubkey']: amounts[2 * i] + amounts[2 * i + 1]
+                                   for i, account in enumerate(accounts)})
+
+    def orderTokens(self,
+                    mints,
+                    token0,
+                    token1):
+        # The pool decides which of the pair is base, the lower pool index, as Raydium markets do
+        indices = []
+        for token in (token0, token1):
+            token = str(token)
+            if token not in mints:
+                raise ValueError("Pool does not trade {}, its tokens are {}".format(token, mints))
+            indices.append(mints.index(token))
+        base_index, quote_index = sorted(indices)
+        return [quote_index, base_index] + [i for i in range(len(mints)) if i not in indices]
+
+    def buildPoolInfo(self,
+                      pool_address,
+                      pool_data,
+                      token0,
+                      token1):
+        self.verifyEncoding(pool_address, pool_data[1])
+        data = decodeAccountData(pool_data)
+        parsed = self.decoder.parse(data)
+        vaults = self.poolVaults(parsed)
+        mints = self.poolMints(parsed, vaults)
+        order = self.orderTokens(mints, token0, token1)
+        pool_info = {}
+        pool_info["id"] = pool_address
+        pool_info["programId"] = str(self.program_id)
+        pool_info["authority"] = self.solana.createProgramAddress([bytes(pool_address), bytes([self.poolNonce(parsed)])],
+                                                                  self.program_id)
+        pool_info["mints"] = [mints[i] for i in order]
+        pool_info["vaults"] = [vaults[i] for i in order]
+        pool_info["poolIndices"] = order
+        pool_info["baseMint"] = pool_info["mints"][1]
+        pool_info["quoteMint"] = pool_info["mints"][0]
+        pool_info["baseVault"] = pool_info["vaults"][1]
+        pool_info["quoteVault"] = pool_info["vaults"][0]
+        self.extendPoolInfo(pool_info, parsed)
+        return pool_info
+
+    def poolVaults(self, parsed):
+        return [self.solana.publicKey(parsed[field]) for field in self.vault_fields]
+
+    def poolMints(self, parsed, vaults):
+        return [str(PublicKey(parsed[field])) for field in self.mint_fields]
+
+    @abstractmethod
+    def poolNonce(self, parsed):
+        pass
+
+    def extendPoolInfo(self, pool_info, parsed):
+        pass
+
+    def reserveAccounts(self):
+        return [self.pool_info["id"]] + self.pool_info["vaults"]
+
+    def parsePoolReserves(self, account_datas, slot):
+        for address, (_, encoding) in zip(self.reserveAccounts(), account_datas):
+            self.verifyEncoding(address, encoding)
+        pool_data = decodeAccountData(account_datas[0])
+        balances = [unpackTokenAmount(decodeAccountData(data))[0] for data in account_datas[1:]]
+        reserves, fees = self.parseReserveData(pool_data, balances)
+        return (reserves, fees, slot)
+
+    @abstractmethod
+    def parseReserveData(self, pool_data, balances):
+        pass
+
+    def getReserves(self):
+        account_datas, slot = self.solana.getMultipleAccountsData(self.reserveAccounts())
+        return self.parsePoolReserves(account_datas, slot)
+
+    def sideIndices(self, side):
+        return (0, 1) if side == 'buy' else (1, 0)
+
+    @abstractmethod
+    def amountOut(self,
+                  amount_in,
+                  side,
+                  reserves,
+                  fees):
+        pass
+
+    def getAmountOut(self, amount_in, side):
+        reserves, fees, slot = self.getReserves()
+        return (self.amountOut(amount_in, side, reserves, fees), slot)
+
+    @abstractmethod
+    def swapInstruction(self,
+                        amount_in,
+                        min_amount_out,
+                        side,
+                        from_token_account,
+                        to_token_account,
+                        owner):
+        pass
+
+    def swap(self,
+             amount_in,
+             min_amount_out,
+             side,
+             from_token_account,
+             to_token_account,
+             keypair,
+             transaction = None,
+             tx_opts = None,
+             send_transaction = True):
+        # Transaction building modules load here, on the first swap, not when watching reserves
+        from sol import Transaction
+        if transaction is None:
+            transaction = Transaction()
+        transaction.add(self.swapInstruction(amount_in,
+                                             min_amount_out,
+                                             side,
+                                             self.solana.publicKey(from_token_account),
+                                             self.solana.publicKey(to_token_account),
+                                             keypair.public_key))
+        if send_transaction:
+            return self.solana.sendTransaction(transaction, [keypair], tx_opts)
+        else:
+            return transaction
+
+# SPL token swap and its forks (Orca), constant product curves only
+class TokenSwapPool(PoolAdapter):
+    name = "TokenSwap"
+    curve = CONSTANT_PRODUCT
+    decoder = GENERAL_SWAP_DECODER
+    mint_fields = ('mintA', 'mintB')
+    vault_fields = ('tokenAccountA', 'tokenAccountB')
+    default_program_id = ORCA_TOKEN_SWAP_PROGRAM_ID_V2
+
+    def __init__(self,
+                 solana,
+                 token0,
+                 token1,
+                 pool_address = None,
+                 program_id = None):
+        PoolAdapter.__init__(self, solana, token0, token1, pool_address, program_id)
+        self.unpackFees = self.decoder.unpacker('tradeFeeNumerator',
+                                                'tradeFeeDenominator',
+                                                'ownerTradeFeeNumerator',
+                                                'ownerTradeFeeDenominator')
+
+    def poolNonce(self, parsed):
+        return parsed['bumpSeed']
+
+    def extendPoolInfo(self, pool_info, parsed):
+        if 'curveType' in parsed and parsed['curveType'] != 0:
+            raise ValueError("{} pool {} uses curve type {}, only constant product is supported".format(self.name,
+                                                                                                         pool_info["id"],
+                                                                                                         parsed['curveType']))
+        pool_info["poolMint"] = self.solana.publicKey(parsed['tokenPool'])
+        pool_info["feeAccount"] = self.solana.publicKey(parsed['feeAccount'])
+
+    def parseReserveData(self, pool_data, balances):
+        trade_numerator, trade_denominator, owner_numerator, owner_denominator = self.unpackFees(pool_data)
+        # Both fees come out of the input, the combined fraction is what PriceGraph legs use
+        fee_denominator = (trade_denominator or 1) * (owner_denominator or 1)
+        fee_numerator = trade_numerator * (owner_denominator or 1) + owner_numerator * (trade_denominator or 1)
+        fees = (Decimal(fee_denominator),
+                Decimal(fee_numerator),
+                (trade_numerator, trade_denominator, owner_numerator, owner_denominator))
+        return (balances, fees)
+
+    def amountOut(self,
+                  amount_in,
+                  side,
+                  reserves,
+                  fees):
+        i, j = self.sideIndices(side)
+        return tokenSwapAmountOut(int(amount_in), int(reserves[i]), int(reserves[j]), *fees[2])
+
+    def swapInstruction(self,
+                        amount_in,
+                        min_amount_out,
+                        side,
+                        from_token_account,
+                        to_token_account,
+                        owner):
+        from sol import AccountMeta, TransactionInstruction
+        i, j = self.sideIndices(side)
+        keys = [
+            AccountMeta(self.pool_info["id"], False, False),
+            AccountMeta(self.pool_info["authority"], False, False),
+            AccountMeta(owner, True, False),
+            AccountMeta(from_token_account, False, True),
+            AccountMeta(self.pool_info["vaults"][i], False, True),
+            AccountMeta(self.pool_info["vaults"][j], False, True),
+            AccountMeta(to_token_account, False, True),
+            AccountMeta(self.pool_info["poolMint"], False, True),
+            AccountMeta(self.pool_info["feeAccount"], False, True),
+            AccountMeta(TOKEN_PROGRAM_ID, False, False)
+        ]
+        data = struct.pack(SWAP_INSTRUCTION_FORMAT, TOKEN_SWAP_INSTRUCTION_IDX, amount_in, min_amount_out)
+        return TransactionInstruction(keys, self.program_id, data)
+
+class StepSwapPool(TokenSwapPool):
+    name = "Step"
+    decoder = STEP_SWAP_DECODER
+    default_program_id = STEP_SWAP_PROGRAM_ID
+
+    def swapInstruction(self,
+                        amount_in,
+                        min_amount_out,
+                        side,
+                        from_token_account,
+                        to_token_account,
+                        owner):
+        raise ValueError(UNVERIFIED_SWAP.format(self.name))
+
+class SaberPool(PoolAdapter):
+    name = "Saber"
+    curve = STABLE_SWAP
+    decoder = SABER_SWAP_DECODER
+    mint_fields = ('mintA', 'mintB')
+    vault_fields = ('tokenAccountA', 'tokenAccountB')
+    default_program_id = SABER_SWAP_PROGRAM_ID
+
+    def __init__(self,
+                 solana,
+                 token0,
+                 token1,
+                 pool_address = None,
+                 program_id = None):
+        PoolAdapter.__init__(self, solana, token0, token1, pool_address, program_id)
+        self.unpackAmp = self.decoder.unpacker('isPaused',
+                                               'initialAmpFactor',
+                                               'targetAmpFactor',
+                                               'startRampTs',
+                                               'stopRampTs')
+        self.fees_offset = self.decoder.offset('feesLayout')
+        self.unpackFees = SABER_FEES_DECODER.unpacker('tradeFeeNumerator', 'tradeFeeDenominator')
+
+    def poolNonce(self, parsed):
+        return parsed['nonce']
+
+    def extendPoolInfo(self, pool_info, parsed):
+        admin_fee_accounts = [self.solana.publicKey(parsed['adminFeeAccountA']),
+                              self.solana.publicKey(parsed['adminFeeAccountB'])]
+        pool_info["adminFeeAccounts"] = [admin_fee_accounts[i] for i in pool_info["poolIndices"]]
+
+    def ampFactor(self,
+                  initial,
+                  target,
+                  start_ts,
+                  stop_ts,
+                  now = None):
+        # The amplification ramps linearly from initial to target between the two timestamps
+        now = int(time.time()) if now is None else now
+        if now >= stop_ts or stop_ts <= start_ts:
+            return target
+        elapsed = max(0, now - start_ts)
+        if target > initial:
+            return initial + (target - initial) * elapsed // (stop_ts - start_ts)
+        return initial - (initial - target) * elapsed // (stop_ts - start_ts)
+
+    def parseReserveData(self, pool_data, balances):
+        is_paused, initial, target, start_ts, stop_ts = self.unpackAmp(pool_data)
+        fee_numerator, fee_denominator = self.unpackFees(memoryview(pool_data)[self.fees_offset:])
+        # A paused pool quotes nothing
+        if is_paused:
+            balances = [0] * len(balances)
+        fees = (Decimal(fee_denominator), Decimal(fee_numerator), self.ampFactor(initial, target, start_ts, stop_ts))
+        return (balances, fees)
+
+    def amountOut(self,
+                  amount_in,
+                  side,
+                  reserves,
+                  fees):
+        i, j = self.sideIndices(side)
+        fee_denominator, fee_numerator, amp = fees
+        return stableAmountOut(int(amount_in), i, j, [int(r) for r in reserves], amp, int(fee_numerator), int(fee_denominator))
+
+    def swapInstruction(self,
+                        amount_in,
+                        min_amount_out,
+                        side,
+                        from_token_account,
+                        to_token_account,
+                        owner):
+        from sol import AccountMeta, TransactionInstruction
+        i, j = self.sideIndices(side)
+        keys = [
+            AccountMeta(self.pool_info["id"], False, False),
+            AccountMeta(self.pool_info["authority"], False, False),
+            AccountMeta(owner, True, False),
+            AccountMeta(from_token_account, False, True),
+            AccountMeta(self.pool_info["vaults"][i], False, True),
+            AccountMeta(self.pool_info["vaults"][j], False, True),
+            AccountMeta(to_token_account, False, True),
+            AccountMeta(self.pool_info["adminFeeAccounts"][j], False, True),
+            AccountMeta(TOKEN_PROGRAM_ID, False, False),
+            AccountMeta(self.solana.publicKey(CLOCK_SYSVAR_ID), False, False)
+        ]
+        data = struct.pack(SWAP_INSTRUCTION_FORMAT, SABER_SWAP_INSTRUCTION_IDX, amount_in, min_amount_out)
+        return TransactionInstruction(keys, self.program_id, data)
+
+# Mercurial pools hold two to four tokens, only the token accounts are in the pool state
+# so the mints are read from the vaults
+class MercurialPool(PoolAdapter):
+    name = "Mercurial"
+    curve = STABLE_SWAP
+    decoder = MERCURIAL_SWAP_DECODER
+    vault_fields = ('tokenAccountA', 'tokenAccountB', 'tokenAccountC', 'tokenAccountD')
+    multiplier_fields = ('precisionMultiplierA', 'precisionMultiplierB', 'precisionMultiplierC', 'precisionMultiplierD')
+    default_program_id = MERCURIAL_SWAP_PROGRAM_ID
+
+    def __init__(self,
+                 solana,
+                 token0,
+                 token1,
+                 pool_address = None,
+                 program_id = None):
+        PoolAdapter.__init__(self, solana, token0, token1, pool_address, program_id)
+        self.unpackFees = self.decoder.unpacker('amplificationCoefficient', 'feeNumerator')
+
+    def getPoolAddress(self, token0, token1):
+        token0 = str(token0)
+        token1 = str(token1)
+        # No mints in the pool state to filter on, so every pool's vault mints are looked up
+        accounts = self.solana.getProgramAccounts(self.program_id,
+                                                  data_size=self.decoder.size)
+        pools = {}
+        for account in accounts:
+            parsed = self.decoder.parse(decodeAccountData(account['account']['data']))
+            pools[account['pubkey']] = self.poolVaults(parsed)
+        vaults = [vault for pool_vaults in pools.values() for vault in pool_vaults]
+        vault_datas = []
+        for i in range(0, len(vaults), 100):
+            account_datas, _ = self.solana.getMultipleAccountsData(vaults[i:i + 100])
+            vault_datas.extend(account_datas)
+        vault_info = {}
+        for vault, data in zip(vaults, vault_datas):
+            if data:
+                raw = decodeAccountData(data)
+                vault_info[str(vault)] = (str(PublicKey(raw[:32])), unpackTokenAmount(raw)[0])
+        candidates = {}
+        for address, pool_vaults in pools.items():
+            info = [vault_info.get(str(vault), (None, 0)) for vault in pool_vaults]
+            mints = [mint for mint, _ in info]
+            if token0 in mints and token1 in mints:
+                candidates[address] = sum(amount for _, amount in info)
+        if len(candidates) == 0:
+            raise ValueError("Pair of tokens {} and {} has no {} pool".format(token0, token1, self.name))
+        return self.selectAddress(candidates)
+
+    def poolVaults(self, parsed):
+        return [self.solana.publicKey(parsed[field]) for field in self.vault_fields[:parsed['tokenAccountsLength']]]
+
+    def poolMints(self, parsed, vaults):
+        account_datas, _ = self.solana.getMultipleAccountsData(vaults)
+        return [str(PublicKey(decodeAccountData(data)[:32])) for data in account_datas]
+
+    def poolNonce(self, parsed):
+        return parsed['nonce']
+
+    def extendPoolInfo(self, pool_info, parsed):
+        multipliers = [parsed[field] for field in self.multiplier_fields[:parsed['tokenAccountsLength']]]
+        pool_info["precisionMultipliers"] = [multipliers[i] for i in pool_info["poolIndices"]]
+        # The exchange instruction lists the vaults in pool order
+        pool_info["poolVaults"] = self.poolVaults(parsed)
+
+    def parseReserveData(self, pool_data, balances):
+        amp, fee_numerator = self.unpackFees(pool_data)
+        fees = (Decimal(MERCURIAL_FEE_DENOMINATOR), Decimal(fee_numerator), amp)
+        return (balances, fees)
+
+    def amountOut(self,
+                  amount_in,
+                  side,
+                  reserves,
+                  fees):
+        i, j = self.sideIndices(side)
+        fee_denominator, fee_numerator, amp = fees
+        return stableAmountOut(int(amount_in),
+                               i,
+                               j,
+                               [int(r) for r in reserves],
+                               amp,
+                               int(fee_numerator),
+                               int(fee_denominator),
+                               self.pool_info["precisionMultipliers"])
+
+    def swapInstruction(self,
+                        amount_in,
+                        min_amount_out,
+                        side,
+                        from_token_account,
+                        to_token_account,
+                        owner):
+        raise ValueError(UNVERIFIED_SWAP.format(self.name))
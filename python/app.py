@@ -1,14 +1,94 @@
-from sol import WrappedSolana, WRAPPED_SOL_MINT
+import argparse
+import sys
+import time
+
+from cache import DEFAULT_CACHE_PATH, PoolCache
 from raydium import RaydiumAmm
+from snapshot import ReserveSnapshotter
+from sol import WRAPPED_SOL_MINT
+
+# Reads go to whichever node is fastest and up to date, an unreachable local node is skipped
+DEFAULT_NODE_URLS = ["http://localhost:8899", "https://solana-api.projectserum.com"]
+# Symbols --pair accepts in place of mint addresses
+TOKEN_MINTS = {"SOL": WRAPPED_SOL_MINT,
+               "USDC": "EPjFWdd5AufqSSqeM2qN1xzybapC8G4wEGGkZwyTDt1v"}
+DEFAULT_PAIR = ("USDC", "SOL")
+
+def tokenMint(token):
+    return TOKEN_MINTS.get(token.upper(), token)
+
+def connect(node_urls):
+    # A single node needs no router and its hedging threads
+    if len(node_urls) == 1:
+        from sol import WrappedSolana
+        return WrappedSolana(node_urls[0])
+    from router import RpcRouter
+    return RpcRouter(node_urls)
+
+def watch(solana,
+          pools,
+          callback,
+          polls = None,
+          interval = 0.0):
+    # Polls the reserves of every pool over the raw transport and calls
+    # callback(pool, reserves, fees, slot) for each, polls times or forever
+    snapshotter = ReserveSnapshotter(solana, pools)
+    request = solana.multipleAccountsRequest(snapshotter.account_groups)
+    count = 0
+    while polls is None or count < polls:
+        results, slot = snapshotter.fetchAtSlot(lambda: solana.getMultipleAccountsBytes(request))
+        for group, (account_bytes, _) in zip(snapshotter.pool_groups, results):
+            start = 0
+            for pool in group:
+                end = start + len(pool.reserveAccounts())
+                pool_bytes = account_bytes[start:end]
+                start = end
+                if any(data is None for data in pool_bytes):
+                    raise ValueError("Accounts of pool {} do not exist".format(pool.pool_info["id"]))
+                reserves, fees, _ = pool.parseReserveBytes(pool_bytes, slot)
+                callback(pool, reserves, fees, slot)
+        count += 1
+        if interval:
+            time.sleep(interval)
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description="Watches the reserves of Raydium pools")
+    parser.add_argument('--node', action='append', metavar='NODE_URL', help="node to read from, repeat for several (default: {})".format(", ".join(DEFAULT_NODE_URLS)))
+    parser.add_argument('--pair', nargs=2, action='append', metavar=('TOKEN0', 'TOKEN1'), help="mint addresses or {} (default: {} {})".format("/".join(TOKEN_MINTS), *DEFAULT_PAIR))
+    parser.add_argument('--cache', default=DEFAULT_CACHE_PATH, help="pool cache, so later runs skip the on-chain pool lookups")
+    parser.add_argument('--no-cache', action='store_true')
+    parser.add_argument('--record', metavar='DIRECTORY', help="record binary snapshot columns here, read them back with recorder.ReserveReader")
+    parser.add_argument('--polls', type=int, help="exit after this many polls")
+    parser.add_argument('--interval', type=float, default=0.0, help="seconds between polls")
+    args = parser.parse_args(argv)
+
+    solana = connect(args.node or DEFAULT_NODE_URLS)
+    cache = None if args.no_cache else PoolCache(args.cache)
+    pairs = [(tokenMint(token0), tokenMint(token1)) for token0, token1 in args.pair or [DEFAULT_PAIR]]
+    print("Getting {} Raydium market data...".format(", ".join("{}-{}".format(token0, token1) for token0, token1 in args.pair or [DEFAULT_PAIR])))
+    pools = [RaydiumAmm(solana, token0, token1, cache=cache) for token0, token1 in pairs]
+    recorder = None
+    # Recording preallocates sparse column segments, so it only happens when asked for
+    if args.record is not None:
+        from recorder import ReserveRecorder
+        recorder = ReserveRecorder(args.record)
+
+    def printReserves(pool, reserves, fees, slot):
+        if recorder is not None:
+            recorder.record(pool.pool_info["id"], reserves, fees, slot)
+        if len(pools) > 1:
+            print("Slot {} - {} Reserves {}".format(slot, pool.pool_info["id"], reserves))
+        else:
+            print("Slot {} - Reserves {}".format(slot, reserves))
+
+    try:
+        watch(solana, pools, printReserves, args.polls, args.interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if recorder is not None:
+            recorder.close()
+    return 0
 
-# solana = WrappedSolana("http://localhost:8899")
-local = False
-node_url = "http://localhost:8899" if local else "https://solana-api.projectserum.com"
-solana = WrappedSolana(node_url)
-usdc = "EPjFWdd5AufqSSqeM2qN1xzybapC8G4wEGGkZwyTDt1v"
-sol = WRAPPED_SOL_MINT
-print("Getting USDC-SOL market data on Raydium...")
-raydium = RaydiumAmm(solana, usdc, sol)
-while True:
-    reserves, _, slot = raydium.getReserves()
-    print("Slot {} - Reserves {}".format(slot, reserves))
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,243 @@
+import argparse
+import base64
+import copy
+import json
+import os
+import random
+import struct
+import sys
+import time
+
+from decoder import (AMM_INFO_DECODER_V4,
+                     MARKET_STATE_DECODER_V2,
+                     OPEN_ORDERS_DECODER,
+                     decodeReserves)
+from encoding import decodeAccountData
+from fake import FakeRpcServer, FakeSolana
+from layout import (ACCOUNT_LAYOUT,
+                     AMM_INFO_LAYOUT_V4,
+                     LIQUIDITY_POOL_PROGRAM_ID_V4,
+                     MARKET_STATE_LAYOUT_V2,
+                     OPEN_ORDERS_LAYOUT)
+from pda import ProgramAddressCache
+from quote import amountsOut
+from raydium import RaydiumAmm, RaydiumApi
+from sol import Keypair, PublicKey, SERUM_PROGRAM_ID_V3, WrappedSolana
+from template import PLACEHOLDER_BLOCKHASH, SwapTemplate
+
+# Committed baseline from the synthetic fixtures, regenerate it with --save-baseline on the reference machine
+DEFAULT_BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_baseline.json')
+DEFAULT_TOLERANCE = 0.25
+
+def writeKey(data, compiled, name, key):
+    offset = compiled.offset(name)
+    data[offset:offset + 32] = key
+
+def syntheticPool(rng):
+    key = lambda: bytes(rng.getrandbits(8) for _ in range(32))
+    base, quote = key(), key()
+    amm_address, coin_vault, pc_vault, open_orders = key(), key(), key(), key()
+    # The market address needs a vault signer nonce that yields a valid program address
+    while True:
+        market_address = key()
+        for nonce in range(256):
+            try:
+                PublicKey.create_program_address([market_address, nonce.to_bytes(8, byteorder="little")],
+                                                 PublicKey(SERUM_PROGRAM_ID_V3))
+                break
+            except Exception:
+                continue
+        else:
+            continue
+        break
+
+    amm = bytearray(rng.getrandbits(8) for _ in range(AMM_INFO_LAYOUT_V4.sizeof()))
+    for name, value in [('swapFeeNumerator', 25),
+                        ('swapFeeDenominator', 10000),
+                        ('needTakePnlCoin', rng.randrange(10 ** 6)),
+                        ('needTakePnlPc', rng.randrange(10 ** 6))]:
+        struct.pack_into('<Q', amm, AMM_INFO_DECODER_V4.offset(name), value)
+    for name, value in [('poolCoinTokenAccount', coin_vault),
+                        ('poolPcTokenAccount', pc_vault),
+                        ('coinMintAddress', base),
+                        ('pcMintAddress', quote),
+                        ('ammOpenOrders', open_orders),
+                        ('serumMarket', market_address)]:
+        writeKey(amm, AMM_INFO_DECODER_V4, name, value)
+
+    market = bytearray(MARKET_STATE_LAYOUT_V2.sizeof())
+    for name in ['ownAddress', 'baseVault', 'quoteVault', 'requestQueue', 'eventQueue', 'bids', 'asks']:
+        writeKey(market, MARKET_STATE_DECODER_V2, name, key())
+    writeKey(market, MARKET_STATE_DECODER_V2, 'baseMint', base)
+    writeKey(market, MARKET_STATE_DECODER_V2, 'quoteMint', quote)
+    struct.pack_into('<Q', market, MARKET_STATE_DECODER_V2.offset('vaultSignerNonce'), nonce)
+    struct.pack_into('<Q', market, MARKET_STATE_DECODER_V2.offset('baseDepositsTotal'), 1)
+
+    def tokenAccount(amount):
+        data = bytearray(ACCOUNT_LAYOUT.sizeof())
+        struct.pack_into('<Q', data, 64, amount)
+        return bytes(data)
+
+    orders = bytearray(OPEN_ORDERS_LAYOUT.sizeof())
+    struct.pack_into('<Q', orders, OPEN_ORDERS_DECODER.offset('base_token_total'), rng.randrange(10 ** 9))
+    struct.pack_into('<Q', orders, OPEN_ORDERS_DECODER.offset('quote_token_total'), rng.randrange(10 ** 9))
+
+    name = lambda k: str(PublicKey(k))
+    return {"token0": name(base),
+            "token1": name(quote),
+            "accounts": {name(amm_address): base64.b64encode(bytes(amm)).decode(),
+                         name(market_address): base64.b64encode(bytes(market)).decode(),
+                         name(coin_vault): base64.b64encode(tokenAccount(rng.randrange(10 ** 12, 10 ** 15))).decode(),
+                         name(pc_vault): base64.b64encode(tokenAccount(rng.randrange(10 ** 12, 10 ** 15))).decode(),
+                         name(open_orders): base64.b64encode(bytes(orders)).decode()},
+            "owners": {name(amm_address): LIQUIDITY_POOL_PROGRAM_ID_V4,
+                       name(market_address): SERUM_PROGRAM_ID_V3}}
+
+def syntheticFixtures(pools = 4, seed = 0):
+    rng = random.Random(seed)
+    return {"slot": 1, "pools": [syntheticPool(rng) for _ in range(pools)]}
+
+def recordFixtures(node_url, pairs):
+    from sol import WrappedSolana
+    solana = WrappedSolana(node_url)
+    fixtures = {"slot": None, "pools": []}
+    for token0, token1 in pairs:
+        amm = RaydiumAmm(solana, token0, token1)
+        addresses = [amm.pool_info["id"],
+                     amm.market_address,
+                     amm.pool_coin_token_account,
+                     amm.pool_pc_token_account,
+                     amm.amm_open_orders_account]
+        account_datas, slot = solana.getMultipleAccountsData(addresses)
+        fixtures["slot"] = slot
+        fixtures["pools"].append({"token0": str(token0),
+                                  "token1": str(token1),
+                                  "accounts": {str(address): base64.b64encode(decodeAccountData(data)).decode()
+                                               for address, data in zip(addresses, account_datas)},
+                                  "owners": {str(amm.pool_info["id"]): LIQUIDITY_POOL_PROGRAM_ID_V4,
+                                             str(amm.market_address): SERUM_PROGRAM_ID_V3}})
+    return fixtures
+
+def fakeSolana(fixtures):
+    solana = FakeSolana(slot=fixtures["slot"] or 0)
+    # Its own cache, so clearing it for cold runs leaves the process wide cache alone
+    solana.useProgramAddressCache(ProgramAddressCache())
+    for pool in fixtures["pools"]:
+        for address, data in pool["accounts"].items():
+            solana.setAccount(address, base64.b64decode(data), pool["owners"].get(address))
+    return solana
+
+def measure(function, seconds = 1.0, batch = 1):
+    # Times batches of calls so sub-microsecond paths are not dominated by timer overhead
+    samples = []
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline or len(samples) < 5:
+        start = time.perf_counter_ns()
+        for _ in range(batch):
+            function()
+        samples.append((time.perf_counter_ns() - start) / batch)
+    samples.sort()
+    total = sum(samples)
+    return {"ops_per_sec": len(samples) * 1e9 / total if total else float('inf'),
+            "p50_us": samples[len(samples) // 2] / 1e3,
+            "p99_us": samples[min(len(samples) - 1, int(len(samples) * 0.99))] / 1e3}
+
+def benchmarks(solana, fixtures, node_url):
+    pool = fixtures["pools"][0]
+    amm = RaydiumAmm(solana, pool["token0"], pool["token1"])
+    accounts = [amm.pool_info["id"], amm.pool_coin_token_account, amm.pool_pc_token_account, amm.amm_open_orders_account]
+    raw = [base64.b64decode(data[0]) for data in solana.getMultipleAccountsData(accounts)[0]]
+    reserves, fees, slot = amm.getReserves()
+    amm_data, _ = solana.getAccountData(amm.pool_info["id"])
+    market_data, _ = solana.getAccountData(amm.market_address)
+    owner = Keypair.from_seed(bytes(32))
+    sizes = [10 ** 6 * (i + 1) for i in range(1000)]
+    template = SwapTemplate(amm, owner.public_key, owner.public_key, owner)
+    # The same pool read through HTTP JSON-RPC from node_url instead of from memory
+    rpc = WrappedSolana(node_url)
+    rpc_amm = copy.copy(amm)
+    rpc_amm.solana = rpc
+    request = rpc.multipleAccountsRequest([accounts])
+    return {
+        "decode.construct": (lambda: (AMM_INFO_LAYOUT_V4.parse(raw[0]),
+                                      ACCOUNT_LAYOUT.parse(raw[1]),
+                                      ACCOUNT_LAYOUT.parse(raw[2]),
+                                      OPEN_ORDERS_LAYOUT.parse(raw[3])), 1),
+        "decode.reserves": (lambda: decodeReserves(*raw), 100),
+        "raydium.getReserves": (amm.getReserves, 10),
+        "rpc.getReserves": (rpc_amm.getReserves, 1),
+        "rpc.getMultipleAccountsBytes": (lambda: rpc.getMultipleAccountsBytes(request), 1),
+        "quote.getAmountOut": (lambda: RaydiumApi.getAmountOut(amm, 10 ** 6, 'buy', amm.pool_info, reserves, fees, slot), 100),
+        "quote.amountsOut[1000]": (lambda: amountsOut(sizes, reserves[0], reserves[1], int(fees[1]), int(fees[0])), 10),
+        "pda.buildPoolInfo": (lambda: amm.buildPoolInfo(amm.pool_info["id"], amm_data, amm.market_address, market_data, amm.base, amm.quote), 1),
+        "pda.buildPoolInfo.cold": (lambda: (solana.program_addresses.clear(),
+                                            amm.buildPoolInfo(amm.pool_info["id"], amm_data, amm.market_address, market_data, amm.base, amm.quote)), 1),
+        "swap.build": (lambda: amm.swap(10 ** 6, 0, owner.public_key, owner.public_key, owner, send_transaction=False), 10),
+        "swap.template": (lambda: template.build(10 ** 6, 0, PLACEHOLDER_BLOCKHASH), 10),
+    }
+
+def run(fixtures, seconds, only = None):
+    solana = fakeSolana(fixtures)
+    results = {}
+    # rpc.* benchmarks go through a localhost node serving the fixtures, the rest read them from memory
+    with FakeRpcServer(solana) as node:
+        for name, (function, batch) in benchmarks(solana, fixtures, node.url).items():
+            if only and not any(name.startswith(prefix) for prefix in only):
+                continue
+            function()
+            results[name] = measure(function, seconds, batch)
+    return results
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        expected = baseline[name]["ops_per_sec"]
+        if result["ops_per_sec"] < expected * (1 - tolerance):
+            regressions.append((name, expected, result["ops_per_sec"]))
+    return regressions
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description="Benchmarks for the decode, quote, RPC read and transaction build hot paths")
+    parser.add_argument('--fixtures', help="account fixture file written by --record, synthetic accounts are used by default")
+    parser.add_argument('--record', metavar='NODE_URL', help="record fixture accounts for --pair from a node and exit")
+    parser.add_argument('--pair', nargs=2, action='append', metavar=('TOKEN0', 'TOKEN1'), default=[])
+    parser.add_argument('--out', default='fixtures.json')
+    parser.add_argument('--seconds', type=float, default=1.0, help="time spent on each benchmark")
+    parser.add_argument('--only', nargs='*', help="benchmark name prefixes to run")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--check', action='store_true', help="exit non-zero when a benchmark regresses past --tolerance")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args(argv)
+
+    if args.record:
+        with open(args.out, 'w') as f:
+            json.dump(recordFixtures(args.record, args.pair), f)
+        return 0
+    if args.fixtures:
+        with open(args.fixtures) as f:
+            fixtures = json.load(f)
+    else:
+        fixtures = syntheticFixtures()
+
+    results = run(fixtures, args.seconds, args.only)
+    print("{:<28} {:>14} {:>12} {:>12}".format("benchmark", "ops/sec", "p50 us", "p99 us"))
+    for name, result in results.items():
+        print("{:<28} {:>14.1f} {:>12.2f} {:>12.2f}".format(name, result["ops_per_sec"], result["p50_us"], result["p99_us"]))
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.check:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for name, expected, actual in regressions:
+            print("REGRESSION {}: {:.1f} ops/sec, baseline {:.1f}".format(name, actual, expected))
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
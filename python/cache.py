@@ -0,0 +1,89 @@
+import json
+import sqlite3
+import time
+
+from poolinfo import PoolInfo
+from sol import PublicKey
+
+DEFAULT_CACHE_PATH = 'pools.sqlite'
+DEFAULT_CACHE_TTL = 24 * 60 * 60
+# Bumped whenever pool_info gains fields or changes form, older entries are treated as misses
+CACHE_VERSION = 3
+
+def encodeValue(value):
+    if isinstance(value, PublicKey):
+        return {"publicKey": str(value)}
+    return value
+
+def decodeValue(value):
+    if isinstance(value, dict) and "publicKey" in value:
+        return PublicKey(value["publicKey"])
+    return value
+
+# Stores everything RaydiumAmm resolves at construction (pool and market addresses,
+# pool_info and the reserve accounts), all static per pool, keyed by mint pair
+class PoolCache:
+    def __init__(self,
+                 path = DEFAULT_CACHE_PATH,
+                 ttl = DEFAULT_CACHE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS pools ("
+                                "pair TEXT PRIMARY KEY, "
+                                "data TEXT NOT NULL, "
+                                "created REAL NOT NULL)")
+        self.connection.commit()
+
+    def pairKey(self, token0, token1, remove_deprecated):
+        token0, token1 = sorted([str(token0), str(token1)])
+        return "{}:{}:{}".format(token0, token1, int(bool(remove_deprecated)))
+
+    def get(self, token0, token1, remove_deprecated = False):
+        row = self.connection.execute("SELECT data, created FROM pools WHERE pair = ?",
+                                      (self.pairKey(token0, token1, remove_deprecated),)).fetchone()
+        if row is None:
+            return None
+        data, created = row
+        entry = json.loads(data)
+        if entry.pop("version", None) != CACHE_VERSION or (self.ttl is not None and time.time() - created > self.ttl):
+            self.invalidate(token0, token1, remove_deprecated)
+            return None
+        return {key: decodeValue(value) if key != "pool_info" else PoolInfo.fromJson(value)
+                for key, value in entry.items()}
+
+    def put(self, token0, token1, remove_deprecated, pool):
+        entry = {
+            "version": CACHE_VERSION,
+            "amm_address": encodeValue(pool.amm_address),
+            "market_address": encodeValue(pool.market_address),
+            "base": encodeValue(pool.base),
+            "quote": encodeValue(pool.quote),
+            "pool_coin_token_account": encodeValue(pool.pool_coin_token_account),
+            "pool_pc_token_account": encodeValue(pool.pool_pc_token_account),
+            "amm_open_orders_account": encodeValue(pool.amm_open_orders_account),
+            "pool_info": pool.pool_info.toJson()
+        }
+        self.connection.execute("INSERT OR REPLACE INTO pools (pair, data, created) VALUES (?, ?, ?)",
+                                (self.pairKey(token0, token1, remove_deprecated), json.dumps(entry), time.time()))
+        self.connection.commit()
+
+    def restore(self, pool, token0, token1, remove_deprecated = False):
+        entry = self.get(token0, token1, remove_deprecated)
+        if entry is None:
+            return False
+        for key, value in entry.items():
+            setattr(pool, key, value)
+        return True
+
+    def invalidate(self, token0, token1, remove_deprecated = False):
+        self.connection.execute("DELETE FROM pools WHERE pair = ?",
+                                (self.pairKey(token0, token1, remove_deprecated),))
+        self.connection.commit()
+
+    def clear(self):
+        self.connection.execute("DELETE FROM pools")
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,143 @@
+import struct
+
+from construct import Array, Bytes, BytesInteger, FormatField, Renamed
+
+from layout import (ACCOUNT_LAYOUT,
+                     AMM_INFO_LAYOUT_V4,
+                     GENERAL_SWAP_LAYOUT,
+                     MARKET_STATE_LAYOUT_V2,
+                     MERCURIAL_SWAP_LAYOUT,
+                     OPEN_ORDERS_LAYOUT,
+                     SABER_FEES_LAYOUT,
+                     SABER_SWAP_LAYOUT,
+                     STEP_SWAP_LAYOUT)
+
+# Compiles a fixed-size construct Struct into field offsets so single fields can be
+# read straight out of the account bytes without running a full construct parse.
+class CompiledLayout:
+    def __init__(self, layout):
+        self.layout = layout
+        self.size = layout.sizeof()
+        self.fields = {}
+        offset = 0
+        for subcon in layout.subcons:
+            size = subcon.sizeof()
+            if isinstance(subcon, Renamed) and subcon.name is not None:
+                self.fields[subcon.name] = (offset, size, self.compileField(subcon.subcon, offset, size))
+            offset += size
+
+    def compileField(self, subcon, offset, size):
+        if isinstance(subcon, FormatField):
+            unpack_from = struct.Struct(subcon.fmtstr).unpack_from
+            return lambda data: unpack_from(data, offset)[0]
+        if isinstance(subcon, Bytes):
+            return lambda data: bytes(data[offset:offset + size])
+        if isinstance(subcon, BytesInteger) and isinstance(subcon.length, int):
+            byteorder = 'little' if subcon.swapped else 'big'
+            signed = subcon.signed
+            return lambda data: int.from_bytes(data[offset:offset + size], byteorder, signed=signed)
+        if isinstance(subcon, Array) and isinstance(subcon.subcon, FormatField):
+            fmt = subcon.subcon.fmtstr
+            unpack_from = struct.Struct(fmt[0] + str(subcon.count) + fmt[1:]).unpack_from
+            return lambda data: list(unpack_from(data, offset))
+        # Anything without a fixed binary mapping (bit structs, nested arrays) falls back to construct
+        return lambda data: subcon.parse(bytes(data[offset:offset + size]))
+
+    def offset(self, name):
+        return self.fields[name][0]
+
+    def read(self, data, name):
+        return self.fields[name][2](data)
+
+    def parse(self, data):
+        return DecodedAccount(self, data)
+
+    def unpacker(self, *names):
+        fields = sorted((self.fields[name][0], name) for name in names)
+        fmt = '<'
+        position = 0
+        for offset, name in fields:
+            subcon = self.layout.subcons[self.index(name)].subcon
+            if not isinstance(subcon, FormatField) or subcon.fmtstr[0] != '<':
+                raise ValueError("Field {} is not a little endian primitive and cannot be unpacked".format(name))
+            if offset > position:
+                fmt += '{}x'.format(offset - position)
+            fmt += subcon.fmtstr[1:]
+            position = offset + subcon.length
+        unpack_from = struct.Struct(fmt).unpack_from
+        sorted_names = [name for _, name in fields]
+        if sorted_names == list(names):
+            return lambda data: unpack_from(data, 0)
+        order = [sorted_names.index(name) for name in names]
+        return lambda data: tuple(unpack_from(data, 0)[i] for i in order)
+
+    def index(self, name):
+        for i, subcon in enumerate(self.layout.subcons):
+            if subcon.name == name:
+                return i
+        raise KeyError(name)
+
+# Lazy view over account bytes. Fields are decoded on first access and cached, so
+# callers that only need a handful of values never pay for the rest of the account.
+class DecodedAccount:
+    __slots__ = ('compiled', 'data', 'values')
+
+    def __init__(self, compiled, data):
+        if len(data) < compiled.size:
+            raise ValueError("Account data is {} bytes, layout requires {}".format(len(data), compiled.size))
+        self.compiled = compiled
+        self.data = memoryview(data)
+        self.values = {}
+
+    def __getitem__(self, name):
+        try:
+            return self.values[name]
+        except KeyError:
+            value = self.compiled.read(self.data, name)
+            self.values[name] = value
+            return value
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __contains__(self, name):
+        return name in self.compiled.fields
+
+    def keys(self):
+        return self.compiled.fields.keys()
+
+    def get(self, name, default = None):
+        if name in self.compiled.fields:
+            return self[name]
+        return default
+
+AMM_INFO_DECODER_V4 = CompiledLayout(AMM_INFO_LAYOUT_V4)
+ACCOUNT_DECODER = CompiledLayout(ACCOUNT_LAYOUT)
+OPEN_ORDERS_DECODER = CompiledLayout(OPEN_ORDERS_LAYOUT)
+MARKET_STATE_DECODER_V2 = CompiledLayout(MARKET_STATE_LAYOUT_V2)
+GENERAL_SWAP_DECODER = CompiledLayout(GENERAL_SWAP_LAYOUT)
+STEP_SWAP_DECODER = CompiledLayout(STEP_SWAP_LAYOUT)
+SABER_SWAP_DECODER = CompiledLayout(SABER_SWAP_LAYOUT)
+SABER_FEES_DECODER = CompiledLayout(SABER_FEES_LAYOUT)
+MERCURIAL_SWAP_DECODER = CompiledLayout(MERCURIAL_SWAP_LAYOUT)
+
+# Single struct.unpack_from calls for the fields getReserves needs on every poll
+unpackAmmReserveFields = AMM_INFO_DECODER_V4.unpacker('needTakePnlCoin',
+                                                      'needTakePnlPc',
+                                                      'swapFeeNumerator',
+                                                      'swapFeeDenominator')
+unpackTokenAmount = ACCOUNT_DECODER.unpacker('amount')
+unpackOpenOrdersTotals = OPEN_ORDERS_DECODER.unpacker('base_token_total',
+                                                      'quote_token_total')
+
+def decodeReserves(amm_data, coin_data, pc_data, open_orders_data):
+    need_take_pnl_coin, need_take_pnl_pc, swap_fee_numerator, swap_fee_denominator = unpackAmmReserveFields(amm_data)
+    pool_coin, = unpackTokenAmount(coin_data)
+    pool_pc, = unpackTokenAmount(pc_data)
+    base_token_total, quote_token_total = unpackOpenOrdersTotals(open_orders_data)
+    total_coin = pool_coin + base_token_total - need_take_pnl_coin
+    total_pc = pool_pc + quote_token_total - need_take_pnl_pc
+    return (total_pc, total_coin, swap_fee_denominator, swap_fee_numerator)
@@ -0,0 +1,45 @@
+import base64
+import threading
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+BASE64_ENCODING = 'base64'
+ZSTD_ENCODING = 'base64+zstd'
+ACCOUNT_ENCODINGS = (BASE64_ENCODING, ZSTD_ENCODING)
+# base64+zstd is only requested when it can be decoded
+ZSTD_AVAILABLE = zstandard is not None
+
+# ZstdDecompressor instances must not be shared between threads
+local = threading.local()
+
+def decompressor():
+    instance = getattr(local, 'decompressor', None)
+    if instance is None:
+        instance = local.decompressor = zstandard.ZstdDecompressor()
+    return instance
+
+def verifyAccountEncoding(address, encoding):
+    if encoding not in ACCOUNT_ENCODINGS:
+        raise ValueError("Account data for {} is not base64 or base64+zstd encoded. It is {}".format(address, encoding))
+
+def decompress(compressed):
+    if zstandard is None:
+        raise ValueError("Account data is base64+zstd encoded but zstandard is not installed")
+    # Frames without a content size cannot go through the one-shot ZstdDecompressor.decompress.
+    # Decompressing into reused buffers through stream_reader was measured slower than this
+    # allocation for account sized outputs, so there is no buffer pool.
+    if zstandard.frame_content_size(compressed) > 0:
+        return decompressor().decompress(compressed)
+    return decompressor().decompressobj().decompress(compressed)
+
+def decodeAccountData(account_data):
+    # account_data is the (data, encoding) pair of an RPC account
+    data, encoding = account_data
+    if encoding == BASE64_ENCODING:
+        return base64.b64decode(data)
+    if encoding == ZSTD_ENCODING:
+        return decompress(base64.b64decode(data))
+    raise ValueError("Unsupported account encoding {}".format(encoding))
@@ -0,0 +1,171 @@
+import base64
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+
+from encoding import ZSTD_ENCODING, decodeAccountData, zstandard
+from sol import PublicKey, WrappedSolana, programAccounts
+
+# WrappedSolana served from in-memory account bytes instead of a node, so RaydiumApi
+# runs unchanged for benchmarks and replays
+class FakeSolana(WrappedSolana):
+    def __init__(self, accounts = None, owners = None, slot = 0):
+        self.node_url = 'fake://'
+        self.connection = None
+        self.accounts = {}
+        self.owners = {}
+        self.slot = slot
+        for address, data in (accounts or {}).items():
+            self.setAccount(address, data, (owners or {}).get(address))
+
+    def setAccount(self, address, data, owner = None):
+        address = str(address)
+        self.accounts[address] = (base64.b64encode(data).decode(), 'base64')
+        if owner is not None:
+            self.owners[address] = str(owner)
+
+    def setSlot(self, slot):
+        self.slot = slot
+
+    def accountInfo(self, address):
+        data = self.accounts.get(str(address))
+        if data is None:
+            return None
+        return {'data': data,
+                'executable': False,
+                'lamports': 0,
+                'owner': self.owners.get(str(address), '11111111111111111111111111111111'),
+                'rentEpoch': 0}
+
+    def sendTransaction(self,
+                        transaction,
+                        signers,
+                        tx_opts = None):
+        raise ValueError("FakeSolana cannot send transactions")
+
+    def getProgramAccounts(self,
+                           address,
+                           commitment = 'finalized',
+                           encoding = None,
+                           data_slice = None,
+                           data_size = None,
+                           memcmp_opts = None):
+        address = str(address)
+        accounts = []
+        for pubkey, (d, encoding) in self.accounts.items():
+            if self.owners.get(pubkey) != address:
+                continue
+            data = base64.b64decode(d)
+            if data_size is not None and len(data) != data_size:
+                continue
+            if memcmp_opts and any(data[opts.offset:opts.offset + 32] != bytes(PublicKey(opts.bytes))
+                                   for opts in memcmp_opts):
+                continue
+            if data_slice is not None:
+                data = data[data_slice.offset:data_slice.offset + data_slice.length]
+            account = self.accountInfo(pubkey)
+            account['data'] = (base64.b64encode(data).decode(), 'base64')
+            accounts.append({'pubkey': pubkey, 'account': account})
+        return accounts
+
+    def iterProgramAccounts(self,
+                            address,
+                            commitment = 'finalized',
+                            data_slice = None,
+                            data_size = None,
+                            memcmp_opts = None,
+                            select = None,
+                            decode = None,
+                            chunk_size = None):
+        accounts = self.getProgramAccounts(address, commitment, 'base64', data_slice, data_size, memcmp_opts)
+        return programAccounts(accounts, select, decode)
+
+    def getAccountInfo(self,
+                       account,
+                       encoding = None):
+        return (self.accountInfo(account), self.slot)
+
+    def getMultipleAccounts(self,
+                            accounts,
+                            commitment = None,
+                            encoding = None):
+        return ([self.accountInfo(account) for account in accounts], self.slot)
+
+    def getMultipleAccountsDataBatch(self, account_groups):
+        return [self.getMultipleAccountsData(accounts) for accounts in account_groups]
+
+    def getMultipleAccountsBytes(self, request):
+        return [([decodeAccountData(self.accounts[account]) if account in self.accounts else None for account in accounts], self.slot)
+                for accounts in request.account_groups]
+
+# Serves a FakeSolana's accounts as a JSON-RPC node on localhost, so the HTTP transport,
+# JSON decoding and account encodings run the way they do against a real node
+class FakeRpcServer:
+    def __init__(self,
+                 solana,
+                 host = '127.0.0.1',
+                 port = 0):
+        self.solana = solana
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive, as solana-py and RawTransport reuse their connections. Without
+            # TCP_NODELAY the body written after the headers waits on the client's delayed ACK.
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                if isinstance(payload, list):
+                    response = [server.respond(request) for request in payload]
+                else:
+                    response = server.respond(payload)
+                body = json.dumps(response).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.url = 'http://{}:{}'.format(*self.server.server_address[:2])
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def accountInfo(self, address, encoding):
+        account = self.solana.accountInfo(address)
+        if account is None or encoding != ZSTD_ENCODING:
+            return account
+        data = zstandard.ZstdCompressor().compress(decodeAccountData(account['data']))
+        return dict(account, data=(base64.b64encode(data).decode(), ZSTD_ENCODING))
+
+    def respond(self, request):
+        method, params = request['method'], request.get('params', [])
+        config = params[1] if len(params) > 1 else {}
+        encoding = config.get('encoding', 'base64')
+        if encoding == ZSTD_ENCODING and zstandard is None:
+            return {"jsonrpc": "2.0", "id": request['id'], "error": {"code": -32602, "message": "Invalid params: unknown variant `base64+zstd`"}}
+        context = {"slot": self.solana.slot}
+        if method == 'getMultipleAccounts':
+            result = {"context": context, "value": [self.accountInfo(address, encoding) for address in params[0]]}
+        elif method == 'getAccountInfo':
+            result = {"context": context, "value": self.accountInfo(params[0], encoding)}
+        elif method == 'getSlot':
+            result = self.solana.slot
+        else:
+            return {"jsonrpc": "2.0", "id": request['id'], "error": {"code": -32601, "message": "Method not found"}}
+        return {"jsonrpc": "2.0", "id": request['id'], "result": result}
@@ -0,0 +1,139 @@
+from decoder import AMM_INFO_DECODER_V4, MARKET_STATE_DECODER_V2
+from layout import (AMM_INFO_LAYOUT_V4,
+                     LIQUIDITY_POOL_PROGRAM_ID_V4,
+                     MARKET_STATE_LAYOUT_V2)
+from sol import DataSliceOpts, PublicKey, SERUM_PROGRAM_ID_V3
+
+# Contiguous windows covering only the fields the index needs, from the liquidity
+# counters through serumMarket for pools and from the mints through quoteDepositsTotal for markets
+AMM_INDEX_FIELDS = ['swapCoinInAmount',
+                    'swapPcOutAmount',
+                    'poolCoinTokenAccount',
+                    'poolPcTokenAccount',
+                    'coinMintAddress',
+                    'pcMintAddress',
+                    'lpMintAddress',
+                    'ammOpenOrders',
+                    'serumMarket']
+MARKET_INDEX_FIELDS = ['baseMint',
+                       'quoteMint',
+                       'baseVault',
+                       'baseDepositsTotal',
+                       'quoteVault',
+                       'quoteDepositsTotal']
+
+def sliceWindow(compiled, names):
+    start = min(compiled.offset(name) for name in names)
+    end = max(compiled.offset(name) + compiled.fields[name][1] for name in names)
+    return (start, end - start)
+
+AMM_INDEX_SLICE = sliceWindow(AMM_INFO_DECODER_V4, AMM_INDEX_FIELDS)
+MARKET_INDEX_SLICE = sliceWindow(MARKET_STATE_DECODER_V2, MARKET_INDEX_FIELDS)
+
+def readSlice(compiled, window, data, names):
+    view = memoryview(data)
+    start = window[0]
+    values = {}
+    for name in names:
+        offset, size, _ = compiled.fields[name]
+        offset -= start
+        raw = view[offset:offset + size]
+        if size == 32:
+            values[name] = str(PublicKey(bytes(raw)))
+        else:
+            values[name] = int.from_bytes(raw, 'little')
+    return values
+
+class RaydiumPoolIndex:
+    def __init__(self, solana, scan_markets = False):
+        # lookup takes the market from the pool account, so the Serum program scan only runs
+        # for callers of getMarketAddress
+        self.solana = solana
+        self.scan_markets = scan_markets
+        self.pools = {}
+        self.markets = {}
+        self.pool_pairs = {}
+        self.market_pairs = {}
+
+    def scanPools(self):
+        # Accounts are decoded as they stream in, the full response is never held in memory
+        window = lambda data: readSlice(AMM_INFO_DECODER_V4, AMM_INDEX_SLICE, data, AMM_INDEX_FIELDS)
+        return dict(self.solana.iterProgramAccounts(LIQUIDITY_POOL_PROGRAM_ID_V4,
+                                                    data_size=AMM_INFO_LAYOUT_V4.sizeof(),
+                                                    data_slice=DataSliceOpts(*AMM_INDEX_SLICE),
+                                                    decode=window))
+
+    def scanMarkets(self):
+        window = lambda data: readSlice(MARKET_STATE_DECODER_V2, MARKET_INDEX_SLICE, data, MARKET_INDEX_FIELDS)
+        return dict(self.solana.iterProgramAccounts(SERUM_PROGRAM_ID_V3,
+                                                    data_size=MARKET_STATE_LAYOUT_V2.sizeof(),
+                                                    data_slice=DataSliceOpts(*MARKET_INDEX_SLICE),
+                                                    decode=window))
+
+    def refresh(self):
+        pools = self.scanPools()
+        markets = self.scanMarkets() if self.scan_markets else {}
+        new_pools = [address for address in pools if address not in self.pools]
+        self.pools = pools
+        self.markets = markets
+        self.pool_pairs = {}
+        for address, pool in pools.items():
+            self.pool_pairs.setdefault((pool['coinMintAddress'], pool['pcMintAddress']), []).append(address)
+        self.market_pairs = {}
+        for address, market in markets.items():
+            self.market_pairs.setdefault((market['baseMint'], market['quoteMint']), []).append(address)
+        return new_pools
+
+    def poolLiquidity(self, address):
+        pool = self.pools[address]
+        return pool['swapCoinInAmount'] + pool['swapPcOutAmount']
+
+    def isDeprecated(self, address):
+        pool = self.pools[address]
+        return not (pool['swapCoinInAmount'] > 0 and pool['swapPcOutAmount'] > 0)
+
+    def getAmmAddress(self,
+                      token0,
+                      token1,
+                      remove_deprecated = False):
+        token0 = str(token0)
+        token1 = str(token1)
+        token0_base = True
+        addresses = self.pool_pairs.get((token0, token1), [])
+        if not addresses:
+            addresses = self.pool_pairs.get((token1, token0), [])
+            token0_base = False
+        if remove_deprecated:
+            addresses = [address for address in addresses if not self.isDeprecated(address)]
+        if not addresses:
+            raise ValueError("Pair of tokens {} and {} has no amm market".format(token0, token1))
+        return (max(addresses, key=self.poolLiquidity), token0_base)
+
+    def getMarketAddress(self,
+                         token0,
+                         token1,
+                         remove_deprecated = False):
+        if not self.scan_markets:
+            raise ValueError("Markets are not indexed, create the index with scan_markets=True")
+        token0 = str(token0)
+        token1 = str(token1)
+        token0_base = True
+        addresses = self.market_pairs.get((token0, token1), [])
+        if not addresses:
+            addresses = self.market_pairs.get((token1, token0), [])
+            token0_base = False
+        if remove_deprecated:
+            addresses = [address for address in addresses
+                         if self.markets[address]['baseDepositsTotal'] > 0 and self.markets[address]['quoteDepositsTotal'] > 0]
+        if not addresses:
+            raise ValueError("Pair of tokens {} and {} has no serum market".format(token0, token1))
+        total = lambda address: self.markets[address]['baseDepositsTotal'] + self.markets[address]['quoteDepositsTotal']
+        return (max(addresses, key=total), token0_base)
+
+    def lookup(self,
+               token0,
+               token1,
+               remove_deprecated = False):
+        amm_address, token0_base = self.getAmmAddress(token0, token1, remove_deprecated)
+        # A pool trades against the market recorded in its own account, no market lookup is needed
+        return (amm_address, self.pools[amm_address]['serumMarket'], token0_base)
@@ -0,0 +1,149 @@
+import codecs
+import json
+
+OBJECT_START = 0
+KEY = 1
+COLON = 2
+VALUE = 3
+AFTER_VALUE = 4
+ARRAY_START = 5
+ELEMENT = 6
+AFTER_ELEMENT = 7
+DONE = 8
+NEXT_STATE = {OBJECT_START: KEY,
+              KEY: COLON,
+              COLON: VALUE,
+              VALUE: AFTER_VALUE,
+              AFTER_VALUE: KEY,
+              ARRAY_START: ELEMENT,
+              ELEMENT: AFTER_ELEMENT,
+              AFTER_ELEMENT: ELEMENT}
+WHITESPACE = ' \t\n\r'
+# Returned by the token readers when the buffer ends before the token does
+INCOMPLETE = object()
+
+# Incremental parser for a JSON-RPC response object that yields the elements of one array
+# member as they arrive. Only the element being parsed is held in memory, the rest of the
+# response is decoded and dropped chunk by chunk. Feed it bytes with feed, which returns the
+# elements completed by that chunk, and call close once the response ends.
+class JsonArrayStream:
+    def __init__(self, key = 'result'):
+        self.key = key
+        self.decoder = json.JSONDecoder()
+        self.text = codecs.getincrementaldecoder('utf-8')()
+        self.buffer = ''
+        self.position = 0
+        self.state = OBJECT_START
+        self.name = None
+        self.final = False
+        self.found = False
+        # The error member of a failed request, set before feed raises
+        self.error = None
+
+    def feed(self, chunk):
+        # Parsed text is dropped here rather than per element, which would copy the buffer every time
+        self.buffer = self.buffer[self.position:] + self.text.decode(chunk)
+        self.position = 0
+        elements = []
+        while self.state != DONE and self.step(elements):
+            pass
+        return elements
+
+    def close(self):
+        self.final = True
+        elements = self.feed(b'')
+        if self.state != DONE:
+            raise ValueError("Response ended before the {} array was complete".format(self.key))
+        return elements
+
+    def skipWhitespace(self):
+        buffer = self.buffer
+        position = self.position
+        while position < len(buffer) and buffer[position] in WHITESPACE:
+            position += 1
+        self.position = position
+        return position < len(buffer)
+
+    def expect(self, characters):
+        if not self.skipWhitespace():
+            return INCOMPLETE
+        character = self.buffer[self.position]
+        if character not in characters:
+            raise ValueError("Unexpected {!r} at offset {} of the response, expected one of {!r}".format(character,
+                                                                                                    self.position,
+                                                                                                    characters))
+        self.position += 1
+        return character
+
+    def value(self):
+        if not self.skipWhitespace():
+            return INCOMPLETE
+        try:
+            value, end = self.decoder.raw_decode(self.buffer, self.position)
+        except json.JSONDecodeError:
+            if self.final:
+                raise
+            return INCOMPLETE
+        # A number cut at the end of a chunk still decodes, so a value is only complete once
+        # something follows it
+        if end == len(self.buffer) and not self.final:
+            return INCOMPLETE
+        self.position = end
+        return value
+
+    def step(self, elements):
+        state = self.state
+        if state == OBJECT_START:
+            token = self.expect('{')
+        elif state == KEY:
+            if not self.skipWhitespace():
+                return False
+            if self.buffer[self.position] == '}':
+                self.position += 1
+                if not self.found:
+                    raise ValueError("Response has no {} member".format(self.key))
+                self.state = DONE
+                return True
+            token = self.value()
+            self.name = token
+        elif state == COLON:
+            token = self.expect(':')
+        elif state == VALUE:
+            if self.name == self.key:
+                self.state = ARRAY_START
+                return True
+            token = self.value()
+            if token is not INCOMPLETE and self.name == 'error':
+                self.error = token
+                raise ValueError("RPC request failed: {}".format(token))
+        elif state == AFTER_VALUE:
+            token = self.expect(',}')
+            if token == '}':
+                if not self.found:
+                    raise ValueError("Response has no {} member".format(self.key))
+                self.state = DONE
+                return True
+        elif state == ARRAY_START:
+            token = self.expect('[')
+            if token is not INCOMPLETE:
+                self.found = True
+        elif state == ELEMENT:
+            if not self.skipWhitespace():
+                return False
+            if self.buffer[self.position] == ']':
+                # Only reached for an empty array, later elements end in AFTER_ELEMENT
+                self.position += 1
+                self.state = AFTER_VALUE
+                return True
+            token = self.value()
+            if token is not INCOMPLETE:
+                elements.append(token)
+        elif state == AFTER_ELEMENT:
+            token = self.expect(',]')
+            if token == ']':
+                self.state = AFTER_VALUE
+                return True
+        if token is INCOMPLETE:
+            return False
+        self.state = NEXT_STATE[state]
+        return True
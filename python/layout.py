@@ -3,6 +3,11 @@ from construct import Struct, BitsInteger, Const, BitsSwapped, BitStruct
 
 LIQUIDITY_POOL_PROGRAM_ID_V4 = '675kPX9MHTjS2zt1qfr1NYHuzeLXfQM9H24wFSUt1Mp8'
 SERUM_PROGRAM_ID_V3 = '9xQeWvG816bUx9EPjHmaT23yvVM2ZWbrrpZb9PusVFin'
+TOKEN_SWAP_PROGRAM_ID = 'SwapsVeCiPHMUAtzQWZw7RjsKjgCjhwU55QGu4U1Szw'
+ORCA_TOKEN_SWAP_PROGRAM_ID_V2 = '9W959DqEETiGZocYWCQPaJ6sBmUzgfxXfqGeTEdp3aQP'
+STEP_SWAP_PROGRAM_ID = 'SSwpMgqNDsyV7mAgN9ady4bDVu5ySjmmXejXvy2vLt1'
+SABER_SWAP_PROGRAM_ID = 'SSwpkEEcbUYpBkNsRUxWAkXWA8BFAP4HLd5UEbRUw8i'
+MERCURIAL_SWAP_PROGRAM_ID = 'MERLuDFBMmsHnsBPZw2sDQZHvXFMwp8EdjudcU2HKky'
 
 ACCOUNT_FLAGS_LAYOUT = BitsSwapped(  # Swap to little endian
     BitStruct(
@@ -49,6 +54,11 @@ GET_INSTRUCTION_LAYOUT = Struct(
 RAYDIUM_SWAP_INSTRUCTION_IDX = 9
 RAYDIUM_DEPOSIT_INSTRUCTION_IDX = 3
 RAYDIUM_WITHDRAW_INSTRUCTION_IDX = 4
+TOKEN_SWAP_INSTRUCTION_IDX = 1
+SABER_SWAP_INSTRUCTION_IDX = 1
+MERCURIAL_EXCHANGE_INSTRUCTION_IDX = 4
+
+MERCURIAL_FEE_DENOMINATOR = 10 ** 10
 
 SWAP_INSTRUCTION_FORMAT = "<BQQ"
 
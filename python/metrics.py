@@ -0,0 +1,259 @@
+from bisect import bisect_left
+import functools
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import os
+import threading
+import time
+
+# Seconds, from a base64 decode of one account up to a slow RPC round-trip
+DEFAULT_BUCKETS = (5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3,
+                   1e-2, 2.5e-2, 5e-2, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DEFAULT_PORT = 9108
+
+def contextSlot(result):
+    return result[1]
+
+def batchSlot(results):
+    return min(slot for _, slot in results) if results else None
+
+def accountSize(result):
+    # Size of the base64 account data in a response, the bulk of its bytes
+    account_info = result[0]
+    return len(account_info['data'][0]) if account_info else 0
+
+def accountsSize(result):
+    return sum(len(account_info['data'][0]) for account_info in result[0] if account_info)
+
+def programAccountsSize(accounts):
+    return sum(len(account['account']['data'][0]) for account in accounts)
+
+def batchSize(results):
+    return sum(len(data[0]) for account_datas, _ in results for data in account_datas if data)
+
+def bytesBatchSize(results):
+    # Decoded sizes, the raw transport does not keep the encoded strings
+    return sum(len(data) for account_bytes, _ in results for data in account_bytes if data)
+
+def escapeLabel(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def formatLabels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(key, escapeLabel(value)) for key, value in labels) + '}'
+
+# The default hooks. Instrumented code checks enabled or gets 0.0 back from start and stage,
+# so nothing is timed or recorded until real Metrics are attached.
+class NullMetrics:
+    enabled = False
+
+    def start(self):
+        return 0.0
+
+    def stage(self, name, start):
+        return 0.0
+
+    def request(self,
+                endpoint,
+                method,
+                seconds,
+                slot = None,
+                size = 0):
+        pass
+
+    def failure(self, endpoint, method):
+        pass
+
+NULL_METRICS = NullMetrics()
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+# Latency histograms per RPC method and pipeline stage, request, failure and byte counters,
+# and each endpoint's slot with its lag behind the highest slot any endpoint has reported.
+class Metrics(NullMetrics):
+    enabled = True
+
+    def __init__(self, buckets = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.slots = {}
+
+    def start(self):
+        return time.perf_counter()
+
+    def stage(self, name, start):
+        # Returns the end time so consecutive stages chain without another clock read
+        now = time.perf_counter()
+        self.observe('pipeline_stage_seconds', (('stage', name),), now - start)
+        return now
+
+    def request(self,
+                endpoint,
+                method,
+                seconds,
+                slot = None,
+                size = 0):
+        labels = (('endpoint', endpoint), ('method', method))
+        with self.lock:
+            self.observeLocked('solana_rpc_request_seconds', labels, seconds)
+            self.incrementLocked('solana_rpc_requests_total', labels, 1)
+            if size:
+                self.incrementLocked('solana_rpc_account_bytes_total', labels, size)
+            if slot is not None and slot > self.slots.get(endpoint, 0):
+                self.slots[endpoint] = slot
+
+    def failure(self, endpoint, method):
+        self.increment('solana_rpc_failures_total', (('endpoint', endpoint), ('method', method)))
+
+    def observe(self,
+                family,
+                labels,
+                value):
+        with self.lock:
+            self.observeLocked(family, labels, value)
+
+    def increment(self,
+                  family,
+                  labels,
+                  value = 1):
+        with self.lock:
+            self.incrementLocked(family, labels, value)
+
+    def observeLocked(self,
+                      family,
+                      labels,
+                      value):
+        histogram = self.histograms.get((family, labels))
+        if histogram is None:
+            histogram = self.histograms[(family, labels)] = Histogram(self.buckets)
+        histogram.observe(value)
+
+    def incrementLocked(self,
+                        family,
+                        labels,
+                        value):
+        key = (family, labels)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def exposition(self):
+        # Prometheus text format 0.0.4
+        lines = []
+        with self.lock:
+            families = {}
+            for (family, labels), histogram in sorted(self.histograms.items()):
+                families.setdefault(family, []).append((labels, histogram))
+            for family, series in families.items():
+                lines.append('# TYPE {} histogram'.format(family))
+                for labels, histogram in series:
+                    cumulative = 0
+                    for bound, count in zip(self.buckets + (float('inf'),), histogram.counts):
+                        cumulative += count
+                        le = '+Inf' if bound == float('inf') else repr(bound)
+                        lines.append('{}_bucket{} {}'.format(family, formatLabels(labels + (('le', le),)), cumulative))
+                    lines.append('{}_sum{} {!r}'.format(family, formatLabels(labels), histogram.sum))
+                    lines.append('{}_count{} {}'.format(family, formatLabels(labels), histogram.count))
+            families = {}
+            for (family, labels), value in sorted(self.counters.items()):
+                families.setdefault(family, []).append((labels, value))
+            for family, series in families.items():
+                lines.append('# TYPE {} counter'.format(family))
+                for labels, value in series:
+                    lines.append('{}{} {}'.format(family, formatLabels(labels), value))
+            if self.slots:
+                tip = max(self.slots.values())
+                lines.append('# TYPE solana_endpoint_slot gauge')
+                for endpoint, slot in sorted(self.slots.items()):
+                    lines.append('solana_endpoint_slot{} {}'.format(formatLabels((('endpoint', endpoint),)), slot))
+                lines.append('# TYPE solana_endpoint_slot_lag gauge')
+                for endpoint, slot in sorted(self.slots.items()):
+                    lines.append('solana_endpoint_slot_lag{} {}'.format(formatLabels((('endpoint', endpoint),)), tip - slot))
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        # For the node exporter textfile collector, which must never read a partial file
+        temporary = path + '.tmp'
+        with open(temporary, 'w') as f:
+            f.write(self.exposition())
+        os.replace(temporary, path)
+
+    def serve(self,
+              port = DEFAULT_PORT,
+              address = ''):
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = metrics.exposition().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((address, port), Handler)
+        threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+        return server
+
+def instrumented(method,
+                 slot_of = None,
+                 size_of = None):
+    # Times a WrappedSolana RPC method into self.metrics, a plain call when metrics are off
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(self, *args, **kwargs):
+            metrics = self.metrics
+            if not metrics.enabled:
+                return function(self, *args, **kwargs)
+            start = time.perf_counter()
+            try:
+                result = function(self, *args, **kwargs)
+            except Exception:
+                metrics.failure(self.node_url, method)
+                raise
+            metrics.request(self.node_url,
+                            method,
+                            time.perf_counter() - start,
+                            slot_of(result) if slot_of else None,
+                            size_of(result) if size_of else 0)
+            return result
+        return wrapper
+    return decorate
+
+def asyncInstrumented(method,
+                      slot_of = None,
+                      size_of = None):
+    def decorate(function):
+        @functools.wraps(function)
+        async def wrapper(self, *args, **kwargs):
+            metrics = self.metrics
+            if not metrics.enabled:
+                return await function(self, *args, **kwargs)
+            start = time.perf_counter()
+            try:
+                result = await function(self, *args, **kwargs)
+            except Exception:
+                metrics.failure(self.node_url, method)
+                raise
+            metrics.request(self.node_url,
+                            method,
+                            time.perf_counter() - start,
+                            slot_of(result) if slot_of else None,
+                            size_of(result) if size_of else 0)
+            return result
+        return wrapper
+    return decorate
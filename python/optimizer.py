@@ -0,0 +1,128 @@
+from collections import namedtuple
+import math
+
+from quote import CONSTANT_PRODUCT, amountOut
+
+# One directed swap through a pool, 'buy' spends the quote (pc) token for the base (coin) token
+Leg = namedtuple('Leg', ['pool',
+                         'side',
+                         'token_in',
+                         'token_out',
+                         'reserve_in',
+                         'reserve_out',
+                         'fee_numerator',
+                         'fee_denominator'])
+
+def poolLegs(pool, reserves, fees):
+    total_pc, total_coin = int(reserves[0]), int(reserves[1])
+    fee_denominator, fee_numerator = int(fees[0]), int(fees[1])
+    base, quote = str(pool.base), str(pool.quote)
+    return [Leg(pool, 'buy', quote, base, total_pc, total_coin, fee_numerator, fee_denominator),
+            Leg(pool, 'sell', base, quote, total_coin, total_pc, fee_numerator, fee_denominator)]
+
+def cycleAmountOut(amount_in, legs):
+    amount = amount_in
+    for leg in legs:
+        amount = amountOut(amount, leg.reserve_in, leg.reserve_out, leg.fee_numerator, leg.fee_denominator)
+    return amount
+
+def composeLegs(legs):
+    # A chain of constant-product swaps behaves like a single pool (virtual_in, virtual_out)
+    # charging the first leg's fee: out = virtual_out * g * x / (virtual_in + g * x)
+    first = legs[0]
+    gamma = (first.fee_denominator - first.fee_numerator) / first.fee_denominator
+    virtual_in = float(first.reserve_in)
+    virtual_out = float(first.reserve_out)
+    for leg in legs[1:]:
+        leg_gamma = (leg.fee_denominator - leg.fee_numerator) / leg.fee_denominator
+        denominator = leg.reserve_in + leg_gamma * virtual_out
+        virtual_in = virtual_in * leg.reserve_in / denominator
+        virtual_out = leg_gamma * virtual_out * leg.reserve_out / denominator
+    return (virtual_in, virtual_out, gamma)
+
+def optimalCycleInput(legs, search_radius = 8):
+    virtual_in, virtual_out, gamma = composeLegs(legs)
+    if gamma * virtual_out <= virtual_in:
+        return (0, 0)
+    # Maximizes virtual_out * g * x / (virtual_in + g * x) - x
+    estimate = (math.sqrt(virtual_in * virtual_out * gamma) - virtual_in) / gamma
+    # Every leg floors its output, so check the integers around the real optimum
+    best_amount, best_profit = 0, 0
+    center = int(estimate)
+    for amount in range(max(1, center - search_radius), center + search_radius + 1):
+        profit = cycleAmountOut(amount, legs) - amount
+        if profit > best_profit:
+            best_amount, best_profit = amount, profit
+    return (best_amount, best_profit)
+
+class PriceGraph:
+    def __init__(self, snapshot):
+        # snapshot maps pool -> (reserves, fees), as returned by ReserveSnapshotter.getReserves
+        self.legs = []
+        for pool, (reserves, fees) in snapshot.items():
+            # Legs model constant-product pools, stable swap pools are quoted through their adapter
+            if getattr(pool, 'curve', CONSTANT_PRODUCT) != CONSTANT_PRODUCT:
+                continue
+            for leg in poolLegs(pool, reserves, fees):
+                if leg.reserve_in > 0 and leg.reserve_out > 0:
+                    self.legs.append(leg)
+        self.tokens = sorted(set(leg.token_in for leg in self.legs) | set(leg.token_out for leg in self.legs))
+        self.weights = [self.legWeight(leg) for leg in self.legs]
+
+    def legWeight(self, leg):
+        gamma = (leg.fee_denominator - leg.fee_numerator) / leg.fee_denominator
+        return -math.log(gamma * leg.reserve_out / leg.reserve_in)
+
+    def findCycles(self):
+        # Bellman-Ford from a virtual source connected to every token with weight 0
+        distance = {token: 0.0 for token in self.tokens}
+        predecessor = {}
+        for _ in range(len(self.tokens)):
+            updated = False
+            for i, leg in enumerate(self.legs):
+                candidate = distance[leg.token_in] + self.weights[i]
+                if candidate < distance[leg.token_out] - 1e-12:
+                    distance[leg.token_out] = candidate
+                    predecessor[leg.token_out] = i
+                    updated = True
+            if not updated:
+                return []
+        cycles = {}
+        for i, leg in enumerate(self.legs):
+            if distance[leg.token_in] + self.weights[i] >= distance[leg.token_out] - 1e-12:
+                continue
+            # Walking back |V| steps from a relaxable token is guaranteed to land on the cycle
+            predecessor[leg.token_out] = i
+            token = leg.token_out
+            for _ in range(len(self.tokens)):
+                token = self.legs[predecessor[token]].token_in
+            cycle = []
+            current = token
+            while True:
+                index = predecessor[current]
+                cycle.append(index)
+                current = self.legs[index].token_in
+                if current == token or len(cycle) > len(self.tokens):
+                    break
+            if current != token:
+                continue
+            cycle.reverse()
+            cycles[frozenset(cycle)] = [self.legs[index] for index in cycle]
+        return list(cycles.values())
+
+    def findOpportunities(self):
+        opportunities = []
+        for legs in self.findCycles():
+            amount_in, profit = optimalCycleInput(legs)
+            if profit > 0:
+                opportunities.append((legs, amount_in, profit))
+        opportunities.sort(key=lambda opportunity: opportunity[2], reverse=True)
+        return opportunities
+
+def roundTripLegs(first_pool, first_side, second_pool, second_side, snapshot):
+    # The 2-leg case directly: swap through one pool and back through another
+    first = poolLegs(first_pool, *snapshot[first_pool])[0 if first_side == 'buy' else 1]
+    second = poolLegs(second_pool, *snapshot[second_pool])[0 if second_side == 'buy' else 1]
+    if first.token_out != second.token_in or second.token_out != first.token_in:
+        raise ValueError("Pools {} and {} do not form a round trip".format(first_pool, second_pool))
+    return [first, second]
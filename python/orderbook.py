@@ -0,0 +1,153 @@
+import math
+import struct
+
+import numpy as np
+
+from quote import amountOut
+
+# Slab accounts: 5 byte 'serum' prefix, 8 byte account flags, 32 byte slab header, then
+# fixed size nodes. Leaf keys are u128 with the price in lots in the upper 64 bits.
+SLAB_FLAGS_OFFSET = 5
+SLAB_BUMP_INDEX_OFFSET = 13
+SLAB_NODES_OFFSET = 45
+SLAB_NODE_SIZE = 72
+SLAB_LEAF_TAG = 2
+BIDS_FLAG = 1 << 5
+ASKS_FLAG = 1 << 6
+SLAB_NODE_DTYPE = np.dtype({'names': ['tag', 'price', 'owner', 'quantity'],
+                            'formats': ['<u4', '<u8', 'S32', '<u8'],
+                            'offsets': [0, 16, 24, 56],
+                            'itemsize': SLAB_NODE_SIZE})
+
+# Serum v3 base fee tier
+TAKER_FEE_NUMERATOR = 22
+TAKER_FEE_DENOMINATOR = 10000
+
+def decodeSlab(data,
+               is_bids,
+               exclude_owner = None):
+    # Leaves are read straight out of the node array, the tree links are never followed
+    flags, bump_index = struct.unpack_from('<QI', data, SLAB_FLAGS_OFFSET)
+    expected = BIDS_FLAG if is_bids else ASKS_FLAG
+    if not flags & expected:
+        raise ValueError("Account is not a {} slab, account flags are {:#x}".format('bids' if is_bids else 'asks', flags))
+    count = min(bump_index, (len(data) - SLAB_NODES_OFFSET) // SLAB_NODE_SIZE)
+    nodes = np.frombuffer(data, dtype=SLAB_NODE_DTYPE, count=count, offset=SLAB_NODES_OFFSET)
+    leaves = nodes[nodes['tag'] == SLAB_LEAF_TAG]
+    if exclude_owner is not None:
+        leaves = leaves[leaves['owner'] != bytes(exclude_owner)]
+    return (leaves['price'], leaves['quantity'])
+
+def aggregateLevels(prices,
+                    quantities,
+                    descending):
+    if len(prices) == 0:
+        return (np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.uint64))
+    order = np.argsort(prices, kind='stable')
+    prices = prices[order]
+    quantities = quantities[order]
+    starts = np.flatnonzero(np.concatenate(([True], prices[1:] != prices[:-1])))
+    level_prices = prices[starts]
+    level_quantities = np.add.reduceat(quantities, starts)
+    if descending:
+        return (level_prices[::-1], level_quantities[::-1])
+    return (level_prices, level_quantities)
+
+# One side of a Serum market as aggregated price levels in lots, best price first
+class OrderBook:
+    def __init__(self,
+                 prices,
+                 quantities,
+                 is_bids,
+                 base_lot_size,
+                 quote_lot_size):
+        if base_lot_size <= 0 or quote_lot_size <= 0:
+            raise ValueError("Market lot sizes must be positive, got base {} and quote {}".format(base_lot_size, quote_lot_size))
+        self.prices = prices
+        self.quantities = quantities
+        self.is_bids = is_bids
+        self.base_lot_size = base_lot_size
+        self.quote_lot_size = quote_lot_size
+
+    @classmethod
+    def decode(cls,
+               data,
+               is_bids,
+               base_lot_size,
+               quote_lot_size,
+               exclude_owner = None):
+        prices, quantities = decodeSlab(data, is_bids, exclude_owner)
+        prices, quantities = aggregateLevels(prices, quantities, is_bids)
+        return cls(prices, quantities, is_bids, base_lot_size, quote_lot_size)
+
+    def __len__(self):
+        return len(self.prices)
+
+    def bestPrice(self):
+        return self.nativePrices()[0] if len(self.prices) else None
+
+    def nativePrices(self):
+        # Quote native units per base native unit
+        return self.prices * (self.quote_lot_size / self.base_lot_size)
+
+    def nativeQuantities(self):
+        return self.quantities * self.base_lot_size
+
+    def depth(self):
+        return int(self.quantities.sum()) * self.base_lot_size
+
+# Quotes a taker order split between the Raydium curve and the opposite side of the book.
+# Input goes to whichever venue pays more for the next unit: the curve until its marginal
+# rate falls to the next level's rate after taker fees, then the level, and so on. Returns
+# the total output and how much of the input went to the curve.
+def combinedAmountOut(amount_in,
+                      side,
+                      reserves,
+                      fees,
+                      book,
+                      taker_fee_numerator = TAKER_FEE_NUMERATOR,
+                      taker_fee_denominator = TAKER_FEE_DENOMINATOR):
+    fee_denominator, fee_numerator = int(fees[0]), int(fees[1])
+    if side == 'buy':
+        reserve_in, reserve_out = int(reserves[0]), int(reserves[1])
+    else:
+        reserve_in, reserve_out = int(reserves[1]), int(reserves[0])
+    gamma = (fee_denominator - fee_numerator) / fee_denominator
+    invariant = float(reserve_in) * float(reserve_out)
+    base_lot_size, quote_lot_size = book.base_lot_size, book.quote_lot_size
+    remaining = int(amount_in)
+    amm_in = 0
+    book_out = 0
+    for price, quantity in zip(book.prices.tolist(), book.quantities.tolist()):
+        if remaining <= 0:
+            break
+        lot_price = price * quote_lot_size
+        if side == 'buy':
+            rate = base_lot_size * taker_fee_denominator / (lot_price * (taker_fee_denominator + taker_fee_numerator))
+        else:
+            rate = lot_price * (taker_fee_denominator - taker_fee_numerator) / (taker_fee_denominator * base_lot_size)
+        # The curve's marginal rate after x input is gamma * k / (reserve_in + gamma * x) ** 2
+        if reserve_in > 0 and rate > 0:
+            target = int((math.sqrt(gamma * invariant / rate) - reserve_in) / gamma)
+            if target > amm_in:
+                step = min(target - amm_in, remaining)
+                amm_in += step
+                remaining -= step
+        if remaining <= 0:
+            break
+        if side == 'buy':
+            lots = min(quantity, remaining * taker_fee_denominator // (lot_price * (taker_fee_denominator + taker_fee_numerator)))
+            spent = -(-lots * lot_price * (taker_fee_denominator + taker_fee_numerator) // taker_fee_denominator)
+            received = lots * base_lot_size
+        else:
+            lots = min(quantity, remaining // base_lot_size)
+            spent = lots * base_lot_size
+            received = lots * lot_price * (taker_fee_denominator - taker_fee_numerator) // taker_fee_denominator
+        remaining -= spent
+        book_out += received
+        # Whatever cannot fill a whole lot at this level goes to the curve
+        if lots < quantity:
+            break
+    amm_in += remaining
+    amm_out = amountOut(amm_in, reserve_in, reserve_out, fee_numerator, fee_denominator) if amm_in > 0 else 0
+    return (amm_out + book_out, amm_in)
@@ -0,0 +1,96 @@
+from collections import OrderedDict
+import sqlite3
+import threading
+
+from solana.publickey import PublicKey
+
+DEFAULT_PDA_CACHE_SIZE = 4096
+FIND_PROGRAM_ADDRESS = b'f'
+CREATE_PROGRAM_ADDRESS = b'c'
+
+def programAddressKey(kind,
+                      seeds,
+                      program_id):
+    # Seeds are hashed concatenated and the program id is always 32 bytes, so this key
+    # identifies exactly the derivations that give the same address
+    return kind + b''.join(bytes(seed) for seed in seeds) + bytes(program_id)
+
+def deriveProgramAddress(seeds, program_id):
+    # Module level so a process pool can run it
+    address, nonce = PublicKey.find_program_address(list(seeds), PublicKey(program_id))
+    return (bytes(address), nonce)
+
+# Bounded LRU of derived program addresses, optionally backed by a sqlite file so a restart
+# skips derivation too. Derivations are deterministic, so entries never expire.
+class ProgramAddressCache:
+    def __init__(self,
+                 max_size = DEFAULT_PDA_CACHE_SIZE,
+                 path = None):
+        self.max_size = max_size
+        self.path = path
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.connection = None
+        if path is not None:
+            self.connection = sqlite3.connect(path, check_same_thread=False)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS program_addresses ("
+                                    "key BLOB PRIMARY KEY, "
+                                    "address BLOB NOT NULL, "
+                                    "nonce INTEGER)")
+            self.connection.commit()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            if self.connection is not None:
+                row = self.connection.execute("SELECT address, nonce FROM program_addresses WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    entry = (bytes(row[0]), row[1])
+                    self.insert(key, entry)
+                    self.hits += 1
+                    return entry
+            self.misses += 1
+            return None
+
+    def insert(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def put(self,
+            key,
+            address,
+            nonce = None):
+        self.putMany([(key, address, nonce)])
+
+    def putMany(self, items):
+        with self.lock:
+            for key, address, nonce in items:
+                self.insert(key, (bytes(address), nonce))
+            if self.connection is not None:
+                self.connection.executemany("INSERT OR REPLACE INTO program_addresses (key, address, nonce) VALUES (?, ?, ?)",
+                                            [(key, bytes(address), nonce) for key, address, nonce in items])
+                self.connection.commit()
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+# Shared by every WrappedSolana that is not given its own cache
+DEFAULT_PROGRAM_ADDRESS_CACHE = ProgramAddressCache()
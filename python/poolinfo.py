@@ -0,0 +1,154 @@
+import base64
+
+from solana.publickey import PublicKey
+
+KEY_SIZE = 32
+# Address fields of a Raydium pool, stored in this order as 32 raw bytes each
+POOL_INFO_KEYS = ('id',
+                  'baseMint',
+                  'quoteMint',
+                  'lpMint',
+                  'programId',
+                  'authority',
+                  'openOrders',
+                  'targetOrders',
+                  'baseVault',
+                  'quoteVault',
+                  'withdrawQueue',
+                  'lpVault',
+                  'marketProgramId',
+                  'marketId',
+                  'marketAuthority',
+                  'marketBaseVault',
+                  'marketQuoteVault',
+                  'marketBids',
+                  'marketAsks',
+                  'marketEventQueue')
+POOL_INFO_INTEGERS = ('version',
+                      'marketVersion',
+                      'marketBaseLotSize',
+                      'marketQuoteLotSize')
+# Address fields the pool_info dict held as base58 strings, the rest were PublicKeys
+POOL_INFO_STRING_KEYS = frozenset(('baseMint',
+                                   'quoteMint',
+                                   'programId',
+                                   'marketProgramId',
+                                   'marketBaseVault',
+                                   'marketQuoteVault',
+                                   'marketBids',
+                                   'marketAsks',
+                                   'marketEventQueue'))
+KEY_INDICES = {name: index for index, name in enumerate(POOL_INFO_KEYS)}
+INTEGER_INDICES = {name: index for index, name in enumerate(POOL_INFO_INTEGERS)}
+
+def keyBytes(value):
+    # Raw 32 bytes of a PublicKey, base58 string or bytes address
+    if isinstance(value, (bytes, bytearray)):
+        if len(value) != KEY_SIZE:
+            raise ValueError("Address must be {} bytes, got {}".format(KEY_SIZE, len(value)))
+        return bytes(value)
+    return bytes(PublicKey(value))
+
+# Immutable pool_info of a Raydium pool. Every address is kept once, as raw bytes in one
+# buffer, and PublicKey and base58 views are only built for the fields that get used and then
+# cached. Indexing by the old dict keys returns the same types the pool_info dict held, base58
+# strings or PublicKeys for addresses and ints for the rest, so code written against the dict
+# keeps working. Pickles as the buffer and four ints.
+class PoolInfo:
+    __slots__ = ('key_bytes', 'integers', 'public_keys', 'addresses')
+
+    def __init__(self,
+                 key_bytes,
+                 integers):
+        if len(key_bytes) != KEY_SIZE * len(POOL_INFO_KEYS):
+            raise ValueError("PoolInfo needs {} bytes of addresses, got {}".format(KEY_SIZE * len(POOL_INFO_KEYS), len(key_bytes)))
+        if len(integers) != len(POOL_INFO_INTEGERS):
+            raise ValueError("PoolInfo needs {} integers, got {}".format(len(POOL_INFO_INTEGERS), len(integers)))
+        object.__setattr__(self, 'key_bytes', bytes(key_bytes))
+        object.__setattr__(self, 'integers', tuple(int(value) for value in integers))
+        object.__setattr__(self, 'public_keys', [None] * len(POOL_INFO_KEYS))
+        object.__setattr__(self, 'addresses', [None] * len(POOL_INFO_KEYS))
+
+    @classmethod
+    def fromDict(cls, values):
+        # From a pool_info dict as buildPoolInfo used to return, or anything else with the same keys
+        return cls(b''.join(keyBytes(values[name]) for name in POOL_INFO_KEYS),
+                   [values[name] for name in POOL_INFO_INTEGERS])
+
+    def __setattr__(self, name, value):
+        raise AttributeError("PoolInfo is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("PoolInfo is immutable")
+
+    def __reduce__(self):
+        # The cached views are rebuilt on demand, so they are left out
+        return (PoolInfo, (self.key_bytes, self.integers))
+
+    def __eq__(self, other):
+        if not isinstance(other, PoolInfo):
+            return NotImplemented
+        return self.key_bytes == other.key_bytes and self.integers == other.integers
+
+    def __hash__(self):
+        return hash((self.key_bytes, self.integers))
+
+    def __repr__(self):
+        return "PoolInfo(id={})".format(self.address('id'))
+
+    def raw(self, name):
+        index = KEY_INDICES[name] * KEY_SIZE
+        return self.key_bytes[index:index + KEY_SIZE]
+
+    def publicKey(self, name):
+        index = KEY_INDICES[name]
+        public_key = self.public_keys[index]
+        if public_key is None:
+            public_key = self.public_keys[index] = PublicKey(self.key_bytes[index * KEY_SIZE:(index + 1) * KEY_SIZE])
+        return public_key
+
+    def address(self, name):
+        # base58 string of an address field
+        index = KEY_INDICES[name]
+        address = self.addresses[index]
+        if address is None:
+            address = self.addresses[index] = str(self.publicKey(name))
+        return address
+
+    def __getitem__(self, name):
+        if name in POOL_INFO_STRING_KEYS:
+            return self.address(name)
+        if name in KEY_INDICES:
+            return self.publicKey(name)
+        if name in INTEGER_INDICES:
+            return self.integers[INTEGER_INDICES[name]]
+        raise KeyError(name)
+
+    def get(self, name, default = None):
+        if name in KEY_INDICES or name in INTEGER_INDICES:
+            return self[name]
+        return default
+
+    def __contains__(self, name):
+        return name in KEY_INDICES or name in INTEGER_INDICES
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(POOL_INFO_KEYS) + len(POOL_INFO_INTEGERS)
+
+    def keys(self):
+        return POOL_INFO_KEYS + POOL_INFO_INTEGERS
+
+    def items(self):
+        return [(name, self[name]) for name in self.keys()]
+
+    def toJson(self):
+        # JSON friendly form for PoolCache, fromJson reverses it
+        return {"keys": base64.b64encode(self.key_bytes).decode(),
+                "integers": list(self.integers)}
+
+    @classmethod
+    def fromJson(cls, value):
+        return cls(base64.b64decode(value["keys"]), value["integers"])
@@ -0,0 +1,175 @@
+import numpy as np
+
+# Bound on the relative error of the float64 evaluation below: five rounded inputs
+# plus five rounded operations, with headroom
+QUOTE_FLOAT_ERROR = 16 * np.finfo(np.float64).eps
+QUOTE_FLOAT_EXACT_LIMIT = 2.0 ** 52
+
+CONSTANT_PRODUCT = 'constant_product'
+STABLE_SWAP = 'stable_swap'
+
+def amountOut(amount_in,
+              reserve_in,
+              reserve_out,
+              fee_numerator,
+              fee_denominator):
+    amount_in_with_fee = amount_in * (fee_denominator - fee_numerator)
+    return (reserve_out * amount_in_with_fee) // (reserve_in * fee_denominator + amount_in_with_fee)
+
+def tokenSwapFee(amount,
+                 fee_numerator,
+                 fee_denominator):
+    # The token swap program charges at least one unit whenever a fee is configured
+    if amount == 0 or fee_numerator == 0 or fee_denominator == 0:
+        return 0
+    return max(1, amount * fee_numerator // fee_denominator)
+
+def tokenSwapAmountOut(amount_in,
+                       reserve_in,
+                       reserve_out,
+                       trade_fee_numerator,
+                       trade_fee_denominator,
+                       owner_fee_numerator,
+                       owner_fee_denominator):
+    amount = (amount_in
+              - tokenSwapFee(amount_in, trade_fee_numerator, trade_fee_denominator)
+              - tokenSwapFee(amount_in, owner_fee_numerator, owner_fee_denominator))
+    if amount <= 0:
+        return 0
+    return amountOut(amount, reserve_in, reserve_out, 0, 1)
+
+# StableSwap invariant with leverage amp * n, iterated in integers the way the
+# Saber and Mercurial programs do
+def stableSwapD(amp, balances):
+    total = sum(balances)
+    if total == 0:
+        return 0
+    n = len(balances)
+    leverage = amp * n
+    d = total
+    for _ in range(256):
+        d_product = d
+        for balance in balances:
+            d_product = d_product * d // (balance * n)
+        d_previous = d
+        d = (leverage * total + d_product * n) * d // ((leverage - 1) * d + (n + 1) * d_product)
+        if abs(d - d_previous) <= 1:
+            break
+    return d
+
+def stableSwapY(amp,
+                balances,
+                j,
+                d):
+    # Solves for balances[j], every other balance already includes the trade
+    n = len(balances)
+    leverage = amp * n
+    c = d
+    total = 0
+    for k, balance in enumerate(balances):
+        if k != j:
+            total += balance
+            c = c * d // (balance * n)
+    c = c * d // (leverage * n)
+    b = total + d // leverage
+    y = d
+    for _ in range(256):
+        y_previous = y
+        y = (y * y + c) // (2 * y + b - d)
+        if abs(y - y_previous) <= 1:
+            break
+    return y
+
+def stableAmountOut(amount_in,
+                    i,
+                    j,
+                    balances,
+                    amp,
+                    fee_numerator,
+                    fee_denominator,
+                    multipliers = None):
+    if multipliers is None:
+        multipliers = [1] * len(balances)
+    normalized = [balance * multiplier for balance, multiplier in zip(balances, multipliers)]
+    if amount_in <= 0 or min(normalized) == 0:
+        return 0
+    d = stableSwapD(amp, normalized)
+    balance_out = normalized[j]
+    normalized[i] += amount_in * multipliers[i]
+    dy = balance_out - stableSwapY(amp, normalized, j, d)
+    if dy <= 0:
+        return 0
+    return (dy - dy * fee_numerator // fee_denominator) // multipliers[j]
+
+def integerArray(values):
+    array = np.asarray(values)
+    if array.dtype.kind not in 'iuO':
+        # Built again from the original values, numpy infers float64 for ints past 64 bits
+        array = np.asarray(values, dtype=object)
+    return array
+
+def integerDifference(a, b):
+    # Unsigned or mixed signed and unsigned subtraction would wrap or go through float64
+    if a.dtype.kind != 'i' or b.dtype.kind != 'i':
+        a = a.astype(object)
+        b = b.astype(object)
+    return a - b
+
+# Vectorized amountOut with numpy broadcasting. Quotes are evaluated in float64 and
+# floored, and any lane whose fractional part lies within the error bound of an
+# integer is recomputed exactly with Python integers, so results always match amountOut.
+def amountsOut(amounts_in,
+               reserves_in,
+               reserves_out,
+               fee_numerators,
+               fee_denominators):
+    inputs = [integerArray(v) for v in (amounts_in,
+                                        reserves_in,
+                                        reserves_out,
+                                        fee_numerators,
+                                        fee_denominators)]
+    # The fee difference is taken in integers before broadcasting. In float64 two large
+    # fees would each be rounded and their difference could lose every significant bit.
+    fee_difference = integerDifference(inputs[4], inputs[3]).astype(np.float64)
+    values = np.broadcast_arrays(*inputs)
+    amount_in, reserve_in, reserve_out, _, fee_denominator = [v.astype(np.float64) for v in values]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        amount_in_with_fee = amount_in * fee_difference
+        quote = reserve_out * amount_in_with_fee / (reserve_in * fee_denominator + amount_in_with_fee)
+        floored = np.floor(quote)
+        fraction = quote - floored
+        error = quote * QUOTE_FLOAT_ERROR + QUOTE_FLOAT_ERROR
+        ambiguous = ~((fraction > error) & (fraction < 1 - error) & (quote < QUOTE_FLOAT_EXACT_LIMIT))
+    result = np.where(ambiguous, 0, floored).astype(np.uint64)
+    if ambiguous.any():
+        lanes = np.nonzero(ambiguous)
+        result[lanes] = [amountOut(*args) for args in zip(*[v[lanes].tolist() for v in values])]
+    return result
+
+def quoteGrid(amounts_in,
+              reserves_in,
+              reserves_out,
+              fee_numerators,
+              fee_denominators):
+    # One row per pool, one column per input size
+    pool_shape = (-1, 1)
+    return amountsOut(integerArray(amounts_in).reshape(1, -1),
+                      integerArray(reserves_in).reshape(pool_shape),
+                      integerArray(reserves_out).reshape(pool_shape),
+                      integerArray(fee_numerators).reshape(pool_shape),
+                      integerArray(fee_denominators).reshape(pool_shape))
+
+def quoteReserves(amounts_in,
+                  side,
+                  reserves,
+                  fees):
+    # reserves and fees as returned by RaydiumApi.getReserves, one entry per pool
+    if side == 'buy':
+        reserves_in = [int(r[0]) for r in reserves]
+        reserves_out = [int(r[1]) for r in reserves]
+    else:
+        reserves_in = [int(r[1]) for r in reserves]
+        reserves_out = [int(r[0]) for r in reserves]
+    fee_denominators = [int(f[0]) for f in fees]
+    fee_numerators = [int(f[1]) for f in fees]
+    return quoteGrid(amounts_in, reserves_in, reserves_out, fee_numerators, fee_denominators)
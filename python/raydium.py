@@ -1,10 +1,12 @@
+import asyncio
 import base58
-import base64
 from decimal import Decimal
-import requests
 import struct
 import time
 
+from decoder import (AMM_INFO_DECODER_V4,
+                     decodeReserves)
+from encoding import decodeAccountData, verifyAccountEncoding
 from layout import (ACCOUNT_LAYOUT,
                      AMM_INFO_LAYOUT_V4,
                      GET_INSTRUCTION_LAYOUT,
@@ -14,19 +16,29 @@ from layout import (ACCOUNT_LAYOUT,
                      RAYDIUM_SWAP_INSTRUCTION_IDX,
                      SWAP_INSTRUCTION_FORMAT,
                      TRANSFER_LAYOUT)
-from sol import (AccountMeta,
-                    ConstError,
-                    Keypair,
+from orderbook import OrderBook, combinedAmountOut
+from poolinfo import PoolInfo
+from quote import amountOut
+from sol import (ConstError,
                     MemcmpOpts,
                     PublicKey,
                     SERUM_PROGRAM_ID_V3,
                     TOKEN_PROGRAM_ID,
-                    Transaction,
-                    TransactionInstruction,
                     TxOpts,
                     WRAPPED_SOL_MINT,
+                    AsyncWrappedSolana,
                     WrappedSolana)
 
+# Seeds of the market associated accounts buildPoolInfo derives
+MARKET_ASSOCIATED_SEEDS = ['amm_associated_seed',
+                           'coin_vault_associated_seed',
+                           'pc_vault_associated_seed',
+                           'lp_mint_associated_seed',
+                           'temp_lp_token_associated_seed',
+                           'target_associated_seed',
+                           'withdraw_associated_seed',
+                           'open_order_associated_seed']
+
 class RaydiumApi:
     def __init__(self, solana):
         self.solana = solana
@@ -44,15 +56,7 @@ class RaydiumApi:
             token0_base = False
         if len(amm_accounts) == 0:
             raise ValueError("Pair of tokens {} and {} has no amm market".format(token0, token1))
-        elif len(amm_accounts) > 1:
-            max_value = 0
-            for address, value in amm_accounts.items():
-                if value > max_value:
-                    amm_address = address
-                    max_value = value
-        else:
-            amm_address = list(amm_accounts.keys())[0]
-        return (amm_address, token0_base)
+        return (self.selectAddress(amm_accounts), token0_base)
         
     def getMarketAddress(self,
                          token0,
@@ -67,15 +71,18 @@ class RaydiumApi:
             token0_base = False
         if len(market_accounts) == 0:
             raise ValueError("Pair of tokens {} and {} has no serum market".format(token0, token1))
-        elif len(market_accounts) > 1:
+        return (self.selectAddress(market_accounts), token0_base)
+    
+    def selectAddress(self, accounts):
+        if len(accounts) > 1:
             max_value = 0
-            for address, value in market_accounts.items():
+            for address, value in accounts.items():
                 if value > max_value:
-                    market_address = address
+                    selected_address = address
                     max_value = value
         else:
-            market_address = list(market_accounts.keys())[0]
-        return (market_address, token0_base)
+            selected_address = list(accounts.keys())[0]
+        return selected_address
         
     def getAmmProgramAccounts(self,
                               base,
@@ -86,13 +93,15 @@ class RaydiumApi:
             MemcmpOpts(offset=432, bytes=quote)
         ]
         accounts = self.solana.getProgramAccounts(LIQUIDITY_POOL_PROGRAM_ID_V4, 
-                                                  memcmp_opts=memcmp_opts, 
-                                                  encoding='base64')
+                                                  memcmp_opts=memcmp_opts)
+        return self.parseAmmProgramAccounts(accounts, remove_deprecated)
+    
+    def parseAmmProgramAccounts(self, accounts, remove_deprecated):
         amm_accounts = {}
         if accounts:
             for acc in accounts:
                 try:
-                    parsed_acc = AMM_INFO_LAYOUT_V4.parse(base64.b64decode(acc['account']['data'][0]))
+                    parsed_acc = AMM_INFO_DECODER_V4.parse(decodeAccountData(acc['account']['data']))
                 except ConstError:
                     continue
                 if remove_deprecated:
@@ -111,12 +120,14 @@ class RaydiumApi:
             MemcmpOpts(85, quote)
         ]
         accounts = self.solana.getProgramAccounts(SERUM_PROGRAM_ID_V3, 
-                                                  memcmp_opts=memcmp_opts, 
-                                                  encoding='base64')
+                                                  memcmp_opts=memcmp_opts)
+        return self.parseMarketProgramAccounts(accounts, remove_deprecated)
+    
+    def parseMarketProgramAccounts(self, accounts, remove_deprecated):
         market_accounts = {}
         for acc in accounts:
             try:
-                parsed_acc = MARKET_STATE_LAYOUT_V2.parse(base64.b64decode(acc['account']['data'][0]))
+                parsed_acc = MARKET_STATE_LAYOUT_V2.parse(decodeAccountData(acc['account']['data']))
             except ConstError:
                 continue
             if remove_deprecated:
@@ -131,26 +142,27 @@ class RaydiumApi:
                     market_address,
                     base,
                     quote):
-        base = str(base)
-        quote = str(quote)
+        amm_data, _ = self.solana.getAccountData(amm_address)
+        market_data, _ = self.solana.getAccountData(market_address)
+        return self.buildPoolInfo(amm_address, amm_data, market_address, market_data, base, quote)
+    
+    def buildPoolInfo(self,
+                      amm_address,
+                      amm_data,
+                      market_address,
+                      market_data,
+                      base,
+                      quote):
+        start = self.solana.metrics.start()
         info_id = self.solana.publicKey(LIQUIDITY_POOL_PROGRAM_ID_V4)
-        (d, encoding), _ = self.solana.getAccountData(amm_address)
-        self.verifyEncoding(amm_address, encoding)
-        parsed_amm = AMM_INFO_LAYOUT_V4.parse(base64.b64decode(d))
+        self.verifyEncoding(amm_address, amm_data[1])
+        parsed_amm = AMM_INFO_DECODER_V4.parse(decodeAccountData(amm_data))
 
         amm_authority = self.solana.findProgramAddress([bytes('amm authority', 'utf8')], info_id)
-        pool_coin_token_account = self.solana.publicKey(parsed_amm['poolCoinTokenAccount'])
-        pool_pc_token_account = self.solana.publicKey(parsed_amm['poolPcTokenAccount'])
-        lp_mint_address = self.solana.publicKey(parsed_amm['lpMintAddress'])
-        pool_temp_lp_token_account = self.solana.publicKey(parsed_amm['poolTempLpTokenAccount'])
-        amm_target_orders = self.solana.publicKey(parsed_amm['ammTargetOrders'])
-        pool_withdraw_queue = self.solana.publicKey(parsed_amm['poolWithdrawQueue'])
-        amm_open_orders = self.solana.publicKey(parsed_amm['ammOpenOrders'])
-        
+
         market_info_id = self.solana.publicKey(SERUM_PROGRAM_ID_V3)
-        (d, encoding), _ = self.solana.getAccountData(market_address)
-        self.verifyEncoding(market_address, encoding)
-        parsed_market = MARKET_STATE_LAYOUT_V2.parse(base64.b64decode(d))
+        self.verifyEncoding(market_address, market_data[1])
+        parsed_market = MARKET_STATE_LAYOUT_V2.parse(decodeAccountData(market_data))
         
         market_amm_id = self.solana.getProgramAddress(market_info_id,
                                                         market_address,
@@ -182,42 +194,62 @@ class RaydiumApi:
             market_info_id,
         )
 
-        pool_info = {}
-        pool_info["id"] = amm_address
-        pool_info["baseMint"] = base
-        pool_info["quoteMint"] = quote
-        pool_info["lpMint"] = lp_mint_address
-        pool_info["version"] = 4
-        pool_info["programId"] = LIQUIDITY_POOL_PROGRAM_ID_V4
-        pool_info["authority"] = amm_authority
-        pool_info["openOrders"] = amm_open_orders
-        pool_info["targetOrders"] = amm_target_orders
-        pool_info["baseVault"] = pool_coin_token_account
-        pool_info["quoteVault"] = pool_pc_token_account
-        pool_info["withdrawQueue"] = pool_withdraw_queue
-        pool_info["lpVault"] = pool_temp_lp_token_account
-        pool_info["marketVersion"] = 3
-        pool_info["marketProgramId"] = SERUM_PROGRAM_ID_V3
-        pool_info["marketId"] = market_address
-        pool_info["marketAuthority"] = market_vault_signer
-        pool_info["marketBaseVault"] = str(PublicKey(parsed_market['baseVault']))
-        pool_info["marketQuoteVault"] = str(PublicKey(parsed_market['quoteVault']))
-        pool_info["marketBids"] = str(PublicKey(parsed_market['bids']))
-        pool_info["marketAsks"] = str(PublicKey(parsed_market['asks']))
-        pool_info["marketEventQueue"] = str(PublicKey(parsed_market['eventQueue']))
+        # Decoded addresses are already raw bytes and go into PoolInfo as they are
+        pool_info = PoolInfo.fromDict({"id": amm_address,
+                                       "baseMint": base,
+                                       "quoteMint": quote,
+                                       "lpMint": parsed_amm['lpMintAddress'],
+                                       "version": 4,
+                                       "programId": LIQUIDITY_POOL_PROGRAM_ID_V4,
+                                       "authority": amm_authority,
+                                       "openOrders": parsed_amm['ammOpenOrders'],
+                                       "targetOrders": parsed_amm['ammTargetOrders'],
+                                       "baseVault": parsed_amm['poolCoinTokenAccount'],
+                                       "quoteVault": parsed_amm['poolPcTokenAccount'],
+                                       "withdrawQueue": parsed_amm['poolWithdrawQueue'],
+                                       "lpVault": parsed_amm['poolTempLpTokenAccount'],
+                                       "marketVersion": 3,
+                                       "marketProgramId": SERUM_PROGRAM_ID_V3,
+                                       "marketId": market_address,
+                                       "marketAuthority": market_vault_signer,
+                                       "marketBaseVault": parsed_market['baseVault'],
+                                       "marketQuoteVault": parsed_market['quoteVault'],
+                                       "marketBids": parsed_market['bids'],
+                                       "marketAsks": parsed_market['asks'],
+                                       "marketEventQueue": parsed_market['eventQueue'],
+                                       "marketBaseLotSize": parsed_market['baseLotSize'],
+                                       "marketQuoteLotSize": parsed_market['quoteLotSize']})
+        self.solana.metrics.stage('raydium.poolInfo', start)
         return pool_info
     
+    def derivePoolAddresses(self,
+                            market_addresses,
+                            executor = None):
+        # Derives the program addresses of many markets in one pass so that buildPoolInfo finds
+        # them all cached, for setting up hundreds of pools at startup
+        market_info_id = self.solana.publicKey(SERUM_PROGRAM_ID_V3)
+        derivations = [([bytes('amm authority', 'utf8')], LIQUIDITY_POOL_PROGRAM_ID_V4)]
+        for market_address in market_addresses:
+            market = bytes(self.solana.publicKey(market_address))
+            derivations.extend(([bytes(market_info_id), market, bytes(seed, 'utf8')], market_info_id)
+                               for seed in MARKET_ASSOCIATED_SEEDS)
+        return self.solana.findProgramAddresses(derivations, executor)
+
     def verifyEncoding(self, address, encoding):
-        if encoding != 'base64':
-            raise ValueError("Account data for {} is not base64 encoded. It is {}".format(address, encoding))
+        verifyAccountEncoding(address, encoding)
             
     def getSwapAccounts(self, pool_id):
-        (d, encoding), pool_slot = self.solana.getAccountData(pool_id)
-        self.verifyEncoding(pool_id, encoding)
-        swap_data = AMM_INFO_LAYOUT_V4.parse(base64.b64decode(d))
+        pool_data, _ = self.solana.getAccountData(pool_id)
+        return self.parseSwapAccounts(pool_id, pool_data)
+    
+    def parseSwapAccounts(self, pool_id, pool_data):
+        start = self.solana.metrics.start()
+        self.verifyEncoding(pool_id, pool_data[1])
+        swap_data = AMM_INFO_DECODER_V4.parse(decodeAccountData(pool_data))
         pool_coin_token_account = self.solana.publicKey(swap_data['poolCoinTokenAccount'])
         pool_pc_token_account = self.solana.publicKey(swap_data['poolPcTokenAccount'])
         amm_open_orders_account = self.solana.publicKey(swap_data['ammOpenOrders'])
+        self.solana.metrics.stage('raydium.swapAccounts', start)
         return (pool_coin_token_account, pool_pc_token_account, amm_open_orders_account)
             
     def getReserves(self,
@@ -229,18 +261,41 @@ class RaydiumApi:
                                                                    pool_coin_token_account,
                                                                    pool_pc_token_account,
                                                                    amm_open_orders_account])
+        return self.parseReserves(pool_id,
+                                  pool_coin_token_account,
+                                  pool_pc_token_account,
+                                  amm_open_orders_account,
+                                  account_datas,
+                                  slot)
+    
+    def parseReserves(self,
+                      pool_id,
+                      pool_coin_token_account,
+                      pool_pc_token_account,
+                      amm_open_orders_account,
+                      account_datas,
+                      slot):
         self.verifyEncoding(pool_id, account_datas[0][1])
-        swap_data = AMM_INFO_LAYOUT_V4.parse(base64.b64decode(account_datas[0][0]))
         self.verifyEncoding(pool_coin_token_account, account_datas[1][1])
-        pool_coin = ACCOUNT_LAYOUT.parse(base64.b64decode(account_datas[1][0]))['amount']
         self.verifyEncoding(pool_pc_token_account, account_datas[2][1])
-        pool_pc = ACCOUNT_LAYOUT.parse(base64.b64decode(account_datas[2][0]))['amount']
         self.verifyEncoding(amm_open_orders_account, account_datas[3][1])
-        parsed_orders = OPEN_ORDERS_LAYOUT.parse(base64.b64decode(account_datas[3][0]))
-                
-        total_coin = pool_coin + parsed_orders['base_token_total'] - swap_data['needTakePnlCoin']
-        total_pc = pool_pc + parsed_orders['quote_token_total'] - swap_data['needTakePnlPc']
-        fees = (Decimal(swap_data['swapFeeDenominator']), Decimal(swap_data['swapFeeNumerator']))
+        metrics = self.solana.metrics
+        start = metrics.start()
+        account_bytes = [decodeAccountData(account_data) for account_data in account_datas[:4]]
+        metrics.stage('raydium.base64', start)
+        return self.parseReserveBytes(account_bytes, slot)
+
+    def parseReserveBytes(self, account_bytes, slot):
+        # account_bytes are the raw AMM, coin vault, pc vault and open orders accounts, as
+        # getMultipleAccountsBytes returns them
+        metrics = self.solana.metrics
+        start = metrics.start()
+        (total_pc,
+         total_coin,
+         swap_fee_denominator,
+         swap_fee_numerator) = decodeReserves(*account_bytes)
+        fees = (Decimal(swap_fee_denominator), Decimal(swap_fee_numerator))
+        metrics.stage('raydium.decode', start)
         return ([total_pc, total_coin], fees, slot)
     
     def getAmountOut(self,
@@ -251,19 +306,59 @@ class RaydiumApi:
                      fees = None,
                      slot = None):
         if not reserves or not fees or not slot:
-            reserves, fees, slot = self.getReserves(pool_info)
+            reserves, fees, slot = RaydiumApi.getReserves(self,
+                                                          pool_info["id"],
+                                                          pool_info["baseVault"],
+                                                          pool_info["quoteVault"],
+                                                          pool_info["openOrders"])
+        start = self.solana.metrics.start()
         swapFeeDenominator, swapFeeNumerator = fees
-        amount_in_with_fee = amount_in * ((swapFeeDenominator - swapFeeNumerator) / swapFeeDenominator)
         if side == 'buy':
             in_token_pool_amount = reserves[0]
             out_token_pool_amount = reserves[1]
         else:
             in_token_pool_amount = reserves[1]
             out_token_pool_amount = reserves[0]
-        denominator = in_token_pool_amount + amount_in_with_fee
-        amount_out = out_token_pool_amount * (amount_in_with_fee / denominator)
-        return (int(amount_out), slot)
+        # Integer arithmetic so the result is the exact floor, matching quote.amountsOut
+        amount_out = amountOut(int(amount_in),
+                               int(in_token_pool_amount),
+                               int(out_token_pool_amount),
+                               int(swapFeeNumerator),
+                               int(swapFeeDenominator))
+        self.solana.metrics.stage('raydium.quote', start)
+        return (amount_out, slot)
     
+    def parseBook(self,
+                  pool_info,
+                  bids_data,
+                  asks_data):
+        self.verifyEncoding(pool_info["marketBids"], bids_data[1])
+        self.verifyEncoding(pool_info["marketAsks"], asks_data[1])
+        start = self.solana.metrics.start()
+        # The pool's own orders are already counted in its reserves through the open orders totals
+        exclude_owner = pool_info.raw("openOrders")
+        bids = OrderBook.decode(decodeAccountData(bids_data),
+                                True,
+                                pool_info["marketBaseLotSize"],
+                                pool_info["marketQuoteLotSize"],
+                                exclude_owner)
+        asks = OrderBook.decode(decodeAccountData(asks_data),
+                                False,
+                                pool_info["marketBaseLotSize"],
+                                pool_info["marketQuoteLotSize"],
+                                exclude_owner)
+        self.solana.metrics.stage('raydium.book', start)
+        return (bids, asks)
+
+    def getAmountOutWithBook(self,
+                             amount_in,
+                             side,
+                             reserves,
+                             fees,
+                             books):
+        bids, asks = books
+        return combinedAmountOut(amount_in, side, reserves, fees, asks if side == 'buy' else bids)
+
     def swap(self,
              amount_in,
              min_amount_out,
@@ -274,23 +369,28 @@ class RaydiumApi:
              transaction = None,
              tx_opts = None,
              send_transaction = True):
+        # Transaction building modules load here, on the first swap, not when watching reserves
+        from sol import Transaction
         if transaction is None:
             transaction = Transaction()
-        swap_instruction = self.swapInstruction(self.solana.publicKey(pool_info["programId"]),
-                                                self.solana.publicKey(pool_info["id"]),
-                                                self.solana.publicKey(pool_info["authority"]),
-                                                self.solana.publicKey(pool_info["openOrders"]),
-                                                self.solana.publicKey(pool_info["targetOrders"]),
-                                                self.solana.publicKey(pool_info["baseVault"]),
-                                                self.solana.publicKey(pool_info["quoteVault"]),
-                                                self.solana.publicKey(pool_info["marketProgramId"]),
-                                                self.solana.publicKey(pool_info["marketId"]),
-                                                self.solana.publicKey(pool_info["marketBids"]),
-                                                self.solana.publicKey(pool_info["marketAsks"]),
-                                                self.solana.publicKey(pool_info["marketEventQueue"]),
-                                                self.solana.publicKey(pool_info["marketBaseVault"]),
-                                                self.solana.publicKey(pool_info["marketQuoteVault"]),
-                                                self.solana.publicKey(pool_info["marketAuthority"]),
+        # PoolInfo hands out cached PublicKeys, a plain dict is converted once per call
+        if not isinstance(pool_info, PoolInfo):
+            pool_info = PoolInfo.fromDict(pool_info)
+        swap_instruction = self.swapInstruction(pool_info.publicKey("programId"),
+                                                pool_info.publicKey("id"),
+                                                pool_info.publicKey("authority"),
+                                                pool_info.publicKey("openOrders"),
+                                                pool_info.publicKey("targetOrders"),
+                                                pool_info.publicKey("baseVault"),
+                                                pool_info.publicKey("quoteVault"),
+                                                pool_info.publicKey("marketProgramId"),
+                                                pool_info.publicKey("marketId"),
+                                                pool_info.publicKey("marketBids"),
+                                                pool_info.publicKey("marketAsks"),
+                                                pool_info.publicKey("marketEventQueue"),
+                                                pool_info.publicKey("marketBaseVault"),
+                                                pool_info.publicKey("marketQuoteVault"),
+                                                pool_info.publicKey("marketAuthority"),
                                                 self.solana.publicKey(from_token_account),
                                                 self.solana.publicKey(to_token_account),
                                                 keypair.public_key,
@@ -323,6 +423,7 @@ class RaydiumApi:
                         user_owner,
                         amount_in,
                         min_amount_out):
+        from sol import AccountMeta, TransactionInstruction
         keys = [
             AccountMeta(TOKEN_PROGRAM_ID, False, False),
             AccountMeta(amm_id, False, True),
@@ -351,11 +452,24 @@ class RaydiumAmm(RaydiumApi):
                  solana,
                  token0,
                  token1,
-                 remove_deprecated = False):
+                 remove_deprecated = False,
+                 cache = None,
+                 refresh = False,
+                 index = None,
+                 include_book = False):
         RaydiumApi.__init__(self, solana)
-        amm_address, token0_base = self.getAmmAddress(self.solana.publicKey(token0), self.solana.publicKey(token1), remove_deprecated)
+        self.name = "Raydium"
+        # With the book included, snapshots fetch and decode the market's bids and asks with the reserves
+        self.include_book = include_book
+        self.books = None
+        if cache is not None and not refresh and cache.restore(self, token0, token1, remove_deprecated):
+            return
+        if index is not None:
+            amm_address, market_address, token0_base = index.lookup(token0, token1, remove_deprecated)
+        else:
+            amm_address, token0_base = self.getAmmAddress(self.solana.publicKey(token0), self.solana.publicKey(token1), remove_deprecated)
+            market_address, token0_base = self.getMarketAddress(token0, token1, remove_deprecated)
         self.amm_address = self.solana.publicKey(amm_address)
-        market_address, token0_base = self.getMarketAddress(token0, token1, remove_deprecated)
         self.market_address = self.solana.publicKey(market_address)
         if token0_base:
             self.base = self.solana.publicKey(token0)
@@ -367,8 +481,41 @@ class RaydiumAmm(RaydiumApi):
         (self.pool_coin_token_account,
         self.pool_pc_token_account,
         self.amm_open_orders_account) = self.getSwapAccounts(self.pool_info["id"])
-        self.name = "Raydium"
+        if cache is not None:
+            cache.put(token0, token1, remove_deprecated, self)
         
+    def reserveAccounts(self):
+        accounts = [self.pool_info["id"],
+                    self.pool_coin_token_account,
+                    self.pool_pc_token_account,
+                    self.amm_open_orders_account]
+        if self.include_book:
+            accounts += [self.pool_info["marketBids"], self.pool_info["marketAsks"]]
+        return accounts
+
+    def parsePoolReserves(self, account_datas, slot):
+        if self.include_book:
+            self.books = self.parseBook(self.pool_info, account_datas[4], account_datas[5])
+        return self.parseReserves(*self.reserveAccounts()[:4], account_datas[:4], slot)
+
+    def getDepth(self):
+        # Reserves and both sides of the book from one getMultipleAccounts call
+        accounts = [self.pool_info["id"],
+                    self.pool_coin_token_account,
+                    self.pool_pc_token_account,
+                    self.amm_open_orders_account,
+                    self.pool_info["marketBids"],
+                    self.pool_info["marketAsks"]]
+        account_datas, slot = self.solana.getMultipleAccountsData(accounts)
+        reserves, fees, slot = self.parseReserves(*accounts[:4], account_datas[:4], slot)
+        books = self.parseBook(self.pool_info, account_datas[4], account_datas[5])
+        return (reserves, fees, books, slot)
+
+    def getAmountOutWithBook(self, amount_in, side):
+        reserves, fees, books, slot = self.getDepth()
+        amount_out, amm_amount_in = super().getAmountOutWithBook(amount_in, side, reserves, fees, books)
+        return (amount_out, amm_amount_in, slot)
+
     def getReserves(self):
         return super().getReserves(self.pool_info["id"],
                                    self.pool_coin_token_account,
@@ -398,4 +545,210 @@ class RaydiumAmm(RaydiumApi):
                             tx_opts,
                             send_transaction)
 
-        
\ No newline at end of file
+class AsyncRaydiumApi(RaydiumApi):
+    def __init__(self, solana):
+        RaydiumApi.__init__(self, solana)
+
+    async def getAmmAddress(self,
+                            token0,
+                            token1,
+                            remove_deprecated = False):
+        token0 = str(token0)
+        token1 = str(token1)
+        # Both orderings are requested together rather than only falling back on a miss
+        amm_accounts, reversed_amm_accounts = await asyncio.gather(self.getAmmProgramAccounts(token0, token1, remove_deprecated),
+                                                                   self.getAmmProgramAccounts(token1, token0, remove_deprecated))
+        token0_base = True
+        if len(amm_accounts) == 0:
+            amm_accounts = reversed_amm_accounts
+            token0_base = False
+        if len(amm_accounts) == 0:
+            raise ValueError("Pair of tokens {} and {} has no amm market".format(token0, token1))
+        return (self.selectAddress(amm_accounts), token0_base)
+
+    async def getMarketAddress(self,
+                               token0,
+                               token1,
+                               remove_deprecated):
+        token0 = str(token0)
+        token1 = str(token1)
+        market_accounts, reversed_market_accounts = await asyncio.gather(self.getMarketProgramAccounts(token0, token1, remove_deprecated),
+                                                                         self.getMarketProgramAccounts(token1, token0, remove_deprecated))
+        token0_base = True
+        if len(market_accounts) == 0:
+            market_accounts = reversed_market_accounts
+            token0_base = False
+        if len(market_accounts) == 0:
+            raise ValueError("Pair of tokens {} and {} has no serum market".format(token0, token1))
+        return (self.selectAddress(market_accounts), token0_base)
+
+    async def getAmmProgramAccounts(self,
+                                    base,
+                                    quote,
+                                    remove_deprecated):
+        memcmp_opts = [
+            MemcmpOpts(offset=400, bytes=base),
+            MemcmpOpts(offset=432, bytes=quote)
+        ]
+        accounts = await self.solana.getProgramAccounts(LIQUIDITY_POOL_PROGRAM_ID_V4,
+                                                        memcmp_opts=memcmp_opts)
+        return self.parseAmmProgramAccounts(accounts, remove_deprecated)
+
+    async def getMarketProgramAccounts(self,
+                                       base,
+                                       quote,
+                                       remove_deprecated):
+        memcmp_opts = [
+            MemcmpOpts(53, base),
+            MemcmpOpts(85, quote)
+        ]
+        accounts = await self.solana.getProgramAccounts(SERUM_PROGRAM_ID_V3,
+                                                        memcmp_opts=memcmp_opts)
+        return self.parseMarketProgramAccounts(accounts, remove_deprecated)
+
+    async def getPoolInfo(self,
+                          amm_address,
+                          market_address,
+                          base,
+                          quote):
+        (amm_data, _), (market_data, _) = await asyncio.gather(self.solana.getAccountData(amm_address),
+                                                               self.solana.getAccountData(market_address))
+        return self.buildPoolInfo(amm_address, amm_data, market_address, market_data, base, quote)
+
+    async def getSwapAccounts(self, pool_id):
+        pool_data, _ = await self.solana.getAccountData(pool_id)
+        return self.parseSwapAccounts(pool_id, pool_data)
+
+    async def getReserves(self,
+                          pool_id,
+                          pool_coin_token_account,
+                          pool_pc_token_account,
+                          amm_open_orders_account):
+        account_datas, slot = await self.solana.getMultipleAccountsData([pool_id,
+                                                                         pool_coin_token_account,
+                                                                         pool_pc_token_account,
+                                                                         amm_open_orders_account])
+        return self.parseReserves(pool_id,
+                                  pool_coin_token_account,
+                                  pool_pc_token_account,
+                                  amm_open_orders_account,
+                                  account_datas,
+                                  slot)
+
+    async def getAmountOut(self,
+                           amount_in,
+                           side,
+                           pool_info,
+                           reserves = None,
+                           fees = None,
+                           slot = None):
+        if not reserves or not fees or not slot:
+            reserves, fees, slot = await self.getReserves(pool_info["id"],
+                                                          pool_info["baseVault"],
+                                                          pool_info["quoteVault"],
+                                                          pool_info["openOrders"])
+        return RaydiumApi.getAmountOut(self, amount_in, side, pool_info, reserves, fees, slot)
+
+    async def swap(self,
+                   amount_in,
+                   min_amount_out,
+                   pool_info,
+                   from_token_account,
+                   to_token_account,
+                   keypair,
+                   transaction = None,
+                   tx_opts = None,
+                   send_transaction = True):
+        transaction = RaydiumApi.swap(self,
+                                      amount_in,
+                                      min_amount_out,
+                                      pool_info,
+                                      from_token_account,
+                                      to_token_account,
+                                      keypair,
+                                      transaction,
+                                      tx_opts,
+                                      send_transaction = False)
+        if send_transaction:
+            return await self.solana.sendTransaction(transaction, [keypair], tx_opts)
+        else:
+            return transaction
+
+class AsyncRaydiumAmm(AsyncRaydiumApi):
+    # Lookups are coroutines, so instances are built with `await AsyncRaydiumAmm.create(...)`
+    def __init__(self, solana):
+        AsyncRaydiumApi.__init__(self, solana)
+        self.name = "Raydium"
+
+    @classmethod
+    async def create(cls,
+                     solana,
+                     token0,
+                     token1,
+                     remove_deprecated = False,
+                     cache = None,
+                     refresh = False,
+                     index = None):
+        self = cls(solana)
+        if cache is not None and not refresh and cache.restore(self, token0, token1, remove_deprecated):
+            return self
+        if index is not None:
+            amm_address, market_address, token0_base = index.lookup(token0, token1, remove_deprecated)
+        else:
+            (amm_address, _), (market_address, token0_base) = await asyncio.gather(
+                self.getAmmAddress(self.solana.publicKey(token0), self.solana.publicKey(token1), remove_deprecated),
+                self.getMarketAddress(token0, token1, remove_deprecated))
+        self.amm_address = self.solana.publicKey(amm_address)
+        self.market_address = self.solana.publicKey(market_address)
+        if token0_base:
+            self.base = self.solana.publicKey(token0)
+            self.quote = self.solana.publicKey(token1)
+        else:
+            self.base = self.solana.publicKey(token1)
+            self.quote = self.solana.publicKey(token0)
+        self.pool_info = await self.getPoolInfo(self.amm_address, self.market_address, self.base, self.quote)
+        # The vaults and open orders decoded for pool_info are the accounts getSwapAccounts would fetch again
+        self.pool_coin_token_account = self.pool_info["baseVault"]
+        self.pool_pc_token_account = self.pool_info["quoteVault"]
+        self.amm_open_orders_account = self.pool_info["openOrders"]
+        if cache is not None:
+            cache.put(token0, token1, remove_deprecated, self)
+        return self
+
+    def reserveAccounts(self):
+        return [self.pool_info["id"],
+                self.pool_coin_token_account,
+                self.pool_pc_token_account,
+                self.amm_open_orders_account]
+
+    def parsePoolReserves(self, account_datas, slot):
+        return self.parseReserves(*self.reserveAccounts(), account_datas, slot)
+
+    async def getReserves(self):
+        return await super().getReserves(self.pool_info["id"],
+                                          self.pool_coin_token_account,
+                                          self.pool_pc_token_account,
+                                          self.amm_open_orders_account)
+
+    async def getAmountOut(self, amount_in, side):
+        reserves, fees, slot = await self.getReserves()
+        return await super().getAmountOut(amount_in, side, self.pool_info, reserves, fees, slot)
+
+    async def swap(self,
+                   amount_in,
+                   min_amount_out,
+                   from_token_account,
+                   to_token_account,
+                   keypair,
+                   transaction = None,
+                   tx_opts = None,
+                   send_transaction = True):
+        return await super().swap(amount_in,
+                                  min_amount_out,
+                                  self.pool_info,
+                                  from_token_account,
+                                  to_token_account,
+                                  keypair,
+                                  transaction,
+                                  tx_opts,
+                                  send_transaction)
@@ -0,0 +1,221 @@
+import json
+import os
+import time
+
+import numpy as np
+
+COLUMNS = [('slot', '<u8'),
+           ('timestamp', '<i8'),
+           ('pool', '<u4'),
+           ('reserve_quote', '<u8'),
+           ('reserve_base', '<u8'),
+           ('fee_numerator', '<u8'),
+           ('fee_denominator', '<u8')]
+DEFAULT_SEGMENT_ROWS = 1 << 20
+SEGMENT_FORMAT = 'segment-{:06d}'
+SEGMENT_META = 'segment.json'
+POOLS_FILE = 'pools.json'
+
+def writeJson(path, value):
+    # Readers only ever see a complete file
+    temporary = path + '.tmp'
+    with open(temporary, 'w') as f:
+        json.dump(value, f)
+    os.replace(temporary, path)
+
+def readJson(path):
+    with open(path) as f:
+        return json.load(f)
+
+def segmentIndex(name):
+    return int(name.split('-')[1])
+
+class Segment:
+    def __init__(self,
+                 path,
+                 capacity,
+                 mode):
+        self.path = path
+        self.capacity = capacity
+        self.columns = {name: np.memmap(os.path.join(path, name + '.bin'), dtype=dtype, mode=mode, shape=(capacity,))
+                        for name, dtype in COLUMNS}
+
+    def flush(self, rows, created):
+        for column in self.columns.values():
+            column.flush()
+        # The row count is published after the column data so readers never see unwritten rows
+        writeJson(os.path.join(self.path, SEGMENT_META), {"rows": rows,
+                                                          "capacity": self.capacity,
+                                                          "created": created,
+                                                          "columns": dict(COLUMNS)})
+
+# Appends reserve snapshots to fixed-width columns, one memory-mapped file per column,
+# split into segments of segment_rows rows. Rows are published to readers on flush, which
+# happens every flush_interval seconds, on rotation and on close.
+class ReserveRecorder:
+    def __init__(self,
+                 directory,
+                 segment_rows = DEFAULT_SEGMENT_ROWS,
+                 flush_interval = 1.0,
+                 segment_seconds = None):
+        self.directory = directory
+        self.segment_rows = segment_rows
+        self.flush_interval = flush_interval
+        self.segment_seconds = segment_seconds
+        os.makedirs(directory, exist_ok=True)
+        pools_path = os.path.join(directory, POOLS_FILE)
+        self.pools = readJson(pools_path) if os.path.exists(pools_path) else []
+        self.pool_indices = {pool: i for i, pool in enumerate(self.pools)}
+        self.segment = None
+        self.segment_index = -1
+        self.rows = 0
+        self.created = 0.0
+        self.last_flush = time.monotonic()
+        self.resume()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def resume(self):
+        # A restarted recorder keeps appending to the last segment if it has room
+        segments = sorted(name for name in os.listdir(self.directory) if name.startswith('segment-'))
+        if segments:
+            path = os.path.join(self.directory, segments[-1])
+            meta_path = os.path.join(path, SEGMENT_META)
+            self.segment_index = segmentIndex(segments[-1])
+            if os.path.exists(meta_path):
+                meta = readJson(meta_path)
+                if meta["rows"] < meta["capacity"] and not self.expired(meta["created"]):
+                    self.segment = Segment(path, meta["capacity"], 'r+')
+                    self.rows = meta["rows"]
+                    self.created = meta["created"]
+                    return
+        self.rotate()
+
+    def expired(self, created):
+        return self.segment_seconds is not None and time.time() - created >= self.segment_seconds
+
+    def rotate(self):
+        if self.segment is not None:
+            self.segment.flush(self.rows, self.created)
+        self.segment_index += 1
+        path = os.path.join(self.directory, SEGMENT_FORMAT.format(self.segment_index))
+        os.makedirs(path, exist_ok=True)
+        self.segment = Segment(path, self.segment_rows, 'w+')
+        self.rows = 0
+        self.created = time.time()
+        self.segment.flush(self.rows, self.created)
+
+    def poolIndex(self, pool_id):
+        pool_id = str(pool_id)
+        index = self.pool_indices.get(pool_id)
+        if index is None:
+            index = len(self.pools)
+            self.pools.append(pool_id)
+            self.pool_indices[pool_id] = index
+            writeJson(os.path.join(self.directory, POOLS_FILE), self.pools)
+        return index
+
+    def write(self, values):
+        count = len(values['slot'])
+        written = 0
+        while written < count:
+            if self.rows == self.segment.capacity or self.expired(self.created):
+                self.rotate()
+            n = min(count - written, self.segment.capacity - self.rows)
+            for name, column in self.segment.columns.items():
+                column[self.rows:self.rows + n] = values[name][written:written + n]
+            self.rows += n
+            written += n
+        if time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def record(self,
+               pool_id,
+               reserves,
+               fees,
+               slot,
+               timestamp = None):
+        self.recordRows([(pool_id, reserves, fees)], slot, timestamp)
+
+    def recordRows(self,
+                   rows,
+                   slot,
+                   timestamp = None):
+        # rows of (pool id, reserves, fees) with reserves [quote, base, ...] and fees (denominator, numerator, ...)
+        timestamp = time.time_ns() if timestamp is None else timestamp
+        count = len(rows)
+        self.write({'slot': np.full(count, slot, dtype=np.uint64),
+                    'timestamp': np.full(count, timestamp, dtype=np.int64),
+                    'pool': np.fromiter((self.poolIndex(pool_id) for pool_id, _, _ in rows), dtype=np.uint32, count=count),
+                    'reserve_quote': np.fromiter((int(reserves[0]) for _, reserves, _ in rows), dtype=np.uint64, count=count),
+                    'reserve_base': np.fromiter((int(reserves[1]) for _, reserves, _ in rows), dtype=np.uint64, count=count),
+                    'fee_numerator': np.fromiter((int(fees[1]) for _, _, fees in rows), dtype=np.uint64, count=count),
+                    'fee_denominator': np.fromiter((int(fees[0]) for _, _, fees in rows), dtype=np.uint64, count=count)})
+
+    def recordSnapshot(self,
+                       snapshot,
+                       slot,
+                       timestamp = None):
+        # snapshot as returned by ReserveSnapshotter.getReserves
+        self.recordRows([(pool.pool_info["id"], reserves, fees) for pool, (reserves, fees) in snapshot.items()],
+                        slot,
+                        timestamp)
+
+    def flush(self):
+        self.segment.flush(self.rows, self.created)
+        self.last_flush = time.monotonic()
+
+    def close(self):
+        if self.segment is not None:
+            self.flush()
+            self.segment = None
+
+# Reads recorded segments back as read-only NumPy memory maps over the column files
+class ReserveReader:
+    def __init__(self, directory):
+        self.directory = directory
+        pools_path = os.path.join(directory, POOLS_FILE)
+        self.pools = readJson(pools_path) if os.path.exists(pools_path) else []
+
+    def poolIndex(self, pool_id):
+        return self.pools.index(str(pool_id))
+
+    def segments(self):
+        return sorted(name for name in os.listdir(self.directory) if name.startswith('segment-'))
+
+    def readSegment(self,
+                    segment,
+                    columns = None):
+        path = os.path.join(self.directory, segment)
+        meta = readJson(os.path.join(path, SEGMENT_META))
+        rows = meta["rows"]
+        names = columns or [name for name, _ in COLUMNS]
+        # Slicing a memmap keeps it a view, nothing is copied until the caller touches the data
+        return {name: np.memmap(os.path.join(path, name + '.bin'),
+                                dtype=meta["columns"][name],
+                                mode='r',
+                                shape=(meta["capacity"],))[:rows]
+                for name in names}
+
+    def read(self,
+             columns = None,
+             pool = None):
+        names = list(columns or [name for name, _ in COLUMNS])
+        if pool is not None and 'pool' not in names:
+            names.append('pool')
+        segments = [self.readSegment(segment, names) for segment in self.segments()]
+        segments = [segment for segment in segments if len(segment[names[0]])]
+        if not segments:
+            return {name: np.zeros(0, dtype=dict(COLUMNS)[name]) for name in names}
+        if len(segments) == 1:
+            result = segments[0]
+        else:
+            result = {name: np.concatenate([segment[name] for segment in segments]) for name in names}
+        if pool is not None:
+            mask = result['pool'] == self.poolIndex(pool)
+            result = {name: values[mask] for name, values in result.items()}
+        return result
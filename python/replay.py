@@ -0,0 +1,272 @@
+import argparse
+import base64
+import os
+import random
+import struct
+import sys
+import time
+
+from encoding import decodeAccountData
+from fake import FakeSolana
+from layout import LIQUIDITY_POOL_PROGRAM_ID_V4
+from raydium import RaydiumAmm
+from recorder import readJson, writeJson
+from sol import SERUM_PROGRAM_ID_V3
+from snapshot import MAX_MULTIPLE_ACCOUNTS
+
+# A recording is a directory with replay.json (token pairs, account addresses and owners) and
+# frames.bin, a sequence of frames: slot, timestamp and the accounts whose bytes changed since
+# the previous frame. The first frame holds every account, so pools can be built from it.
+REPLAY_META = 'replay.json'
+REPLAY_FRAMES = 'frames.bin'
+FRAME_HEADER = struct.Struct('<QqI')
+ACCOUNT_HEADER = struct.Struct('<II')
+TOKEN_AMOUNT_OFFSET = 64
+
+class AccountRecorder:
+    def __init__(self,
+                 directory,
+                 pairs,
+                 owners = None):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.meta = {"pairs": [[str(token0), str(token1)] for token0, token1 in pairs],
+                     "accounts": [],
+                     "owners": {str(address): str(owner) for address, owner in (owners or {}).items()}}
+        self.indices = {}
+        self.last = {}
+        self.frames = 0
+        self.file = open(os.path.join(directory, REPLAY_FRAMES), 'wb')
+        writeJson(os.path.join(directory, REPLAY_META), self.meta)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def accountIndex(self, address):
+        index = self.indices.get(address)
+        if index is None:
+            index = len(self.meta["accounts"])
+            self.meta["accounts"].append(address)
+            self.indices[address] = index
+            writeJson(os.path.join(self.directory, REPLAY_META), self.meta)
+        return index
+
+    def record(self,
+               slot,
+               accounts,
+               timestamp = None):
+        # accounts maps address to raw bytes, unchanged accounts are left out of the frame
+        timestamp = time.time_ns() if timestamp is None else timestamp
+        changed = []
+        for address, data in accounts.items():
+            address = str(address)
+            if data is None or self.last.get(address) == data:
+                continue
+            self.last[address] = data
+            changed.append((self.accountIndex(address), data))
+        self.file.write(FRAME_HEADER.pack(slot, timestamp, len(changed)))
+        for index, data in changed:
+            self.file.write(ACCOUNT_HEADER.pack(index, len(data)))
+            self.file.write(data)
+        self.frames += 1
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+def readFrames(directory):
+    meta = readJson(os.path.join(directory, REPLAY_META))
+    addresses = meta["accounts"]
+    with open(os.path.join(directory, REPLAY_FRAMES), 'rb') as f:
+        data = memoryview(f.read())
+    frames = []
+    offset = 0
+    # A frame cut short by a crash while recording is dropped
+    while offset + FRAME_HEADER.size <= len(data):
+        slot, timestamp, count = FRAME_HEADER.unpack_from(data, offset)
+        position = offset + FRAME_HEADER.size
+        accounts = []
+        for _ in range(count):
+            if position + ACCOUNT_HEADER.size > len(data):
+                break
+            index, length = ACCOUNT_HEADER.unpack_from(data, position)
+            position += ACCOUNT_HEADER.size
+            if position + length > len(data):
+                break
+            accounts.append((addresses[index], bytes(data[position:position + length])))
+            position += length
+        if len(accounts) < count:
+            break
+        frames.append((slot, timestamp, accounts))
+        offset = position
+    return meta, frames
+
+def recordPools(solana,
+                pools,
+                directory,
+                slots = None,
+                interval = 0.0):
+    # Records the reserve accounts of RaydiumAmm pools every new slot, plus the pool and market
+    # accounts once so the replay can build the same pools
+    pairs = [(pool.base, pool.quote) for pool in pools]
+    owners = {}
+    static = []
+    for pool in pools:
+        owners[str(pool.pool_info["id"])] = LIQUIDITY_POOL_PROGRAM_ID_V4
+        owners[str(pool.market_address)] = SERUM_PROGRAM_ID_V3
+        static.append(pool.market_address)
+    accounts = []
+    for pool in pools:
+        accounts.extend(pool.reserveAccounts())
+    groups = [accounts[i:i + MAX_MULTIPLE_ACCOUNTS] for i in range(0, len(accounts), MAX_MULTIPLE_ACCOUNTS)]
+    with AccountRecorder(directory, pairs, owners) as recorder:
+        static_datas, _ = solana.getMultipleAccountsData(static)
+        last_slot = None
+        while slots is None or recorder.frames < slots:
+            results = solana.getMultipleAccountsDataBatch(groups)
+            slot = min(slot for _, slot in results)
+            if slot != last_slot:
+                frame = {}
+                if last_slot is None:
+                    frame.update({str(address): decodeAccountData(data) for address, data in zip(static, static_datas)})
+                account_datas = [data for datas, _ in results for data in datas]
+                frame.update({str(address): decodeAccountData(data) if data else None
+                              for address, data in zip(accounts, account_datas)})
+                recorder.record(slot, frame)
+                recorder.flush()
+                last_slot = slot
+            if interval:
+                time.sleep(interval)
+    return directory
+
+def syntheticRecording(directory,
+                       slots = 1000,
+                       pools = 4,
+                       seed = 0,
+                       slot_seconds = 0.4):
+    # Random walks the vault balances of bench's synthetic pools, a few pools per slot
+    from bench import syntheticFixtures
+    rng = random.Random(seed)
+    fixtures = syntheticFixtures(pools, seed)
+    owners = {}
+    accounts = {}
+    vaults = []
+    for pool in fixtures["pools"]:
+        owners.update(pool["owners"])
+        for address, data in pool["accounts"].items():
+            accounts[address] = base64.b64decode(data)
+        # Accounts are listed as amm, market, coin vault, pc vault, open orders
+        vaults.extend(list(pool["accounts"])[2:4])
+    slot = fixtures["slot"]
+    timestamp = time.time_ns()
+    with AccountRecorder(directory, [(pool["token0"], pool["token1"]) for pool in fixtures["pools"]], owners) as recorder:
+        recorder.record(slot, accounts, timestamp)
+        for _ in range(slots - 1):
+            slot += 1
+            timestamp += int(slot_seconds * 1e9)
+            frame = {}
+            for address in rng.sample(vaults, max(1, len(vaults) // 4)):
+                data = bytearray(accounts[address])
+                amount = struct.unpack_from('<Q', data, TOKEN_AMOUNT_OFFSET)[0]
+                amount = max(1, amount + rng.randint(-amount // 1000, amount // 1000))
+                struct.pack_into('<Q', data, TOKEN_AMOUNT_OFFSET, amount)
+                accounts[address] = frame[address] = bytes(data)
+            recorder.record(slot, frame, timestamp)
+    return directory
+
+# Plays a recording back through FakeSolana, so pools built on self.solana run their live code
+# paths unchanged against the recorded state of each slot
+class Replay:
+    def __init__(self, directory):
+        self.meta, self.frames = readFrames(directory)
+        if not self.frames:
+            raise ValueError("Recording in {} has no frames".format(directory))
+        self.solana = FakeSolana()
+        self.apply(self.frames[0])
+
+    def apply(self, frame):
+        slot, _, accounts = frame
+        for address, data in accounts:
+            self.solana.setAccount(address, data, self.meta["owners"].get(address))
+        self.solana.setSlot(slot)
+
+    def pools(self, include_book = False):
+        return [RaydiumAmm(self.solana, token0, token1, include_book=include_book)
+                for token0, token1 in self.meta["pairs"]]
+
+    def run(self,
+            callback,
+            speed = None):
+        # callback(slot) runs once per frame and returns how many quotes it made. With speed set
+        # frames are paced at that multiple of the recorded time, otherwise they go as fast as possible.
+        latencies = []
+        quotes = 0
+        first_timestamp = self.frames[0][1]
+        start = time.perf_counter()
+        for frame in self.frames:
+            self.apply(frame)
+            if speed:
+                delay = start + (frame[1] - first_timestamp) / 1e9 / speed - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            call_start = time.perf_counter_ns()
+            count = callback(frame[0])
+            latencies.append(time.perf_counter_ns() - call_start)
+            quotes += 1 if count is None else count
+        seconds = time.perf_counter() - start
+        latencies.sort()
+        callback_seconds = sum(latencies) / 1e9
+        return {"slots": len(self.frames),
+                "quotes": quotes,
+                "seconds": seconds,
+                "slots_per_sec": len(self.frames) / seconds if seconds else float('inf'),
+                "quotes_per_sec": quotes / callback_seconds if callback_seconds else float('inf'),
+                "p50_us": latencies[len(latencies) // 2] / 1e3,
+                "p99_us": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] / 1e3}
+
+def quoteCallback(pools, amount_in):
+    def callback(slot):
+        for pool in pools:
+            pool.getAmountOut(amount_in, 'buy')
+            pool.getAmountOut(amount_in, 'sell')
+        return 2 * len(pools)
+    return callback
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description="Records Raydium pool accounts per slot and replays them offline")
+    parser.add_argument('directory', help="recording directory")
+    parser.add_argument('--record', metavar='NODE_URL', help="record --pair pools from a node instead of replaying")
+    parser.add_argument('--pair', nargs=2, action='append', metavar=('TOKEN0', 'TOKEN1'), default=[])
+    parser.add_argument('--synthetic', type=int, metavar='POOLS', help="write a synthetic recording instead of replaying")
+    parser.add_argument('--slots', type=int, default=1000, help="frames to record")
+    parser.add_argument('--speed', type=float, help="multiple of real time, as fast as possible by default")
+    parser.add_argument('--amount', type=int, default=10 ** 6, help="amount in for the replayed quotes")
+    args = parser.parse_args(argv)
+
+    if args.record:
+        from sol import WrappedSolana
+        solana = WrappedSolana(args.record)
+        recordPools(solana, [RaydiumAmm(solana, token0, token1) for token0, token1 in args.pair], args.directory, args.slots)
+        return 0
+    if args.synthetic:
+        syntheticRecording(args.directory, args.slots, args.synthetic)
+        return 0
+
+    replay = Replay(args.directory)
+    pools = replay.pools()
+    report = replay.run(quoteCallback(pools, args.amount), args.speed)
+    print("{} slots, {} quotes in {:.3f}s".format(report["slots"], report["quotes"], report["seconds"]))
+    print("{:.1f} slots/sec, {:.1f} quotes/sec, p50 {:.2f} us, p99 {:.2f} us per slot".format(report["slots_per_sec"],
+                                                                                            report["quotes_per_sec"],
+                                                                                            report["p50_us"],
+                                                                                            report["p99_us"]))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
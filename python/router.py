@@ -0,0 +1,467 @@
+import asyncio
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import threading
+import time
+
+from metrics import batchSlot, contextSlot
+from sol import AsyncWrappedSolana, WrappedSolana
+
+# What solana-py's clients read at when no commitment is passed
+DEFAULT_COMMITMENT = 'finalized'
+# Context slots of signature statuses are the node's newest slot
+STATUS_COMMITMENT = 'processed'
+PROBE_COMMITMENT = 'confirmed'
+
+def commitmentKey(commitment):
+    return commitment or DEFAULT_COMMITMENT
+
+class Endpoint:
+    def __init__(self, solana):
+        self.solana = solana
+        self.node_url = solana.node_url
+        self.latency = 0.0
+        # Highest slot seen per commitment, finalized reads trail confirmed ones by ~32 slots
+        self.slots = {}
+        self.requests = 0
+        self.failures = 0
+        self.stale = 0
+        self.cooldown_until = 0.0
+
+    def stats(self):
+        return {"latency_ms": self.latency * 1e3,
+                "slot": max(self.slots.values(), default=0),
+                "slots": dict(self.slots),
+                "requests": self.requests,
+                "failures": self.failures,
+                "stale": self.stale}
+
+# Reads go to the fastest endpoint that is neither cooling down after a failure nor lagging the
+# highest slot seen at the read's commitment. A duplicate request goes to the next endpoint when the first has not
+# answered within hedge_delay, and the first acceptable answer wins.
+class RpcRouter(WrappedSolana):
+    def __init__(self,
+                 endpoints,
+                 hedge_delay = 0.05,
+                 max_hedges = 1,
+                 max_slot_lag = 2,
+                 failure_cooldown = 5.0,
+                 latency_weight = 0.2,
+                 timeout = 10):
+        if not endpoints:
+            raise ValueError("RpcRouter needs at least one endpoint")
+        self.endpoints = [Endpoint(self.endpointSolana(endpoint, timeout) if isinstance(endpoint, str) else endpoint)
+                          for endpoint in endpoints]
+        self.node_url = self.endpoints[0].node_url
+        self.timeout = timeout
+        self.hedge_delay = hedge_delay
+        self.max_hedges = max_hedges
+        self.max_slot_lag = max_slot_lag
+        self.failure_cooldown = failure_cooldown
+        self.latency_weight = latency_weight
+        self.highest_slots = {}
+        self.lock = threading.Lock()
+        self.executor = self.createExecutor()
+
+    def endpointSolana(self, url, timeout):
+        return WrappedSolana(url, timeout=timeout)
+
+    def createConnection(self):
+        return self.endpoints[0].solana.connection
+
+    def createExecutor(self):
+        return ThreadPoolExecutor(max_workers=4 * len(self.endpoints), thread_name_prefix='rpc-router')
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+    def instrument(self, metrics):
+        # Requests are timed per endpoint by the endpoints' own WrappedSolana
+        self.metrics = metrics
+        for endpoint in self.endpoints:
+            endpoint.solana.instrument(metrics)
+        return metrics
+
+    def minSlot(self, commitment):
+        # Responses are only compared with others at the same commitment
+        return self.highest_slots.get(commitmentKey(commitment), 0) - self.max_slot_lag
+
+    def rank(self, commitment = None):
+        now = time.monotonic()
+        key = commitmentKey(commitment)
+        min_slot = self.minSlot(key)
+        # Cooling down and lagging endpoints stay in the list as a last resort rather than being dropped
+        return sorted(self.endpoints, key=lambda endpoint: (endpoint.cooldown_until > now,
+                                                            endpoint.slots.get(key, 0) < min_slot,
+                                                            endpoint.latency))
+
+    def observe(self,
+                endpoint,
+                elapsed,
+                slot,
+                commitment = None):
+        with self.lock:
+            endpoint.requests += 1
+            if endpoint.requests == 1:
+                endpoint.latency = elapsed
+            else:
+                endpoint.latency += self.latency_weight * (elapsed - endpoint.latency)
+            if slot is not None:
+                key = commitmentKey(commitment)
+                endpoint.slots[key] = max(endpoint.slots.get(key, 0), slot)
+                self.highest_slots[key] = max(self.highest_slots.get(key, 0), slot)
+
+    def failed(self, endpoint):
+        with self.lock:
+            endpoint.failures += 1
+            endpoint.cooldown_until = time.monotonic() + self.failure_cooldown
+
+    def accept(self,
+               endpoint,
+               slot,
+               min_slot):
+        if slot is None or slot >= min_slot:
+            return True
+        with self.lock:
+            endpoint.stale += 1
+        return False
+
+    def call(self,
+             endpoint,
+             method,
+             args,
+             slot_of,
+             commitment = None):
+        start = time.perf_counter()
+        try:
+            result = getattr(endpoint.solana, method)(*args)
+        except Exception:
+            self.failed(endpoint)
+            raise
+        self.observe(endpoint, time.perf_counter() - start, slot_of(result) if slot_of else None, commitment)
+        return result
+
+    def read(self,
+             method,
+             *args,
+             slot_of = None,
+             commitment = None):
+        ranked = self.rank(commitment)
+        # Responses from before the newest state already seen would move reserves backwards
+        min_slot = self.minSlot(commitment)
+        launched = {}
+        pending = set()
+        errors = []
+        hedges = 0
+
+        def launch():
+            endpoint = ranked[len(launched)]
+            future = self.executor.submit(self.call, endpoint, method, args, slot_of, commitment)
+            launched[future] = endpoint
+            pending.add(future)
+
+        launch()
+        while pending:
+            can_hedge = hedges < self.max_hedges and len(launched) < len(ranked)
+            done, _ = wait(pending, self.hedge_delay if can_hedge else None, FIRST_COMPLETED)
+            if not done:
+                hedges += 1
+                launch()
+                continue
+            for future in done:
+                pending.discard(future)
+                endpoint = launched[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    errors.append("{}: {}".format(endpoint.node_url, e))
+                    continue
+                if self.accept(endpoint, slot_of(result) if slot_of else None, min_slot):
+                    return result
+                errors.append("{}: stale slot {} < {}".format(endpoint.node_url, slot_of(result), min_slot))
+            # Every in-flight request failed or was stale, so fail over to the next endpoint right away
+            if not pending and len(launched) < len(ranked):
+                launch()
+        raise ValueError("{} failed on every endpoint: {}".format(method, "; ".join(errors)))
+
+    def write(self,
+              method,
+              *args):
+        errors = []
+        for endpoint in self.rank():
+            try:
+                return self.call(endpoint, method, args, None)
+            except Exception as e:
+                errors.append("{}: {}".format(endpoint.node_url, e))
+        raise ValueError("{} failed on every endpoint: {}".format(method, "; ".join(errors)))
+
+    def probe(self):
+        # Measures every endpoint, including ones reads have not picked lately, and refreshes their slots
+        futures = [self.executor.submit(self.call, endpoint, 'getSlot', (PROBE_COMMITMENT,), lambda slot: slot, PROBE_COMMITMENT)
+                   for endpoint in self.endpoints]
+        for future in futures:
+            try:
+                future.result()
+            except Exception:
+                pass
+        return self.stats()
+
+    def stats(self):
+        return {endpoint.node_url: endpoint.stats() for endpoint in self.endpoints}
+
+    def sendTransaction(self,
+                        transaction,
+                        signers,
+                        tx_opts = None):
+        return self.write('sendTransaction', transaction, signers, tx_opts)
+
+    def sendRawTransaction(self,
+                           raw_transaction,
+                           tx_opts = None):
+        return self.write('sendRawTransaction', raw_transaction, tx_opts)
+
+    def getRecentBlockhash(self, commitment = 'finalized'):
+        return self.read('getRecentBlockhash', commitment)
+
+    def getSignatureStatuses(self, signatures):
+        return self.read('getSignatureStatuses', signatures, slot_of=contextSlot, commitment=STATUS_COMMITMENT)
+
+    def getSlot(self, commitment = 'confirmed'):
+        return self.read('getSlot', commitment, slot_of=lambda slot: slot, commitment=commitment)
+
+    def getProgramAccounts(self,
+                           address,
+                           commitment = 'finalized',
+                           encoding = None,
+                           data_slice = None,
+                           data_size = None,
+                           memcmp_opts = None):
+        return self.read('getProgramAccounts', address, commitment, encoding, data_slice, data_size, memcmp_opts)
+
+    def iterProgramAccounts(self,
+                            address,
+                            commitment = 'finalized',
+                            data_slice = None,
+                            data_size = None,
+                            memcmp_opts = None,
+                            select = None,
+                            decode = None):
+        # A stream cannot be hedged, it fails over to the next endpoint only until the first account arrives
+        errors = []
+        for endpoint in self.rank(commitment):
+            started = False
+            try:
+                for account in endpoint.solana.iterProgramAccounts(address, commitment, data_slice, data_size, memcmp_opts, select, decode):
+                    started = True
+                    yield account
+                return
+            except Exception as e:
+                if started:
+                    raise
+                self.failed(endpoint)
+                errors.append("{}: {}".format(endpoint.node_url, e))
+        raise ValueError("iterProgramAccounts failed on every endpoint: {}".format("; ".join(errors)))
+
+    def getAccountInfo(self,
+                       account,
+                       encoding = None):
+        return self.read('getAccountInfo', account, encoding, slot_of=contextSlot)
+
+    def getMultipleAccounts(self,
+                            accounts,
+                            commitment = None,
+                            encoding = None):
+        return self.read('getMultipleAccounts', accounts, commitment, encoding, slot_of=contextSlot, commitment=commitment)
+
+    def getMultipleAccountsDataBatch(self, account_groups):
+        return self.read('getMultipleAccountsDataBatch', account_groups, slot_of=batchSlot)
+
+    def getMultipleAccountsBytes(self, request):
+        return self.read('getMultipleAccountsBytes', request, slot_of=batchSlot, commitment=request.commitment)
+
+class AsyncRpcRouter(RpcRouter):
+    def __init__(self,
+                 endpoints,
+                 hedge_delay = 0.05,
+                 max_hedges = 1,
+                 max_slot_lag = 2,
+                 failure_cooldown = 5.0,
+                 latency_weight = 0.2,
+                 timeout = 10):
+        RpcRouter.__init__(self,
+                           endpoints,
+                           hedge_delay,
+                           max_hedges,
+                           max_slot_lag,
+                           failure_cooldown,
+                           latency_weight,
+                           timeout)
+
+    def endpointSolana(self, url, timeout):
+        return AsyncWrappedSolana(url, timeout=timeout)
+
+    def createExecutor(self):
+        # Requests are tasks on the running loop
+        return None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def close(self):
+        for endpoint in self.endpoints:
+            await endpoint.solana.close()
+
+    async def call(self,
+                   endpoint,
+                   method,
+                   args,
+                   slot_of,
+                   commitment = None):
+        start = time.perf_counter()
+        try:
+            result = await getattr(endpoint.solana, method)(*args)
+        except Exception:
+            self.failed(endpoint)
+            raise
+        self.observe(endpoint, time.perf_counter() - start, slot_of(result) if slot_of else None, commitment)
+        return result
+
+    async def read(self,
+                   method,
+                   *args,
+                   slot_of = None,
+                   commitment = None):
+        ranked = self.rank(commitment)
+        min_slot = self.minSlot(commitment)
+        launched = {}
+        pending = set()
+        errors = []
+        hedges = 0
+
+        def launch():
+            endpoint = ranked[len(launched)]
+            task = asyncio.ensure_future(self.call(endpoint, method, args, slot_of, commitment))
+            launched[task] = endpoint
+            pending.add(task)
+
+        launch()
+        try:
+            while pending:
+                can_hedge = hedges < self.max_hedges and len(launched) < len(ranked)
+                done, _ = await asyncio.wait(pending, timeout=self.hedge_delay if can_hedge else None,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedges += 1
+                    launch()
+                    continue
+                for task in done:
+                    pending.discard(task)
+                    endpoint = launched[task]
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        errors.append("{}: {}".format(endpoint.node_url, e))
+                        continue
+                    if self.accept(endpoint, slot_of(result) if slot_of else None, min_slot):
+                        return result
+                    errors.append("{}: stale slot {} < {}".format(endpoint.node_url, slot_of(result), min_slot))
+                if not pending and len(launched) < len(ranked):
+                    launch()
+        finally:
+            # Losing hedges are cancelled, their latency is not worth a connection held open
+            for task in pending:
+                task.cancel()
+        raise ValueError("{} failed on every endpoint: {}".format(method, "; ".join(errors)))
+
+    async def write(self,
+                    method,
+                    *args):
+        errors = []
+        for endpoint in self.rank():
+            try:
+                return await self.call(endpoint, method, args, None)
+            except Exception as e:
+                errors.append("{}: {}".format(endpoint.node_url, e))
+        raise ValueError("{} failed on every endpoint: {}".format(method, "; ".join(errors)))
+
+    async def probe(self):
+        await asyncio.gather(*[self.call(endpoint, 'getSlot', (PROBE_COMMITMENT,), lambda slot: slot, PROBE_COMMITMENT)
+                               for endpoint in self.endpoints],
+                             return_exceptions=True)
+        return self.stats()
+
+    async def sendTransaction(self,
+                              transaction,
+                              signers,
+                              tx_opts = None):
+        return await self.write('sendTransaction', transaction, signers, tx_opts)
+
+    async def sendRawTransaction(self,
+                                 raw_transaction,
+                                 tx_opts = None):
+        return await self.write('sendRawTransaction', raw_transaction, tx_opts)
+
+    async def getRecentBlockhash(self, commitment = 'finalized'):
+        return await self.read('getRecentBlockhash', commitment)
+
+    async def getSignatureStatuses(self, signatures):
+        return await self.read('getSignatureStatuses', signatures, slot_of=contextSlot, commitment=STATUS_COMMITMENT)
+
+    async def getSlot(self, commitment = 'confirmed'):
+        return await self.read('getSlot', commitment, slot_of=lambda slot: slot, commitment=commitment)
+
+    async def getProgramAccounts(self,
+                                 address,
+                                 commitment = 'finalized',
+                                 encoding = None,
+                                 data_slice = None,
+                                 data_size = None,
+                                 memcmp_opts = None):
+        return await self.read('getProgramAccounts', address, commitment, encoding, data_slice, data_size, memcmp_opts)
+
+    async def iterProgramAccounts(self,
+                                  address,
+                                  commitment = 'finalized',
+                                  data_slice = None,
+                                  data_size = None,
+                                  memcmp_opts = None,
+                                  select = None,
+                                  decode = None):
+        errors = []
+        for endpoint in self.rank(commitment):
+            started = False
+            try:
+                async for account in endpoint.solana.iterProgramAccounts(address, commitment, data_slice, data_size, memcmp_opts, select, decode):
+                    started = True
+                    yield account
+                return
+            except Exception as e:
+                if started:
+                    raise
+                self.failed(endpoint)
+                errors.append("{}: {}".format(endpoint.node_url, e))
+        raise ValueError("iterProgramAccounts failed on every endpoint: {}".format("; ".join(errors)))
+
+    async def getAccountInfo(self,
+                             account,
+                             encoding = None):
+        return await self.read('getAccountInfo', account, encoding, slot_of=contextSlot)
+
+    async def getAccountData(self, account):
+        account_info, slot = await self.getAccountInfo(account)
+        return (account_info['data'], slot)
+
+    async def getMultipleAccounts(self,
+                                  accounts,
+                                  commitment = None,
+                                  encoding = None):
+        return await self.read('getMultipleAccounts', accounts, commitment, encoding, slot_of=contextSlot, commitment=commitment)
+
+    async def getMultipleAccountsData(self,
+                                      accounts,
+                                      commitment = None):
+        account_infos, slot = await self.getMultipleAccounts(accounts, commitment)
+        account_datas = [account_info['data'] for account_info in account_infos]
+        return account_datas, slot
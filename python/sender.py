@@ -0,0 +1,501 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+import base58
+
+from sol import AsyncWrappedSolana, WrappedSolana
+
+MAX_SIGNATURE_STATUSES = 256
+COMMITMENT_LEVELS = ['processed', 'confirmed', 'finalized']
+PENDING = 'pending'
+CONFIRMED = 'confirmed'
+FAILED = 'failed'
+EXPIRED = 'expired'
+
+def transactionSignature(raw_transaction):
+    # The wire format starts with the shortvec signature count, the first signature is the transaction id
+    offset = 0
+    while raw_transaction[offset] & 0x80:
+        offset += 1
+    return str(base58.b58encode(bytes(raw_transaction[offset + 1:offset + 65])), 'utf8')
+
+# Keeps a recent blockhash refreshed in a background thread so signing never waits on
+# getRecentBlockhash. A failed refresh keeps serving the previous blockhash until it ages out.
+class BlockhashPrefetcher:
+    def __init__(self,
+                 solana,
+                 interval = 1.0,
+                 max_age = 30.0,
+                 commitment = 'confirmed'):
+        self.solana = solana
+        self.interval = interval
+        self.max_age = max_age
+        self.commitment = commitment
+        self.latest = None
+        self.error = None
+        self.ready = threading.Event()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def start(self):
+        if self.thread is None:
+            self.stopped.clear()
+            self.thread = threading.Thread(target=self.run, name='blockhash-prefetcher', daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def update(self, blockhash):
+        # One tuple assignment so readers never see a blockhash paired with another fetch time
+        self.latest = (blockhash, time.monotonic())
+        self.error = None
+        self.ready.set()
+        return blockhash
+
+    def current(self):
+        blockhash, fetched_at = self.latest
+        age = time.monotonic() - fetched_at
+        if age > self.max_age:
+            raise ValueError("Prefetched blockhash is {:.1f}s old, last refresh error: {}".format(age, self.error))
+        return blockhash
+
+    def refresh(self):
+        return self.update(self.solana.getRecentBlockhash(self.commitment))
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                self.error = e
+            self.stopped.wait(self.interval)
+
+    def get(self, timeout = 10.0):
+        if self.latest is None and self.thread is None:
+            return self.refresh()
+        if not self.ready.wait(timeout):
+            raise ValueError("No blockhash fetched within {}s, last refresh error: {}".format(timeout, self.error))
+        return self.current()
+
+# Polls getSignatureStatuses for every sent signature in one background loop and records
+# whether it reached the target commitment, failed on chain or expired
+class SignatureTracker:
+    def __init__(self,
+                 solana,
+                 commitment = 'confirmed',
+                 interval = 0.5,
+                 timeout = 90.0,
+                 max_results = 10000):
+        if commitment not in COMMITMENT_LEVELS:
+            raise ValueError("Unknown commitment {}, expected one of {}".format(commitment, COMMITMENT_LEVELS))
+        self.solana = solana
+        self.commitment_level = COMMITMENT_LEVELS.index(commitment)
+        self.interval = interval
+        self.timeout = timeout
+        self.max_results = max_results
+        self.pending = {}
+        self.results = {}
+        self.condition = threading.Condition()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def start(self):
+        if self.thread is None:
+            self.stopped.clear()
+            self.thread = threading.Thread(target=self.run, name='signature-tracker', daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def track(self,
+              signature,
+              on_status = None):
+        with self.condition:
+            self.pending[signature] = (time.monotonic(), on_status)
+
+    def finish(self,
+               signature,
+               state,
+               slot = None,
+               err = None):
+        with self.condition:
+            entry = self.pending.pop(signature, None)
+            if entry is None:
+                return
+            result = {"status": state, "slot": slot, "err": err}
+            self.results[signature] = result
+            if len(self.results) > self.max_results:
+                self.results.pop(next(iter(self.results)))
+            self.condition.notify_all()
+        _, on_status = entry
+        if on_status is not None:
+            on_status(signature, result)
+
+    def fail(self, signature, err):
+        self.finish(signature, FAILED, err=err)
+
+    def status(self, signature):
+        with self.condition:
+            if signature in self.pending:
+                return {"status": PENDING, "slot": None, "err": None}
+            return self.results.get(signature)
+
+    def reached(self, status):
+        confirmation_status = status.get('confirmationStatus')
+        if confirmation_status is None:
+            # Older nodes omit confirmationStatus, a null confirmations count means the transaction is rooted
+            return status.get('confirmations') is None or self.commitment_level == 0
+        return COMMITMENT_LEVELS.index(confirmation_status) >= self.commitment_level
+
+    def record(self, signatures, statuses):
+        now = time.monotonic()
+        for signature, status in zip(signatures, statuses):
+            if status is not None and status['err'] is not None:
+                self.finish(signature, FAILED, status['slot'], status['err'])
+            elif status is not None and self.reached(status):
+                self.finish(signature, CONFIRMED, status['slot'])
+            else:
+                entry = self.pending.get(signature)
+                if entry is not None and now - entry[0] > self.timeout:
+                    self.finish(signature, EXPIRED)
+
+    def signatureGroups(self):
+        with self.condition:
+            signatures = list(self.pending)
+        return [signatures[i:i + MAX_SIGNATURE_STATUSES] for i in range(0, len(signatures), MAX_SIGNATURE_STATUSES)]
+
+    def poll(self):
+        for signatures in self.signatureGroups():
+            statuses, _ = self.solana.getSignatureStatuses(signatures)
+            self.record(signatures, statuses)
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                self.poll()
+            except Exception:
+                # Status polling is best effort, the next round asks for the same signatures again
+                pass
+            self.stopped.wait(self.interval)
+
+    def wait(self,
+             signature,
+             timeout = None):
+        with self.condition:
+            self.condition.wait_for(lambda: signature not in self.pending, timeout)
+        return self.status(signature)
+
+# Signs with the prefetched blockhash and submits the same wire bytes to every endpoint in
+# parallel. Sends return the signature immediately and confirmation is tracked in the background.
+class TransactionSender:
+    def __init__(self,
+                 endpoints,
+                 blockhashes = None,
+                 tracker = None,
+                 tx_opts = None,
+                 max_workers = None):
+        if not endpoints:
+            raise ValueError("TransactionSender needs at least one endpoint")
+        self.solanas = [WrappedSolana(endpoint) if isinstance(endpoint, str) else endpoint for endpoint in endpoints]
+        self.owned = []
+        if blockhashes is None:
+            blockhashes = BlockhashPrefetcher(self.solanas[0]).start()
+            self.owned.append(blockhashes)
+        if tracker is None:
+            tracker = SignatureTracker(self.solanas[0]).start()
+            self.owned.append(tracker)
+        self.blockhashes = blockhashes
+        self.tracker = tracker
+        # Preflight would make every endpoint simulate the same transaction before forwarding it
+        self.tx_opts = tx_opts or self.solanas[0].buildTransactionOpts(skip_preflight=True)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers or 4 * len(self.solanas),
+                                           thread_name_prefix='transaction-sender')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        for worker in self.owned:
+            worker.stop()
+
+    def sendTransaction(self,
+                        transaction,
+                        signers,
+                        on_status = None):
+        transaction.recent_blockhash = self.blockhashes.get()
+        transaction.sign(*signers)
+        return self.sendRawTransaction(transaction.serialize(), on_status)
+
+    def sendRawTransaction(self,
+                           raw_transaction,
+                           on_status = None):
+        signature = transactionSignature(raw_transaction)
+        self.tracker.track(signature, on_status)
+        errors = []
+        lock = threading.Lock()
+
+        def done(future):
+            error = future.exception()
+            if error is None:
+                return
+            with lock:
+                errors.append(error)
+                rejected = len(errors) == len(self.solanas)
+            if rejected:
+                self.tracker.fail(signature, errors)
+
+        for solana in self.solanas:
+            self.executor.submit(solana.sendRawTransaction, raw_transaction, self.tx_opts).add_done_callback(done)
+        return signature
+
+    def swap(self,
+             template,
+             amount_in,
+             min_amount_out,
+             on_status = None):
+        return self.sendRawTransaction(template.build(amount_in, min_amount_out, self.blockhashes.get()), on_status)
+
+    def status(self, signature):
+        return self.tracker.status(signature)
+
+    def wait(self,
+             signature,
+             timeout = None):
+        return self.tracker.wait(signature, timeout)
+
+class AsyncBlockhashPrefetcher(BlockhashPrefetcher):
+    def __init__(self,
+                 solana,
+                 interval = 1.0,
+                 max_age = 30.0,
+                 commitment = 'confirmed'):
+        BlockhashPrefetcher.__init__(self, solana, interval, max_age, commitment)
+        self.ready = asyncio.Event()
+        self.task = None
+
+    async def __aenter__(self):
+        return self.start()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.stop()
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.ensure_future(self.run())
+        return self
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    async def refresh(self):
+        return self.update(await self.solana.getRecentBlockhash(self.commitment))
+
+    async def run(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                self.error = e
+            await asyncio.sleep(self.interval)
+
+    async def get(self, timeout = 10.0):
+        if self.latest is None and self.task is None:
+            return await self.refresh()
+        try:
+            await asyncio.wait_for(self.ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            raise ValueError("No blockhash fetched within {}s, last refresh error: {}".format(timeout, self.error))
+        return self.current()
+
+class AsyncSignatureTracker(SignatureTracker):
+    def __init__(self,
+                 solana,
+                 commitment = 'confirmed',
+                 interval = 0.5,
+                 timeout = 90.0,
+                 max_results = 10000):
+        SignatureTracker.__init__(self, solana, commitment, interval, timeout, max_results)
+        self.events = {}
+        self.task = None
+
+    async def __aenter__(self):
+        return self.start()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.stop()
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.ensure_future(self.run())
+        return self
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    def track(self,
+              signature,
+              on_status = None):
+        SignatureTracker.track(self, signature, on_status)
+        self.events[signature] = asyncio.Event()
+
+    def finish(self,
+               signature,
+               state,
+               slot = None,
+               err = None):
+        SignatureTracker.finish(self, signature, state, slot, err)
+        event = self.events.pop(signature, None)
+        if event is not None:
+            event.set()
+
+    async def poll(self):
+        groups = self.signatureGroups()
+        responses = await asyncio.gather(*[self.solana.getSignatureStatuses(signatures) for signatures in groups])
+        for signatures, (statuses, _) in zip(groups, responses):
+            self.record(signatures, statuses)
+
+    async def run(self):
+        while True:
+            try:
+                await self.poll()
+            except Exception:
+                pass
+            await asyncio.sleep(self.interval)
+
+    async def wait(self,
+                   signature,
+                   timeout = None):
+        event = self.events.get(signature)
+        if event is not None:
+            try:
+                await asyncio.wait_for(event.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.status(signature)
+
+class AsyncTransactionSender(TransactionSender):
+    # Workers are tasks on the running loop, so senders are built with `await AsyncTransactionSender.create(...)`
+    def __init__(self,
+                 endpoints,
+                 blockhashes,
+                 tracker,
+                 tx_opts = None):
+        if not endpoints:
+            raise ValueError("AsyncTransactionSender needs at least one endpoint")
+        self.solanas = [AsyncWrappedSolana(endpoint) if isinstance(endpoint, str) else endpoint for endpoint in endpoints]
+        # Connections opened here from endpoint urls are closed with the sender
+        self.owned_solanas = [solana for solana, endpoint in zip(self.solanas, endpoints) if isinstance(endpoint, str)]
+        self.owned = []
+        self.blockhashes = blockhashes
+        self.tracker = tracker
+        self.tx_opts = tx_opts or self.solanas[0].buildTransactionOpts(skip_preflight=True)
+        self.tasks = set()
+
+    @classmethod
+    async def create(cls,
+                     endpoints,
+                     blockhashes = None,
+                     tracker = None,
+                     tx_opts = None):
+        self = cls(endpoints, blockhashes, tracker, tx_opts)
+        if self.blockhashes is None:
+            self.blockhashes = AsyncBlockhashPrefetcher(self.solanas[0]).start()
+            self.owned.append(self.blockhashes)
+        if self.tracker is None:
+            self.tracker = AsyncSignatureTracker(self.solanas[0]).start()
+            self.owned.append(self.tracker)
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def close(self):
+        for task in list(self.tasks):
+            task.cancel()
+        for worker in self.owned:
+            await worker.stop()
+        for solana in self.owned_solanas:
+            await solana.close()
+
+    async def submit(self,
+                     signature,
+                     raw_transaction):
+        results = await asyncio.gather(*[solana.sendRawTransaction(raw_transaction, self.tx_opts) for solana in self.solanas],
+                                       return_exceptions=True)
+        errors = [result for result in results if isinstance(result, Exception)]
+        if len(errors) == len(self.solanas):
+            self.tracker.fail(signature, errors)
+
+    async def sendTransaction(self,
+                              transaction,
+                              signers,
+                              on_status = None):
+        transaction.recent_blockhash = await self.blockhashes.get()
+        transaction.sign(*signers)
+        return self.sendRawTransaction(transaction.serialize(), on_status)
+
+    def sendRawTransaction(self,
+                           raw_transaction,
+                           on_status = None):
+        signature = transactionSignature(raw_transaction)
+        self.tracker.track(signature, on_status)
+        # The loop only holds weak references to tasks, so in-flight sends are kept here until done
+        task = asyncio.ensure_future(self.submit(signature, raw_transaction))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return signature
+
+    async def swap(self,
+                   template,
+                   amount_in,
+                   min_amount_out,
+                   on_status = None):
+        return self.sendRawTransaction(template.build(amount_in, min_amount_out, await self.blockhashes.get()), on_status)
+
+    async def wait(self,
+                   signature,
+                   timeout = None):
+        return await self.tracker.wait(signature, timeout)
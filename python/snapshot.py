@@ -0,0 +1,54 @@
+MAX_MULTIPLE_ACCOUNTS = 100
+
+class ReserveSnapshotter:
+    def __init__(self,
+                 solana,
+                 pools,
+                 max_accounts = MAX_MULTIPLE_ACCOUNTS,
+                 max_retries = 3,
+                 cache = None):
+        self.solana = solana
+        self.cache = cache
+        self.pools = list(pools)
+        self.max_retries = max_retries
+        # A pool's accounts always land in the same request so each pool decodes from one response.
+        # Pools of any DEX mix freely, each lists its own accounts through reserveAccounts.
+        self.pool_groups = []
+        self.account_groups = []
+        for pool in self.pools:
+            accounts = pool.reserveAccounts()
+            if not self.pool_groups or len(self.account_groups[-1]) + len(accounts) > max_accounts:
+                self.pool_groups.append([])
+                self.account_groups.append([])
+            self.pool_groups[-1].append(pool)
+            self.account_groups[-1].extend(accounts)
+
+    def fetch(self):
+        return self.fetchAtSlot(lambda: self.solana.getMultipleAccountsDataBatch(self.account_groups))
+
+    def fetchAtSlot(self, read):
+        for _ in range(self.max_retries + 1):
+            results = read()
+            slots = set(slot for _, slot in results)
+            if len(slots) == 1:
+                return results, slots.pop()
+        raise ValueError("Could not fetch {} pools at a single slot, got slots {}".format(len(self.pools), sorted(slots)))
+
+    def getReserves(self):
+        if not self.pools:
+            return ({}, None)
+        results, slot = self.fetch()
+        snapshot = {}
+        for pools, (account_datas, _) in zip(self.pool_groups, results):
+            start = 0
+            for pool in pools:
+                end = start + len(pool.reserveAccounts())
+                pool_datas = account_datas[start:end]
+                start = end
+                # The reserve cache decodes Raydium accounts incrementally, other pools decode in full
+                if self.cache is not None and self.cache.supports(pool):
+                    reserves, fees, _, _ = self.cache.update(pool, pool_datas, slot)
+                else:
+                    reserves, fees, _ = pool.parsePoolReserves(pool_datas, slot)
+                snapshot[pool] = (reserves, fees)
+        return (snapshot, slot)
@@ -1,9 +1,8 @@
 import base64
 from construct.core import ConstError
 from decimal import Decimal
+import importlib
 import json
-import requests
-from requests.exceptions import ReadTimeout
 import struct
 import sys
 import time
@@ -16,31 +15,166 @@ from layout import (ACCOUNT_LAYOUT,
                      RAYDIUM_SWAP_INSTRUCTION_IDX,
                      MARKET_STATE_LAYOUT_V2,
                      LIQUIDITY_POOL_PROGRAM_ID_V4)
+from encoding import (BASE64_ENCODING,
+                      ZSTD_AVAILABLE,
+                      ZSTD_ENCODING,
+                      decodeAccountData)
+from jsonstream import JsonArrayStream
+from metrics import (NULL_METRICS,
+                     accountSize,
+                     accountsSize,
+                     asyncInstrumented,
+                     batchSize,
+                     batchSlot,
+                     bytesBatchSize,
+                     contextSlot,
+                     instrumented,
+                     programAccountsSize)
+from pda import (CREATE_PROGRAM_ADDRESS,
+                 DEFAULT_PROGRAM_ADDRESS_CACHE,
+                 FIND_PROGRAM_ADDRESS,
+                 deriveProgramAddress,
+                 programAddressKey)
+from transport import (HEADERS,
+                       MultipleAccountsRequest,
+                       RawTransport,
+                       loads)
 
-from solana.rpc.api import Client
-from solders.rpc.filter import Memcmp
-from solana.system_program import create_account, CreateAccountParams, transfer, TransferParams
-from solana.transaction import AccountMeta, Keypair, Transaction, TransactionInstruction
-from spl.token.instructions import (close_account,
-                                    create_associated_token_account,
-                                    initialize_account,
-                                    transfer_checked)
-from spl.token.instructions import (ASSOCIATED_TOKEN_PROGRAM_ID,
-                                    CloseAccountParams,
-                                    InitializeAccountParams,
-                                    TransferCheckedParams)
 from solana.publickey import PublicKey
 from solana.rpc.types import TxOpts, MemcmpOpts, TokenAccountOpts, DataSliceOpts
 from spl.token.constants import TOKEN_PROGRAM_ID, WRAPPED_SOL_MINT
 
+STREAM_CHUNK_SIZE = 1 << 16
+# Re-exported names whose modules are only imported on first use, see __getattr__. The
+# solana-py clients, HTTP libraries and transaction builders are most of the import time,
+# and watching reserves over the raw transport needs none of them.
+LAZY_IMPORTS = {'ReadTimeout': 'requests.exceptions',
+                'Client': 'solana.rpc.api',
+                'AsyncClient': 'solana.rpc.async_api',
+                'Memcmp': 'solders.rpc.filter',
+                'create_account': 'solana.system_program',
+                'CreateAccountParams': 'solana.system_program',
+                'transfer': 'solana.system_program',
+                'TransferParams': 'solana.system_program',
+                'AccountMeta': 'solana.transaction',
+                'Keypair': 'solana.transaction',
+                'Transaction': 'solana.transaction',
+                'TransactionInstruction': 'solana.transaction',
+                'close_account': 'spl.token.instructions',
+                'create_associated_token_account': 'spl.token.instructions',
+                'initialize_account': 'spl.token.instructions',
+                'transfer_checked': 'spl.token.instructions',
+                'ASSOCIATED_TOKEN_PROGRAM_ID': 'spl.token.instructions',
+                'CloseAccountParams': 'spl.token.instructions',
+                'InitializeAccountParams': 'spl.token.instructions',
+                'TransferCheckedParams': 'spl.token.instructions'}
+
+def __getattr__(name):
+    module = LAZY_IMPORTS.get(name)
+    if module is None:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    value = getattr(importlib.import_module(module), name)
+    globals()[name] = value
+    return value
+
+def programAccountsRequest(address,
+                           commitment,
+                           encoding,
+                           data_slice,
+                           data_size,
+                           memcmp_opts):
+    config = {"encoding": encoding, "commitment": commitment}
+    filters = []
+    if data_size is not None:
+        filters.append({"dataSize": data_size})
+    for opts in memcmp_opts or []:
+        filters.append({"memcmp": {"offset": opts.offset, "bytes": str(opts.bytes)}})
+    if filters:
+        config["filters"] = filters
+    if data_slice is not None:
+        config["dataSlice"] = {"offset": data_slice.offset, "length": data_slice.length}
+    return {"jsonrpc": "2.0", "id": 1, "method": "getProgramAccounts", "params": [str(address), config]}
+
+def programAccounts(elements,
+                    select,
+                    decode):
+    for element in elements:
+        pubkey = element['pubkey']
+        data = decodeAccountData(element['account']['data'])
+        if select is not None and not select(pubkey, data):
+            continue
+        yield (pubkey, decode(data) if decode is not None else data)
+
+def responseFailed(response):
+    # A JSON-RPC batch fails if any of its entries does
+    if isinstance(response, list):
+        return any('error' in item for item in response)
+    return 'error' in response
+
 class WrappedSolana:
-    def __init__(self, url: str):
+    # Hooks for RPC and pipeline stage timings, see instrument
+    metrics = NULL_METRICS
+    # Derived program addresses, see useProgramAddressCache
+    program_addresses = DEFAULT_PROGRAM_ADDRESS_CACHE
+    # Encoding account data is requested in. base64+zstd shrinks mostly zero account data several
+    # times over, nodes that reject it are dropped back to base64 by accountResponse.
+    account_encoding = ZSTD_ENCODING if ZSTD_AVAILABLE else BASE64_ENCODING
+    # Keep-alive connection for getMultipleAccountsBytes, see rawTransport
+    transport = None
+
+    def __init__(self, url: str, timeout = 300):
         self.node_url = url
-        self.connection = Client(url, timeout=300)
-        
+        self.timeout = timeout
+
+    def __getattr__(self, name):
+        # The solana-py client is built the first time a call goes through it
+        if name != 'connection':
+            raise AttributeError("{} has no attribute {!r}".format(type(self).__name__, name))
+        self.connection = self.createConnection()
+        return self.connection
+
+    def createConnection(self):
+        from solana.rpc.api import Client
+        return Client(self.node_url, timeout=self.timeout)
+
+    def instrument(self, metrics):
+        self.metrics = metrics
+        return metrics
+
+    def useProgramAddressCache(self, cache):
+        self.program_addresses = cache
+        return cache
+
+    def useAccountEncoding(self, encoding):
+        self.account_encoding = encoding
+        return encoding
+
+    def rawTransport(self):
+        # Created on first use, so clients that never poll through it open no extra connection
+        if self.transport is None:
+            self.transport = RawTransport(self.node_url, self.timeout)
+        return self.transport
+
+    def accountResponse(self,
+                        request,
+                        encoding = None):
+        # request(encoding) makes the RPC call. An encoding the caller asked for is requested
+        # as is. Otherwise the negotiated one is used, and if the node fails base64+zstd it is
+        # asked again in base64, which is kept for later requests only once that has worked.
+        if encoding is not None:
+            return request(encoding)
+        encoding = self.account_encoding
+        response = request(encoding)
+        if encoding == ZSTD_ENCODING and responseFailed(response):
+            response = request(BASE64_ENCODING)
+            if not responseFailed(response):
+                self.account_encoding = BASE64_ENCODING
+        return response
+
     def publicKey(self, address):
         return PublicKey(address)
 
+    @instrumented('sendTransaction')
     def sendTransaction(self,
                         transaction,
                         signers,
@@ -51,13 +185,40 @@ class WrappedSolana:
         signature = response['result']
         return signature
 
+    @instrumented('sendRawTransaction')
+    def sendRawTransaction(self,
+                           raw_transaction,
+                           tx_opts = None):
+        if not tx_opts:
+            tx_opts = self.buildTransactionOpts()
+        response = self.connection.send_raw_transaction(raw_transaction, opts=tx_opts)
+        return response['result']
+
+    @instrumented('getRecentBlockhash')
+    def getRecentBlockhash(self, commitment = 'finalized'):
+        result = self.connection.get_recent_blockhash(commitment)['result']
+        return result['value']['blockhash']
+
+    @instrumented('getSignatureStatuses', slot_of=contextSlot)
+    def getSignatureStatuses(self, signatures):
+        result = self.connection.get_signature_statuses(signatures)['result']
+        return (result['value'], result['context']['slot'])
+
+    @instrumented('getSlot', slot_of=lambda slot: slot)
+    def getSlot(self, commitment = 'confirmed'):
+        return self.connection.get_slot(commitment)['result']
+
     def buildTransactionOpts(self,
                              skip_confirmation = True,
                              skip_preflight = False,
                              preflight_commitment = 'finalized',
                              max_retries = None):
+        # TxOpts in the pinned solana-py has no max_retries field, so it is only passed when asked for
+        if max_retries is None:
+            return TxOpts(skip_confirmation=skip_confirmation, skip_preflight=skip_preflight, preflight_commitment=preflight_commitment)
         return TxOpts(skip_confirmation=skip_confirmation, skip_preflight=skip_preflight, preflight_commitment=preflight_commitment, max_retries=max_retries)
 
+    @instrumented('getProgramAccounts', size_of=programAccountsSize)
     def getProgramAccounts(self,
                            address,
                            commitment = 'finalized',
@@ -65,37 +226,176 @@ class WrappedSolana:
                            data_slice = None,
                            data_size = None,
                            memcmp_opts = None):
-        return self.connection.get_program_accounts(address,
-                                                    commitment=commitment,
-                                                    encoding=encoding,
-                                                    data_slice=data_slice,
-                                                    data_size=data_size,
-                                                    memcmp_opts=memcmp_opts)['result']
+        # Without an encoding the negotiated one is used, for callers decoding through decodeAccountData
+        response = self.accountResponse(lambda encoding: self.connection.get_program_accounts(address,
+                                                                                               commitment=commitment,
+                                                                                               encoding=encoding,
+                                                                                               data_slice=data_slice,
+                                                                                               data_size=data_size,
+                                                                                               memcmp_opts=memcmp_opts),
+                                        encoding)
+        return response['result']
     
-    def getAccountInfo(self, account):
-        result = self.connection.get_account_info(account)['result']
+    def iterProgramAccounts(self,
+                            address,
+                            commitment = 'finalized',
+                            data_slice = None,
+                            data_size = None,
+                            memcmp_opts = None,
+                            select = None,
+                            decode = None,
+                            chunk_size = STREAM_CHUNK_SIZE):
+        # Yields (pubkey, data) for each account while the response is still downloading, so memory
+        # stays flat however large the program is. data is the raw bytes, or decode(data) for the
+        # accounts select(pubkey, raw bytes) keeps when those are given.
+        encoding = self.account_encoding
+        stream = JsonArrayStream()
+        try:
+            yield from self.streamProgramAccounts(stream,
+                                                  programAccountsRequest(address, commitment, encoding, data_slice, data_size, memcmp_opts),
+                                                  select,
+                                                  decode,
+                                                  chunk_size)
+        except ValueError:
+            # An error member comes instead of the result array, so nothing was yielded yet
+            if encoding != ZSTD_ENCODING or stream.error is None:
+                raise
+            yield from self.streamProgramAccounts(JsonArrayStream(),
+                                                  programAccountsRequest(address, commitment, BASE64_ENCODING, data_slice, data_size, memcmp_opts),
+                                                  select,
+                                                  decode,
+                                                  chunk_size)
+            self.account_encoding = BASE64_ENCODING
+
+    def streamProgramAccounts(self,
+                              stream,
+                              payload,
+                              select,
+                              decode,
+                              chunk_size):
+        start = self.metrics.start()
+        size = 0
+        import requests
+        with requests.post(self.node_url, json=payload, stream=True, timeout=self.timeout) as response:
+            response.raise_for_status()
+            for chunk in response.iter_content(chunk_size):
+                size += len(chunk)
+                yield from programAccounts(stream.feed(chunk), select, decode)
+            yield from programAccounts(stream.close(), select, decode)
+        if self.metrics.enabled:
+            self.metrics.request(self.node_url, 'iterProgramAccounts', self.metrics.start() - start, None, size)
+
+    @instrumented('getAccountInfo', slot_of=contextSlot, size_of=accountSize)
+    def getAccountInfo(self,
+                       account,
+                       encoding = None):
+        response = self.accountResponse(lambda encoding: self.connection.get_account_info(account, encoding=encoding), encoding)
+        result = response['result']
         return (result['value'], result['context']['slot'])
     
     def getAccountData(self, account):
         account_info, slot = self.getAccountInfo(account)
         return (account_info['data'], slot)
     
-    def getMultipleAccounts(self, accounts):
-        result = self.connection.get_multiple_accounts(accounts)['result']
+    @instrumented('getMultipleAccounts', slot_of=contextSlot, size_of=accountsSize)
+    def getMultipleAccounts(self,
+                            accounts,
+                            commitment = None,
+                            encoding = None):
+        response = self.accountResponse(lambda encoding: self.connection.get_multiple_accounts(accounts, commitment, encoding=encoding), encoding)
+        result = response['result']
         slot = result['context']['slot']
         account_infos = result['value']
         return (account_infos, slot)
     
-    def getMultipleAccountsData(self, accounts):
-        account_infos, slot = self.getMultipleAccounts(accounts)
+    def getMultipleAccountsData(self,
+                                accounts,
+                                commitment = None):
+        account_infos, slot = self.getMultipleAccounts(accounts, commitment)
         account_datas = [account_info['data'] for account_info in account_infos]
         return account_datas, slot
     
+    @instrumented('getMultipleAccountsDataBatch', slot_of=batchSlot, size_of=batchSize)
+    def getMultipleAccountsDataBatch(self, account_groups):
+        # Sends one getMultipleAccounts per group inside a single JSON-RPC batch request,
+        # so all groups cost one round-trip and are served back to back by the node
+        import requests
+
+        def request(encoding):
+            payload = [{"jsonrpc": "2.0",
+                        "id": i,
+                        "method": "getMultipleAccounts",
+                        "params": [[str(account) for account in accounts], {"encoding": encoding}]}
+                       for i, accounts in enumerate(account_groups)]
+            response = requests.post(self.node_url, json=payload, timeout=self.timeout)
+            response.raise_for_status()
+            return response.json()
+
+        results = [None] * len(account_groups)
+        for item in self.accountResponse(request):
+            if 'error' in item:
+                raise ValueError("getMultipleAccounts batch entry {} failed: {}".format(item['id'], item['error']))
+            result = item['result']
+            account_datas = [account_info['data'] if account_info else None for account_info in result['value']]
+            results[item['id']] = (account_datas, result['context']['slot'])
+        return results
+
+    def multipleAccountsRequest(self,
+                                account_groups,
+                                commitment = None):
+        return MultipleAccountsRequest(account_groups, commitment)
+
+    @instrumented('getMultipleAccountsBytes', slot_of=batchSlot, size_of=bytesBatchSize)
+    def getMultipleAccountsBytes(self, request):
+        # getMultipleAccountsDataBatch for a prepared MultipleAccountsRequest, sent over the raw
+        # transport instead of the solana-py client. Returns (account bytes, slot) per group.
+        transport = self.rawTransport()
+        return request.parse(self.accountResponse(lambda encoding: transport.call(request.body(encoding))))
+    
     def findProgramAddress(self, seeds, program_id):
-        return PublicKey.find_program_address(seeds, self.publicKey(program_id))[0]
+        program_id = self.publicKey(program_id)
+        key = programAddressKey(FIND_PROGRAM_ADDRESS, seeds, program_id)
+        entry = self.program_addresses.get(key)
+        if entry is not None:
+            return PublicKey(entry[0])
+        address, nonce = PublicKey.find_program_address(seeds, program_id)
+        self.program_addresses.put(key, bytes(address), nonce)
+        return address
     
+    def findProgramAddresses(self,
+                             derivations,
+                             executor = None):
+        # derivations are (seeds, program id) pairs. Uncached ones are derived together,
+        # through executor.map when given, a process pool spreads the hashing over all cores.
+        keys = [programAddressKey(FIND_PROGRAM_ADDRESS, seeds, self.publicKey(program_id)) for seeds, program_id in derivations]
+        addresses = {}
+        missing = {}
+        for key, (seeds, program_id) in zip(keys, derivations):
+            if key in addresses or key in missing:
+                continue
+            entry = self.program_addresses.get(key)
+            if entry is None:
+                missing[key] = ([bytes(seed) for seed in seeds], bytes(self.publicKey(program_id)))
+            else:
+                addresses[key] = entry[0]
+        if missing:
+            derive = executor.map if executor is not None else map
+            derived = list(derive(deriveProgramAddress,
+                                  [seeds for seeds, _ in missing.values()],
+                                  [program_id for _, program_id in missing.values()]))
+            self.program_addresses.putMany([(key, address, nonce) for key, (address, nonce) in zip(missing, derived)])
+            addresses.update((key, address) for key, (address, _) in zip(missing, derived))
+        return [PublicKey(addresses[key]) for key in keys]
+
     def createProgramAddress(self, seeds, program_id):
-        return PublicKey.create_program_address(seeds, program_id)
+        key = programAddressKey(CREATE_PROGRAM_ADDRESS, seeds, program_id)
+        entry = self.program_addresses.get(key)
+        if entry is not None:
+            return PublicKey(entry[0])
+        # Seeds that land on the curve raise and are not cached
+        address = PublicKey.create_program_address(seeds, program_id)
+        self.program_addresses.put(key, bytes(address))
+        return address
     
     def getProgramAddress(self,
                           program_id,
@@ -109,3 +409,182 @@ class WrappedSolana:
         ]
         return self.findProgramAddress(seeds, program_id)
 
+class AsyncWrappedSolana(WrappedSolana):
+    def __init__(self,
+                 url: str,
+                 max_connections = 100,
+                 max_keepalive_connections = 20,
+                 timeout = 300):
+        import httpx
+        from solana.rpc.async_api import AsyncClient
+        self.node_url = url
+        self.timeout = timeout
+        self.connection = AsyncClient(url, timeout=timeout)
+        # Replace the provider session with one sized for many concurrent pool polls.
+        # The session keeps connections alive so repeated calls skip the TCP/TLS handshake.
+        self.connection._provider.session = httpx.AsyncClient(timeout=timeout,
+                                                              limits=httpx.Limits(max_connections=max_connections,
+                                                                                  max_keepalive_connections=max_keepalive_connections))
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def close(self):
+        await self.connection.close()
+
+    async def accountResponse(self,
+                              request,
+                              encoding = None):
+        if encoding is not None:
+            return await request(encoding)
+        encoding = self.account_encoding
+        response = await request(encoding)
+        if encoding == ZSTD_ENCODING and responseFailed(response):
+            response = await request(BASE64_ENCODING)
+            if not responseFailed(response):
+                self.account_encoding = BASE64_ENCODING
+        return response
+
+    @asyncInstrumented('sendTransaction')
+    async def sendTransaction(self,
+                              transaction,
+                              signers,
+                              tx_opts = None):
+        if not tx_opts:
+            tx_opts = self.buildTransactionOpts()
+        response = await self.connection.send_transaction(transaction, *signers, opts=tx_opts)
+        signature = response['result']
+        return signature
+
+    @asyncInstrumented('sendRawTransaction')
+    async def sendRawTransaction(self,
+                                 raw_transaction,
+                                 tx_opts = None):
+        if not tx_opts:
+            tx_opts = self.buildTransactionOpts()
+        response = await self.connection.send_raw_transaction(raw_transaction, opts=tx_opts)
+        return response['result']
+
+    @asyncInstrumented('getRecentBlockhash')
+    async def getRecentBlockhash(self, commitment = 'finalized'):
+        result = (await self.connection.get_recent_blockhash(commitment))['result']
+        return result['value']['blockhash']
+
+    @asyncInstrumented('getSignatureStatuses', slot_of=contextSlot)
+    async def getSignatureStatuses(self, signatures):
+        result = (await self.connection.get_signature_statuses(signatures))['result']
+        return (result['value'], result['context']['slot'])
+
+    @asyncInstrumented('getSlot', slot_of=lambda slot: slot)
+    async def getSlot(self, commitment = 'confirmed'):
+        return (await self.connection.get_slot(commitment))['result']
+
+    @asyncInstrumented('getProgramAccounts', size_of=programAccountsSize)
+    async def getProgramAccounts(self,
+                                 address,
+                                 commitment = 'finalized',
+                                 encoding = None,
+                                 data_slice = None,
+                                 data_size = None,
+                                 memcmp_opts = None):
+        response = await self.accountResponse(lambda encoding: self.connection.get_program_accounts(address,
+                                                                                                     commitment=commitment,
+                                                                                                     encoding=encoding,
+                                                                                                     data_slice=data_slice,
+                                                                                                     data_size=data_size,
+                                                                                                     memcmp_opts=memcmp_opts),
+                                              encoding)
+        return response['result']
+
+    async def iterProgramAccounts(self,
+                                  address,
+                                  commitment = 'finalized',
+                                  data_slice = None,
+                                  data_size = None,
+                                  memcmp_opts = None,
+                                  select = None,
+                                  decode = None,
+                                  chunk_size = STREAM_CHUNK_SIZE):
+        encoding = self.account_encoding
+        stream = JsonArrayStream()
+        try:
+            async for account in self.streamProgramAccounts(stream,
+                                                            programAccountsRequest(address, commitment, encoding, data_slice, data_size, memcmp_opts),
+                                                            select,
+                                                            decode,
+                                                            chunk_size):
+                yield account
+        except ValueError:
+            if encoding != ZSTD_ENCODING or stream.error is None:
+                raise
+            async for account in self.streamProgramAccounts(JsonArrayStream(),
+                                                            programAccountsRequest(address, commitment, BASE64_ENCODING, data_slice, data_size, memcmp_opts),
+                                                            select,
+                                                            decode,
+                                                            chunk_size):
+                yield account
+            self.account_encoding = BASE64_ENCODING
+
+    async def streamProgramAccounts(self,
+                                    stream,
+                                    payload,
+                                    select,
+                                    decode,
+                                    chunk_size):
+        start = self.metrics.start()
+        size = 0
+        async with self.connection._provider.session.stream('POST', self.node_url, json=payload) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes(chunk_size):
+                size += len(chunk)
+                for account in programAccounts(stream.feed(chunk), select, decode):
+                    yield account
+            for account in programAccounts(stream.close(), select, decode):
+                yield account
+        if self.metrics.enabled:
+            self.metrics.request(self.node_url, 'iterProgramAccounts', self.metrics.start() - start, None, size)
+
+    @asyncInstrumented('getAccountInfo', slot_of=contextSlot, size_of=accountSize)
+    async def getAccountInfo(self,
+                             account,
+                             encoding = None):
+        response = await self.accountResponse(lambda encoding: self.connection.get_account_info(account, encoding=encoding), encoding)
+        result = response['result']
+        return (result['value'], result['context']['slot'])
+
+    async def getAccountData(self, account):
+        account_info, slot = await self.getAccountInfo(account)
+        return (account_info['data'], slot)
+
+    @asyncInstrumented('getMultipleAccounts', slot_of=contextSlot, size_of=accountsSize)
+    async def getMultipleAccounts(self,
+                                  accounts,
+                                  commitment = None,
+                                  encoding = None):
+        response = await self.accountResponse(lambda encoding: self.connection.get_multiple_accounts(accounts, commitment, encoding=encoding), encoding)
+        result = response['result']
+        slot = result['context']['slot']
+        account_infos = result['value']
+        return (account_infos, slot)
+
+    async def getMultipleAccountsData(self,
+                                      accounts,
+                                      commitment = None):
+        account_infos, slot = await self.getMultipleAccounts(accounts, commitment)
+        account_datas = [account_info['data'] for account_info in account_infos]
+        return account_datas, slot
+
+    @asyncInstrumented('getMultipleAccountsBytes', slot_of=batchSlot, size_of=bytesBatchSize)
+    async def getMultipleAccountsBytes(self, request):
+        # The provider session already keeps connections alive, only the client is bypassed
+        session = self.connection._provider.session
+
+        async def call(encoding):
+            response = await session.post(self.node_url, content=request.body(encoding), headers=HEADERS)
+            response.raise_for_status()
+            return loads(response.content)
+
+        return request.parse(await self.accountResponse(call))
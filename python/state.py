@@ -0,0 +1,105 @@
+from decimal import Decimal
+
+from decoder import (unpackAmmReserveFields,
+                     unpackOpenOrdersTotals,
+                     unpackTokenAmount)
+from encoding import decodeAccountData
+
+AMM_ACCOUNT = 0
+COIN_VAULT_ACCOUNT = 1
+PC_VAULT_ACCOUNT = 2
+OPEN_ORDERS_ACCOUNT = 3
+
+DECODERS = [unpackAmmReserveFields,
+            unpackTokenAmount,
+            unpackTokenAmount,
+            unpackOpenOrdersTotals]
+
+class PoolState:
+    def __init__(self, pool):
+        self.pool = pool
+        self.accounts = [pool.pool_info["id"],
+                         pool.pool_coin_token_account,
+                         pool.pool_pc_token_account,
+                         pool.amm_open_orders_account]
+        self.raw = [None] * len(self.accounts)
+        self.decoded = [None] * len(self.accounts)
+        self.slots = [0] * len(self.accounts)
+        self.reserves = None
+        self.fees = None
+        self.decimal_fees = None
+        self.slot = 0
+        self.changed_slot = 0
+
+    def updateAccount(self, index, data, slot):
+        if slot < self.slots[index]:
+            return False
+        self.slots[index] = slot
+        d, encoding = data
+        # The encoded string is compared as-is, unchanged accounts skip base64, zstd and struct decoding entirely
+        if d == self.raw[index]:
+            return False
+        self.pool.verifyEncoding(self.accounts[index], encoding)
+        self.raw[index] = d
+        self.decoded[index] = DECODERS[index](decodeAccountData(data))
+        return True
+
+    def update(self, account_datas, slot):
+        changed = False
+        for index, data in enumerate(account_datas):
+            changed = self.updateAccount(index, data, slot) or changed
+        self.slot = max(self.slot, slot)
+        if not changed or any(decoded is None for decoded in self.decoded):
+            return False
+        need_take_pnl_coin, need_take_pnl_pc, swap_fee_numerator, swap_fee_denominator = self.decoded[AMM_ACCOUNT]
+        pool_coin, = self.decoded[COIN_VAULT_ACCOUNT]
+        pool_pc, = self.decoded[PC_VAULT_ACCOUNT]
+        base_token_total, quote_token_total = self.decoded[OPEN_ORDERS_ACCOUNT]
+        reserves = [pool_pc + quote_token_total - need_take_pnl_pc,
+                    pool_coin + base_token_total - need_take_pnl_coin]
+        fees = (swap_fee_denominator, swap_fee_numerator)
+        if reserves == self.reserves and fees == self.fees:
+            return False
+        if fees != self.fees:
+            self.fees = fees
+            self.decimal_fees = (Decimal(swap_fee_denominator), Decimal(swap_fee_numerator))
+        self.reserves = reserves
+        self.changed_slot = slot
+        return True
+
+# Per-pool reserve state that keeps the last raw account data and only re-decodes and
+# recomputes totals for accounts whose bytes moved since the previous poll
+class ReserveCache:
+    def __init__(self):
+        self.states = {}
+
+    def state(self, pool):
+        state = self.states.get(pool)
+        if state is None:
+            state = PoolState(pool)
+            self.states[pool] = state
+        return state
+
+    def supports(self, pool):
+        # PoolState decodes the Raydium AMM, vault and open orders accounts
+        return hasattr(pool, 'amm_open_orders_account') and not getattr(pool, 'include_book', False)
+
+    def update(self, pool, account_datas, slot):
+        state = self.state(pool)
+        changed = state.update(account_datas, slot)
+        return (state.reserves, state.decimal_fees, state.slot, changed)
+
+    def poll(self, pool):
+        state = self.state(pool)
+        account_datas, slot = pool.solana.getMultipleAccountsData(state.accounts)
+        return self.update(pool, account_datas, slot)
+
+    def getReserves(self, pool):
+        state = self.states[pool]
+        return (state.reserves, state.decimal_fees, state.slot)
+
+    def changedSince(self, slot):
+        return [pool for pool, state in self.states.items() if state.changed_slot > slot]
+
+    def changedSlot(self, pool):
+        return self.states[pool].changed_slot
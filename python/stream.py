@@ -0,0 +1,145 @@
+import asyncio
+from decimal import Decimal
+import json
+from urllib.parse import urlparse
+
+from websockets import connect
+from websockets.exceptions import ConnectionClosed
+
+from decoder import decodeReserves
+from encoding import decodeAccountData
+from raydium import AsyncRaydiumApi
+
+def websocketUrl(node_url):
+    # Solana nodes serve websockets on the RPC port + 1 unless a proxy fronts both on one port
+    url = urlparse(node_url)
+    scheme = 'wss' if url.scheme == 'https' else 'ws'
+    netloc = url.netloc
+    if url.port is not None:
+        netloc = '{}:{}'.format(url.hostname, url.port + 1)
+    return '{}://{}{}'.format(scheme, netloc, url.path)
+
+class ReserveStream:
+    def __init__(self,
+                 pool,
+                 ws_url = None,
+                 commitment = 'confirmed',
+                 reconnect = True,
+                 reconnect_delay = 0.5,
+                 max_reconnect_delay = 30.0):
+        self.pool = pool
+        self.ws_url = ws_url if ws_url else websocketUrl(pool.solana.node_url)
+        self.commitment = commitment
+        self.reconnect = reconnect
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.accounts = [pool.pool_info["id"],
+                         pool.pool_coin_token_account,
+                         pool.pool_pc_token_account,
+                         pool.amm_open_orders_account]
+        self.datas = [None] * len(self.accounts)
+        self.slots = [0] * len(self.accounts)
+        self.last = None
+
+    def __aiter__(self):
+        return self.stream()
+
+    async def fetchAccounts(self):
+        # Seeded at the subscription commitment, so every account state comes from the same level
+        if isinstance(self.pool, AsyncRaydiumApi):
+            return await self.pool.solana.getMultipleAccountsData(self.accounts, self.commitment)
+        return await asyncio.to_thread(self.pool.solana.getMultipleAccountsData, self.accounts, self.commitment)
+
+    def update(self, index, data, slot):
+        _, encoding = data
+        self.pool.verifyEncoding(self.accounts[index], encoding)
+        # Notifications can race the initial fetch, never let an older slot overwrite newer state
+        if slot < self.slots[index]:
+            return None
+        self.datas[index] = decodeAccountData(data)
+        self.slots[index] = slot
+        if any(data is None for data in self.datas):
+            return None
+        total_pc, total_coin, swap_fee_denominator, swap_fee_numerator = decodeReserves(*self.datas)
+        current = (total_pc, total_coin, swap_fee_denominator, swap_fee_numerator)
+        if current == self.last:
+            return None
+        self.last = current
+        return ([total_pc, total_coin], (Decimal(swap_fee_denominator), Decimal(swap_fee_numerator)), max(self.slots))
+
+    async def subscribe(self, websocket):
+        # Raw JSON-RPC keeps notification handling to a single json.loads per message
+        requests = [{"jsonrpc": "2.0",
+                     "id": index,
+                     "method": "accountSubscribe",
+                     "params": [str(account), {"encoding": "base64", "commitment": self.commitment}]}
+                    for index, account in enumerate(self.accounts)]
+        for request in requests:
+            await websocket.send(json.dumps(request))
+        subscriptions = {}
+        # Notifications for the first accounts can arrive before the later acknowledgements,
+        # they are kept and applied once every subscription id is known
+        early = []
+        while len(subscriptions) < len(self.accounts):
+            message = json.loads(await websocket.recv())
+            if 'error' in message:
+                # Errors the node cannot tie to a request come back with a null id
+                request_id = message.get('id')
+                if isinstance(request_id, int) and 0 <= request_id < len(self.accounts):
+                    raise ValueError("accountSubscribe for {} failed: {}".format(self.accounts[request_id], message['error']))
+                raise ValueError("accountSubscribe failed: {}".format(message['error']))
+            # Acknowledgements carry the subscription id in result, matched by request id
+            if 'id' in message and 'result' in message:
+                subscriptions[message['result']] = message['id']
+            elif message.get('params') is not None:
+                early.append(message['params'])
+        return subscriptions, early
+
+    def notify(self, subscriptions, params):
+        index = subscriptions.get(params['subscription'])
+        if index is None:
+            return None
+        result = params['result']
+        return self.update(index, result['value']['data'], result['context']['slot'])
+
+    async def stream(self):
+        delay = self.reconnect_delay
+        while True:
+            try:
+                async with connect(self.ws_url) as websocket:
+                    subscriptions, early = await self.subscribe(websocket)
+                    delay = self.reconnect_delay
+                    account_datas, slot = await self.fetchAccounts()
+                    update = None
+                    for index, data in enumerate(account_datas):
+                        update = self.update(index, data, slot) or update
+                    for params in early:
+                        update = self.notify(subscriptions, params) or update
+                    if update:
+                        yield update
+                    async for message in websocket:
+                        params = json.loads(message).get('params')
+                        if params is None:
+                            continue
+                        update = self.notify(subscriptions, params)
+                        if update:
+                            yield update
+            except ConnectionClosed:
+                pass
+            except OSError:
+                # A restarting node refuses connections, which is retried like a dropped one
+                if not self.reconnect:
+                    raise
+            if not self.reconnect:
+                return
+            # Doubles while the node keeps dropping the connection, reset once subscribed again
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_reconnect_delay)
+
+def streamReserves(pool,
+                   ws_url = None,
+                   commitment = 'confirmed',
+                   reconnect = True,
+                   reconnect_delay = 0.5,
+                   max_reconnect_delay = 30.0):
+    return ReserveStream(pool, ws_url, commitment, reconnect, reconnect_delay, max_reconnect_delay).stream()
@@ -0,0 +1,98 @@
+import struct
+
+import base58
+
+from layout import RAYDIUM_SWAP_INSTRUCTION_IDX, SWAP_INSTRUCTION_FORMAT
+from raydium import RaydiumApi
+from sol import Transaction
+
+BLOCKHASH_LENGTH = 32
+PLACEHOLDER_BLOCKHASH = str(base58.b58encode(bytes(BLOCKHASH_LENGTH)), 'utf8')
+
+def encodeLength(length):
+    encoded = bytearray()
+    while True:
+        byte = length & 0x7f
+        length >>= 7
+        if length:
+            encoded.append(byte | 0x80)
+        else:
+            encoded.append(byte)
+            return bytes(encoded)
+
+# A compiled, unsigned swap message for one pool and one pair of user token accounts.
+# Each trade copies the message, patches the amounts and blockhash in place and signs.
+class SwapTemplate:
+    def __init__(self,
+                 pool,
+                 from_token_account,
+                 to_token_account,
+                 keypair):
+        self.pool = pool
+        self.keypair = keypair
+        transaction = Transaction(recent_blockhash=PLACEHOLDER_BLOCKHASH, fee_payer=keypair.public_key)
+        transaction = RaydiumApi.swap(pool,
+                                      0,
+                                      0,
+                                      pool.pool_info,
+                                      from_token_account,
+                                      to_token_account,
+                                      keypair,
+                                      transaction = transaction,
+                                      send_transaction = False)
+        # Registering the owner as signer up front makes solana-py compile the fee payer as writable
+        transaction.sign_partial(keypair.public_key)
+        message = transaction.compile_message()
+        self.message = bytearray(message.serialize())
+        self.num_signatures = message.header.num_required_signatures
+        if self.num_signatures != 1:
+            raise ValueError("Swap template expects the owner to be the only signer, found {} signers".format(self.num_signatures))
+        # Legacy message: 3 byte header, account keys, blockhash, then the instructions
+        num_keys = len(message.account_keys)
+        self.blockhash_offset = 3 + len(encodeLength(num_keys)) + 32 * num_keys
+        if bytes(self.message[self.blockhash_offset:self.blockhash_offset + BLOCKHASH_LENGTH]) != bytes(BLOCKHASH_LENGTH):
+            raise ValueError("Could not locate the recent blockhash in the compiled swap message")
+        # The swap instruction is the only instruction and its data ends the message
+        self.data_offset = len(self.message) - struct.calcsize(SWAP_INSTRUCTION_FORMAT)
+        if bytes(self.message[self.data_offset:]) != struct.pack(SWAP_INSTRUCTION_FORMAT, RAYDIUM_SWAP_INSTRUCTION_IDX, 0, 0):
+            raise ValueError("Could not locate the swap instruction data in the compiled swap message")
+        self.amounts_offset = self.data_offset + 1
+        self.prefix = encodeLength(self.num_signatures)
+        self.blockhashes = {}
+
+    def blockhashBytes(self, recent_blockhash):
+        encoded = self.blockhashes.get(recent_blockhash)
+        if encoded is None:
+            # Only the latest couple of blockhashes are ever in use, so the memo stays tiny
+            if len(self.blockhashes) > 8:
+                self.blockhashes.clear()
+            encoded = base58.b58decode(recent_blockhash)
+            self.blockhashes[recent_blockhash] = encoded
+        return encoded
+
+    def buildMessage(self,
+                     amount_in,
+                     min_amount_out,
+                     recent_blockhash):
+        message = bytearray(self.message)
+        struct.pack_into('<QQ', message, self.amounts_offset, amount_in, min_amount_out)
+        message[self.blockhash_offset:self.blockhash_offset + BLOCKHASH_LENGTH] = self.blockhashBytes(recent_blockhash)
+        return bytes(message)
+
+    def build(self,
+              amount_in,
+              min_amount_out,
+              recent_blockhash):
+        message = self.buildMessage(amount_in, min_amount_out, recent_blockhash)
+        signature = self.keypair.sign(message).signature
+        return self.prefix + signature + message
+
+    # Sends through a synchronous WrappedSolana, async callers pass build() to AsyncWrappedSolana.sendRawTransaction
+    def swap(self,
+             amount_in,
+             min_amount_out,
+             recent_blockhash = None,
+             tx_opts = None):
+        if recent_blockhash is None:
+            recent_blockhash = self.pool.solana.getRecentBlockhash()
+        return self.pool.solana.sendRawTransaction(self.build(amount_in, min_amount_out, recent_blockhash), tx_opts)
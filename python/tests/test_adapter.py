@@ -0,0 +1,22 @@
+import pytest
+
+from adapter import MercurialPool, PoolAdapter, SaberPool, StepSwapPool, TokenSwapPool
+
+def testIncompleteAdapter():
+    # Missing parseReserveData, amountOut and swapInstruction
+    class PartialPool(PoolAdapter):
+        def poolNonce(self, parsed):
+            return parsed['nonce']
+
+    with pytest.raises(TypeError):
+        PartialPool(None, None, None)
+
+def testAdaptersComplete():
+    for adapter in [TokenSwapPool, StepSwapPool, SaberPool, MercurialPool]:
+        assert not adapter.__abstractmethods__, adapter.name
+
+@pytest.mark.parametrize('adapter', [StepSwapPool, MercurialPool])
+def testUnverifiedSwap(adapter):
+    pool = object.__new__(adapter)
+    with pytest.raises(ValueError, match='not verified'):
+        pool.swapInstruction(1, 0, 'buy', None, None, None)
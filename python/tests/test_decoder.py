@@ -0,0 +1,73 @@
+import random
+
+import pytest
+
+from decoder import (ACCOUNT_DECODER,
+                     AMM_INFO_DECODER_V4,
+                     MARKET_STATE_DECODER_V2,
+                     OPEN_ORDERS_DECODER,
+                     decodeReserves,
+                     unpackAmmReserveFields,
+                     unpackOpenOrdersTotals,
+                     unpackTokenAmount)
+
+DECODERS = {'amm_info_v4': AMM_INFO_DECODER_V4,
+            'account': ACCOUNT_DECODER,
+            'open_orders': OPEN_ORDERS_DECODER,
+            'market_state_v2': MARKET_STATE_DECODER_V2}
+SAMPLES = 50
+
+# Serum account flags are seven bits followed by 57 bits construct requires to be zero
+FLAGS_FIELDS = ('account_flags', 'accountFlags')
+FLAG_BITS = 0x7f
+
+def randomAccounts(decoder, seed):
+    rng = random.Random(seed)
+    accounts = [bytearray(decoder.size), bytearray(b'\xff' * decoder.size)]
+    accounts += [bytearray(rng.getrandbits(8) for _ in range(decoder.size)) for _ in range(SAMPLES)]
+    for name in FLAGS_FIELDS:
+        if name in decoder.fields:
+            offset, size, _ = decoder.fields[name]
+            for data in accounts:
+                data[offset:offset + size] = (data[offset] & FLAG_BITS).to_bytes(size, 'little')
+    return [bytes(data) for data in accounts]
+
+@pytest.mark.parametrize('decoder', DECODERS.values(), ids=DECODERS.keys())
+def testFieldParity(decoder):
+    for data in randomAccounts(decoder, decoder.size):
+        expected = decoder.layout.parse(data)
+        decoded = decoder.parse(data)
+        assert set(decoded.keys()) == {name for name in expected if not name.startswith('_')}
+        for name in decoded.keys():
+            assert decoded[name] == expected[name], name
+            assert decoder.read(data, name) == expected[name], name
+
+@pytest.mark.parametrize('decoder', DECODERS.values(), ids=DECODERS.keys())
+def testTrailingBytesAndMemoryview(decoder):
+    data = randomAccounts(decoder, 1)[2]
+    expected = decoder.layout.parse(data)
+    decoded = decoder.parse(memoryview(data + b'\x01' * 17))
+    for name in decoded.keys():
+        assert decoded[name] == expected[name], name
+
+@pytest.mark.parametrize('decoder', DECODERS.values(), ids=DECODERS.keys())
+def testShortData(decoder):
+    with pytest.raises(ValueError):
+        decoder.parse(bytes(decoder.size - 1))
+
+def testUnpackers():
+    for amm_data, coin_data, pc_data, open_orders_data in zip(randomAccounts(AMM_INFO_DECODER_V4, 1),
+                                                              randomAccounts(ACCOUNT_DECODER, 2),
+                                                              randomAccounts(ACCOUNT_DECODER, 3),
+                                                              randomAccounts(OPEN_ORDERS_DECODER, 4)):
+        amm = AMM_INFO_DECODER_V4.layout.parse(amm_data)
+        coin = ACCOUNT_DECODER.layout.parse(coin_data)
+        pc = ACCOUNT_DECODER.layout.parse(pc_data)
+        open_orders = OPEN_ORDERS_DECODER.layout.parse(open_orders_data)
+        assert unpackAmmReserveFields(amm_data) == (amm.needTakePnlCoin, amm.needTakePnlPc, amm.swapFeeNumerator, amm.swapFeeDenominator)
+        assert unpackTokenAmount(coin_data) == (coin.amount,)
+        assert unpackOpenOrdersTotals(open_orders_data) == (open_orders.base_token_total, open_orders.quote_token_total)
+        assert decodeReserves(amm_data, coin_data, pc_data, open_orders_data) == (pc.amount + open_orders.quote_token_total - amm.needTakePnlPc,
+                                                                                  coin.amount + open_orders.base_token_total - amm.needTakePnlCoin,
+                                                                                  amm.swapFeeDenominator,
+                                                                                  amm.swapFeeNumerator)
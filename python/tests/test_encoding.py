@@ -0,0 +1,75 @@
+import base64
+
+import pytest
+import zstandard
+
+from encoding import BASE64_ENCODING, ZSTD_ENCODING, decodeAccountData
+from sol import WrappedSolana
+
+ACCOUNT_DATA = bytes(range(64)) + bytes(200)
+
+# Stands in for the solana-py Client, answering in whatever encoding each call asks for
+class StubClient:
+    def __init__(self, zstd = True):
+        self.zstd = zstd
+        self.encodings = []
+
+    def data(self, encoding):
+        self.encodings.append(encoding)
+        if encoding == ZSTD_ENCODING:
+            return [base64.b64encode(zstandard.ZstdCompressor().compress(ACCOUNT_DATA)).decode(), encoding]
+        return [base64.b64encode(ACCOUNT_DATA).decode(), encoding]
+
+    def response(self, encoding, value):
+        if encoding == ZSTD_ENCODING and not self.zstd:
+            self.encodings.append(encoding)
+            return {'error': {'code': -32602, 'message': 'Invalid params: unknown variant `base64+zstd`'}}
+        return {'result': value(self.data(encoding))}
+
+    def get_account_info(self, account, encoding = 'base64'):
+        return self.response(encoding, lambda data: {'context': {'slot': 1}, 'value': {'data': data}})
+
+    def get_multiple_accounts(self, accounts, commitment = None, encoding = 'base64'):
+        return self.response(encoding, lambda data: {'context': {'slot': 1}, 'value': [{'data': data} for _ in accounts]})
+
+    def get_program_accounts(self, address, commitment = None, encoding = None, data_slice = None, data_size = None, memcmp_opts = None):
+        return self.response(encoding, lambda data: [{'pubkey': 'x', 'account': {'data': data}}])
+
+def stubSolana(zstd = True):
+    solana = WrappedSolana('http://127.0.0.1:1')
+    solana.useAccountEncoding(ZSTD_ENCODING)
+    solana.connection = StubClient(zstd)
+    return solana
+
+READS = {'getAccountInfo': lambda solana, encoding: solana.getAccountInfo('x', encoding=encoding)[0]['data'],
+         'getMultipleAccounts': lambda solana, encoding: solana.getMultipleAccounts(['x'], encoding=encoding)[0][0]['data'],
+         'getProgramAccounts': lambda solana, encoding: solana.getProgramAccounts('x', encoding=encoding)[0]['account']['data']}
+
+@pytest.mark.parametrize('read', READS.values(), ids=READS.keys())
+def testExplicitEncodingIsKept(read):
+    solana = stubSolana()
+    data = read(solana, BASE64_ENCODING)
+    assert data[1] == BASE64_ENCODING
+    assert base64.b64decode(data[0]) == ACCOUNT_DATA
+    assert solana.connection.encodings == [BASE64_ENCODING]
+    assert read(solana, ZSTD_ENCODING)[1] == ZSTD_ENCODING
+
+@pytest.mark.parametrize('read', READS.values(), ids=READS.keys())
+def testNegotiatedEncoding(read):
+    solana = stubSolana()
+    data = read(solana, None)
+    assert data[1] == ZSTD_ENCODING
+    assert decodeAccountData(data) == ACCOUNT_DATA
+
+@pytest.mark.parametrize('read', READS.values(), ids=READS.keys())
+def testNegotiationFallsBack(read):
+    solana = stubSolana(zstd=False)
+    data = read(solana, None)
+    assert data[1] == BASE64_ENCODING
+    assert solana.account_encoding == BASE64_ENCODING
+    assert solana.connection.encodings == [ZSTD_ENCODING, BASE64_ENCODING]
+    # An explicit request for the rejected encoding is still passed through, not replaced
+    solana.connection.encodings.clear()
+    with pytest.raises(KeyError):
+        read(solana, ZSTD_ENCODING)
+    assert solana.connection.encodings == [ZSTD_ENCODING]
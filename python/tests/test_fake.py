@@ -0,0 +1,34 @@
+import pytest
+
+import bench
+from encoding import BASE64_ENCODING, ZSTD_ENCODING, decodeAccountData
+from fake import FakeRpcServer
+from pda import DEFAULT_PROGRAM_ADDRESS_CACHE
+from sol import WrappedSolana
+
+@pytest.fixture(scope='module')
+def fixtures():
+    return bench.syntheticFixtures(2)
+
+@pytest.mark.parametrize('encoding', [BASE64_ENCODING, ZSTD_ENCODING])
+def testRpcServerMatchesFake(fixtures, encoding):
+    solana = bench.fakeSolana(fixtures)
+    addresses = [address for pool in fixtures["pools"] for address in pool["accounts"]] + ['11111111111111111111111111111111']
+    expected, slot = solana.getMultipleAccountsData(addresses[:-1])
+    with FakeRpcServer(solana) as node:
+        rpc = WrappedSolana(node.url)
+        rpc.useAccountEncoding(encoding)
+        infos, rpc_slot = rpc.getMultipleAccounts(addresses)
+        assert rpc_slot == slot
+        assert infos[-1] is None
+        assert [info['data'][1] for info in infos[:-1]] == [encoding] * len(expected)
+        assert [decodeAccountData(info['data']) for info in infos[:-1]] == [decodeAccountData(data) for data in expected]
+        # The raw transport parses the same accounts
+        request = rpc.multipleAccountsRequest([addresses[:3], addresses[3:]])
+        groups = rpc.getMultipleAccountsBytes(request)
+        assert [data for datas, _ in groups for data in datas] == [decodeAccountData(data) for data in expected] + [None]
+
+def testBenchCacheIsolated(fixtures):
+    solana = bench.fakeSolana(fixtures)
+    assert solana.program_addresses is not DEFAULT_PROGRAM_ADDRESS_CACHE
+    assert bench.fakeSolana(fixtures).program_addresses is not solana.program_addresses
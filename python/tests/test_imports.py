@@ -0,0 +1,53 @@
+import os
+import re
+import subprocess
+import sys
+
+import pytest
+
+# Cumulative import time in milliseconds of the modules a watcher process starts with
+IMPORT_BUDGETS_MS = {'sol': 90.0,
+                     'raydium': 180.0,
+                     'app': 180.0}
+# Only transaction building and the solana-py clients need these, importing a watcher module must not load them
+DEFERRED_MODULES = ['requests',
+                    'httpx',
+                    'solana.rpc.api',
+                    'solana.rpc.async_api',
+                    'solana.system_program',
+                    'solana.transaction',
+                    'spl.token.instructions']
+IMPORT_RUNS = 5
+IMPORT_TIME_LINE = re.compile(r'import time:\s+\d+ \|\s+(\d+) \| (\s*)(\S+)$')
+MODULE_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def importTime(module):
+    # Cumulative microseconds of module in a fresh interpreter's -X importtime output, and every
+    # module loaded on the way
+    output = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+                            capture_output=True,
+                            text=True,
+                            check=True,
+                            cwd=MODULE_DIRECTORY).stderr
+    cumulative = None
+    loaded = set()
+    for line in output.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match is None:
+            continue
+        loaded.add(match.group(3))
+        if not match.group(2) and match.group(3) == module:
+            cumulative = int(match.group(1))
+    return cumulative, loaded
+
+@pytest.mark.parametrize('module', IMPORT_BUDGETS_MS)
+def testImportBudget(module):
+    # The best of several runs, so a busy machine does not fail the budget
+    times = []
+    for _ in range(IMPORT_RUNS):
+        cumulative, loaded = importTime(module)
+        assert cumulative is not None, "{} missing from -X importtime output".format(module)
+        times.append(cumulative / 1e3)
+        deferred = [name for name in DEFERRED_MODULES if name in loaded]
+        assert not deferred, "{} loads {}".format(module, ", ".join(deferred))
+    assert min(times) <= IMPORT_BUDGETS_MS[module], "{} took {:.1f} ms to import, budget {:.1f} ms".format(module, min(times), IMPORT_BUDGETS_MS[module])
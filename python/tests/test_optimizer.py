@@ -0,0 +1,90 @@
+from collections import namedtuple
+
+import pytest
+
+from optimizer import PriceGraph, composeLegs, cycleAmountOut, optimalCycleInput, roundTripLegs
+from quote import CONSTANT_PRODUCT, STABLE_SWAP
+
+# Stands in for a pool adapter, PriceGraph only reads base, quote and curve
+StubPool = namedtuple('StubPool', ['name', 'base', 'quote', 'curve'], defaults=[CONSTANT_PRODUCT])
+
+RAYDIUM_FEES = (10000, 25)
+RESERVE = 10 ** 12
+
+def triangle(mispricing):
+    # A/B, B/C and C/A pools, the C/A pool prices A off by the given factor
+    ab = StubPool('ab', 'A', 'B')
+    bc = StubPool('bc', 'B', 'C')
+    ca = StubPool('ca', 'C', 'A')
+    return {ab: ([RESERVE, RESERVE], RAYDIUM_FEES),
+            bc: ([RESERVE, RESERVE], RAYDIUM_FEES),
+            ca: ([int(RESERVE * mispricing), RESERVE], RAYDIUM_FEES)}
+
+def testProfitableTriangle():
+    graph = PriceGraph(triangle(1.05))
+    cycles = graph.findCycles()
+    assert len(cycles) == 1
+    legs = cycles[0]
+    assert len(legs) == 3
+    assert sorted(leg.pool.name for leg in legs) == ['ab', 'bc', 'ca']
+    for leg, following in zip(legs, legs[1:] + legs[:1]):
+        assert leg.token_out == following.token_in
+    # A is cheap in the C/A pool, so the cycle buys it there
+    assert [leg for leg in legs if leg.pool.name == 'ca'][0].token_out == 'A'
+
+    amount_in, profit = optimalCycleInput(legs)
+    assert profit > 0
+    assert cycleAmountOut(amount_in, legs) - amount_in == profit
+    # Trading noticeably more or less than the optimum earns less
+    for amount in [amount_in // 2, amount_in * 3 // 2]:
+        assert cycleAmountOut(amount, legs) - amount < profit
+
+    opportunities = graph.findOpportunities()
+    assert [(amount, gain) for _, amount, gain in opportunities] == [(amount_in, profit)]
+
+def testNoArbitrage():
+    graph = PriceGraph(triangle(1.0))
+    assert graph.findCycles() == []
+    assert graph.findOpportunities() == []
+    # Mispricing smaller than three fees is not an opportunity either
+    assert PriceGraph(triangle(1.005)).findCycles() == []
+
+def testStableSwapPoolsSkipped():
+    snapshot = triangle(1.05)
+    ca = [pool for pool in snapshot if pool.name == 'ca'][0]
+    snapshot[ca._replace(curve=STABLE_SWAP)] = snapshot.pop(ca)
+    graph = PriceGraph(snapshot)
+    assert graph.tokens == ['A', 'B', 'C']
+    assert len(graph.legs) == 4
+    assert graph.findCycles() == []
+
+def testRoundTrip():
+    cheap = StubPool('cheap', 'A', 'B')
+    dear = StubPool('dear', 'A', 'B')
+    other = StubPool('other', 'C', 'B')
+    snapshot = {cheap: ([RESERVE, RESERVE], RAYDIUM_FEES),
+                dear: ([RESERVE * 11 // 10, RESERVE], RAYDIUM_FEES),
+                other: ([RESERVE, RESERVE], RAYDIUM_FEES)}
+    legs = roundTripLegs(cheap, 'buy', dear, 'sell', snapshot)
+    assert [(leg.pool, leg.side, leg.token_in, leg.token_out) for leg in legs] == [(cheap, 'buy', 'B', 'A'),
+                                                                                  (dear, 'sell', 'A', 'B')]
+    amount_in, profit = optimalCycleInput(legs)
+    assert profit > 0 and cycleAmountOut(amount_in, legs) == amount_in + profit
+    # The reverse direction loses on both legs
+    assert optimalCycleInput(roundTripLegs(dear, 'buy', cheap, 'sell', snapshot)) == (0, 0)
+    with pytest.raises(ValueError):
+        roundTripLegs(cheap, 'buy', other, 'sell', snapshot)
+    with pytest.raises(ValueError):
+        roundTripLegs(cheap, 'buy', dear, 'buy', snapshot)
+
+@pytest.mark.parametrize('mispricing', [1.0, 1.05, 1.5])
+def testComposeLegs(mispricing):
+    legs = PriceGraph(triangle(mispricing)).legs
+    by_pool = {(leg.pool.name, leg.side): leg for leg in legs}
+    cycle = [by_pool[('ca', 'buy')], by_pool[('ab', 'buy')], by_pool[('bc', 'buy')]]
+    virtual_in, virtual_out, gamma = composeLegs(cycle)
+    assert gamma == (RAYDIUM_FEES[0] - RAYDIUM_FEES[1]) / RAYDIUM_FEES[0]
+    for amount in [1000, 10 ** 6, 10 ** 9, 10 ** 11, 10 ** 13]:
+        composed = virtual_out * gamma * amount / (virtual_in + gamma * amount)
+        # Each leg floors its output, the composed pool does not
+        assert abs(composed - cycleAmountOut(amount, cycle)) <= len(cycle) + composed * 1e-9
@@ -0,0 +1,37 @@
+import pickle
+
+import pytest
+from solana.publickey import PublicKey
+
+import bench
+from poolinfo import POOL_INFO_KEYS, POOL_INFO_STRING_KEYS, PoolInfo
+from raydium import RaydiumAmm
+
+@pytest.fixture(scope='module')
+def poolInfo():
+    fixtures = bench.syntheticFixtures(1)
+    pool = fixtures["pools"][0]
+    return RaydiumAmm(bench.fakeSolana(fixtures), pool["token0"], pool["token1"]).pool_info
+
+def testDictTypes(poolInfo):
+    # The same types the pool_info dict held before it became a PoolInfo
+    for name in POOL_INFO_KEYS:
+        expected = str if name in POOL_INFO_STRING_KEYS else PublicKey
+        assert type(poolInfo[name]) is expected, name
+        assert str(poolInfo[name]) == poolInfo.address(name)
+        assert bytes(poolInfo.publicKey(name)) == poolInfo.raw(name)
+    assert poolInfo["version"] == 4
+    assert poolInfo["marketVersion"] == 3
+    assert poolInfo.get("missing") is None
+    with pytest.raises(KeyError):
+        poolInfo["missing"]
+
+def testRoundTrips(poolInfo):
+    assert PoolInfo.fromDict(dict(poolInfo.items())) == poolInfo
+    assert PoolInfo.fromJson(poolInfo.toJson()) == poolInfo
+    copy = pickle.loads(pickle.dumps(poolInfo))
+    assert copy == poolInfo and hash(copy) == hash(poolInfo)
+
+def testImmutable(poolInfo):
+    with pytest.raises(AttributeError):
+        poolInfo.key_bytes = bytes(len(poolInfo.key_bytes))
@@ -0,0 +1,65 @@
+import random
+
+import numpy as np
+import pytest
+
+from quote import amountOut, amountsOut, quoteGrid
+
+RAYDIUM_FEE = (25, 10000)
+
+def assertParity(amounts_in,
+                 reserves_in,
+                 reserves_out,
+                 fee_numerators,
+                 fee_denominators):
+    result = amountsOut(amounts_in, reserves_in, reserves_out, fee_numerators, fee_denominators)
+    lanes = np.broadcast_arrays(*[np.asarray(v, dtype=object) for v in (amounts_in,
+                                                                         reserves_in,
+                                                                         reserves_out,
+                                                                         fee_numerators,
+                                                                         fee_denominators)])
+    expected = [amountOut(*args) for args in zip(*[lane.ravel().tolist() for lane in lanes])]
+    assert [int(value) for value in result.ravel()] == expected
+
+@pytest.mark.parametrize('reserve_in, reserve_out', [(1, 1),
+                                                     (1, 10 ** 18),
+                                                     (10 ** 18, 1),
+                                                     (7, 13),
+                                                     (2 ** 52 - 1, 2 ** 52 + 1),
+                                                     (2 ** 63, 2 ** 63),
+                                                     (10 ** 18, 10 ** 18)])
+def testTinyAndHugeReserves(reserve_in, reserve_out):
+    amounts = [0, 1, 2, 3, 999, 10 ** 6, 10 ** 9, 10 ** 12, 10 ** 15, 10 ** 18, 2 ** 64 + 1]
+    assertParity(amounts, reserve_in, reserve_out, *RAYDIUM_FEE)
+
+def testExactIntegerQuotes():
+    # Quotes that are whole numbers in exact arithmetic, where float64 can land just below
+    assertParity([1, 2, 3, 10, 100], 1, [3, 6, 9, 30, 300], 0, 1)
+    assertParity([10 ** 6] * 4, [10 ** 6, 2 * 10 ** 6, 3 * 10 ** 6, 10 ** 12], [2 * 10 ** 6, 3 * 10 ** 6, 4 * 10 ** 6, 10 ** 12], 0, 1)
+
+def testFeeEdges():
+    assertParity(10 ** 6, 10 ** 9, 10 ** 9, [0, 1, 25, 9999, 10000], 10000)
+    assertParity(10 ** 6, 10 ** 9, 10 ** 9, 0, [1, 3, 10 ** 18])
+
+def testLargeFeeValues():
+    # The fee difference is small while both fees are far above float64 precision
+    assert amountsOut([10 ** 9], [1], [10 ** 18], [2 ** 60], [2 ** 60 + 200])[0] == 173472317505
+    assertParity(10 ** 9, [1, 10 ** 6], 10 ** 18, [2 ** 60, 2 ** 62 - 7], [2 ** 60 + 200, 2 ** 62])
+
+def testUnsignedInputs():
+    uint64 = lambda values: np.array(values, dtype=np.uint64)
+    result = amountsOut(uint64([10 ** 9]), uint64([1]), uint64([10 ** 18]), uint64([2 ** 60]), uint64([2 ** 60 + 200]))
+    assert result[0] == amountOut(10 ** 9, 1, 10 ** 18, 2 ** 60, 2 ** 60 + 200)
+
+def testRandomParity():
+    rng = random.Random(7)
+    for _ in range(20):
+        magnitude = rng.choice([3, 9, 15, 19])
+        amounts = [rng.randrange(10 ** magnitude) for _ in range(50)]
+        reserves_in = [rng.randrange(1, 10 ** rng.choice([1, 9, 18])) for _ in range(20)]
+        reserves_out = [rng.randrange(1, 10 ** rng.choice([1, 9, 18])) for _ in range(20)]
+        fee_denominators = [rng.choice([10000, 1000000, 2 ** 62]) for _ in range(20)]
+        fee_numerators = [rng.randrange(denominator) for denominator in fee_denominators]
+        grid = quoteGrid(amounts, reserves_in, reserves_out, fee_numerators, fee_denominators)
+        for row, (reserve_in, reserve_out, numerator, denominator) in enumerate(zip(reserves_in, reserves_out, fee_numerators, fee_denominators)):
+            assert [int(value) for value in grid[row]] == [amountOut(amount, reserve_in, reserve_out, numerator, denominator) for amount in amounts]
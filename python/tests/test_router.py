@@ -0,0 +1,155 @@
+import asyncio
+import time
+
+import pytest
+
+from router import AsyncRpcRouter, RpcRouter
+
+# Finalized state trails confirmed by about 32 slots on a live node
+CONFIRMED_SLOT = 1030
+FINALIZED_SLOT = 1000
+
+# Stands in for a WrappedSolana endpoint with a fixed latency and per commitment slots
+class StubSolana:
+    def __init__(self,
+                 node_url,
+                 latency = 0.0,
+                 confirmed_slot = CONFIRMED_SLOT,
+                 finalized_slot = FINALIZED_SLOT,
+                 fail = False):
+        self.node_url = node_url
+        self.latency = latency
+        self.slots = {'confirmed': confirmed_slot, 'finalized': finalized_slot}
+        self.fail = fail
+        self.calls = 0
+
+    def slot(self, commitment):
+        return self.slots[commitment or 'finalized']
+
+    def respond(self):
+        self.calls += 1
+        time.sleep(self.latency)
+        if self.fail:
+            raise ValueError("node down")
+
+    def getSlot(self, commitment = 'confirmed'):
+        self.respond()
+        return self.slot(commitment)
+
+    def getMultipleAccounts(self,
+                            accounts,
+                            commitment = None,
+                            encoding = None):
+        self.respond()
+        return ([{'data': [self.node_url, 'base64']} for _ in accounts], self.slot(commitment))
+
+class AsyncStubSolana(StubSolana):
+    async def respond(self):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        if self.fail:
+            raise ValueError("node down")
+
+    async def getSlot(self, commitment = 'confirmed'):
+        await self.respond()
+        return self.slot(commitment)
+
+    async def getMultipleAccounts(self,
+                                  accounts,
+                                  commitment = None,
+                                  encoding = None):
+        await self.respond()
+        return ([{'data': [self.node_url, 'base64']} for _ in accounts], self.slot(commitment))
+
+def servedBy(result):
+    account_infos, _ = result
+    return account_infos[0]['data'][0]
+
+@pytest.fixture
+def router():
+    routers = []
+
+    def create(*endpoints, **options):
+        routers.append(RpcRouter(list(endpoints), **options))
+        return routers[-1]
+
+    yield create
+    for router in routers:
+        router.close()
+
+def testMixedCommitments(router):
+    r = router(StubSolana('a'), StubSolana('b'))
+    r.probe()
+    assert r.highest_slots['confirmed'] == CONFIRMED_SLOT
+    # A confirmed probe must not make finalized reads look stale
+    assert r.getMultipleAccounts(['x'])[1] == FINALIZED_SLOT
+    assert r.getMultipleAccounts(['x'], 'finalized')[1] == FINALIZED_SLOT
+    assert r.getMultipleAccounts(['x'], 'confirmed')[1] == CONFIRMED_SLOT
+    assert r.highest_slots == {'confirmed': CONFIRMED_SLOT, 'finalized': FINALIZED_SLOT}
+
+def testStaleSlotFilter(router):
+    r = router(StubSolana('behind', confirmed_slot=CONFIRMED_SLOT - 10), StubSolana('current'), hedge_delay=1.0)
+    # As after confirmed reads from the current endpoint
+    r.highest_slots['confirmed'] = CONFIRMED_SLOT
+    # The lagging answer is rejected and the read fails over to the current endpoint
+    assert servedBy(r.getMultipleAccounts(['x'], 'confirmed')) == 'current'
+    assert r.stats()['behind']['stale'] == 1
+    # Every endpoint lagging at this commitment fails the read
+    r.highest_slots['confirmed'] = CONFIRMED_SLOT + 10
+    with pytest.raises(ValueError, match="stale slot"):
+        r.getMultipleAccounts(['x'], 'confirmed')
+
+def testLatencyRanking(router):
+    slow = StubSolana('slow', latency=0.03)
+    fast = StubSolana('fast', latency=0.0)
+    r = router(slow, fast, hedge_delay=1.0, latency_weight=0.5)
+    # Both endpoints get measured, then reads go to the faster one
+    r.probe()
+    assert [endpoint.node_url for endpoint in r.rank()] == ['fast', 'slow']
+    for _ in range(5):
+        assert servedBy(r.getMultipleAccounts(['x'])) == 'fast'
+    assert r.stats()['slow']['latency_ms'] > r.stats()['fast']['latency_ms']
+    # The average moves a latency_weight share of the way toward each new sample
+    fast_endpoint = r.endpoints[1]
+    before = fast_endpoint.latency
+    r.observe(fast_endpoint, before + 1.0, None)
+    assert fast_endpoint.latency == pytest.approx(before + 0.5)
+
+def testHedging(router):
+    slow = StubSolana('slow', latency=0.5)
+    fast = StubSolana('fast', latency=0.0)
+    r = router(slow, fast, hedge_delay=0.02)
+    start = time.perf_counter()
+    assert servedBy(r.getMultipleAccounts(['x'])) == 'fast'
+    assert time.perf_counter() - start < 0.4
+    assert slow.calls == 1 and fast.calls == 1
+
+def testFailover(router):
+    down = StubSolana('down', fail=True)
+    up = StubSolana('up', latency=0.01)
+    r = router(down, up, hedge_delay=1.0)
+    assert servedBy(r.getMultipleAccounts(['x'])) == 'up'
+    stats = r.stats()['down']
+    assert stats['failures'] == 1
+    # The failed endpoint cools down behind the healthy one
+    assert [endpoint.node_url for endpoint in r.rank()] == ['up', 'down']
+    up.fail = True
+    with pytest.raises(ValueError, match="failed on every endpoint"):
+        r.getMultipleAccounts(['x'])
+
+def testAsyncRouter():
+    async def run():
+        slow = AsyncStubSolana('slow', latency=0.5)
+        fast = AsyncStubSolana('fast')
+        r = AsyncRpcRouter([slow, fast], hedge_delay=0.02)
+        await r.probe()
+        r.endpoints[0].latency = 0.0
+        r.endpoints[1].latency = 0.0
+        start = time.perf_counter()
+        result = await r.getMultipleAccounts(['x'])
+        assert time.perf_counter() - start < 0.4
+        assert servedBy(result) == 'fast'
+        assert result[1] == FINALIZED_SLOT
+        assert (await r.getMultipleAccounts(['x'], 'confirmed'))[1] == CONFIRMED_SLOT
+
+    asyncio.run(run())
@@ -0,0 +1,199 @@
+import asyncio
+import time
+
+import base58
+import pytest
+from solana.keypair import Keypair
+from solana.system_program import TransferParams, transfer
+from solana.transaction import Transaction
+
+from sender import (CONFIRMED,
+                    EXPIRED,
+                    FAILED,
+                    PENDING,
+                    AsyncSignatureTracker,
+                    AsyncTransactionSender,
+                    BlockhashPrefetcher,
+                    SignatureTracker,
+                    TransactionSender,
+                    transactionSignature)
+
+BLOCKHASHES = ['4uQeVj5tqViQh7yWWGStvkEG1Zmhx6uasJtWCJziofM',
+               'EETubP5AKHgjPAhzPAFcb8BAY1hMH639CWCFTqi3hq1k']
+SLOT = 120
+
+# Stands in for a WrappedSolana endpoint, statuses maps signature -> getSignatureStatuses entry
+class StubSolana:
+    def __init__(self, fail = False):
+        self.blockhash = BLOCKHASHES[0]
+        self.fail = fail
+        self.statuses = {}
+        self.sent = []
+        self.blockhash_calls = 0
+
+    def respond(self):
+        if self.fail:
+            raise ValueError("node down")
+
+    def getRecentBlockhash(self, commitment = 'finalized'):
+        self.blockhash_calls += 1
+        self.respond()
+        return self.blockhash
+
+    def getSignatureStatuses(self, signatures):
+        self.respond()
+        return ([self.statuses.get(signature) for signature in signatures], SLOT)
+
+    def sendRawTransaction(self,
+                           raw_transaction,
+                           tx_opts = None):
+        self.sent.append(bytes(raw_transaction))
+        self.respond()
+        return transactionSignature(raw_transaction)
+
+class AsyncStubSolana(StubSolana):
+    async def getRecentBlockhash(self, commitment = 'finalized'):
+        return StubSolana.getRecentBlockhash(self, commitment)
+
+    async def getSignatureStatuses(self, signatures):
+        return StubSolana.getSignatureStatuses(self, signatures)
+
+    async def sendRawTransaction(self,
+                                 raw_transaction,
+                                 tx_opts = None):
+        return StubSolana.sendRawTransaction(self, raw_transaction, tx_opts)
+
+def status(confirmation_status, err = None):
+    return {"slot": SLOT, "confirmations": 1, "err": err, "confirmationStatus": confirmation_status}
+
+def waitFor(condition, timeout = 2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+def transferTransaction(owner):
+    return Transaction().add(transfer(TransferParams(from_pubkey=owner.public_key,
+                                                     to_pubkey=owner.public_key,
+                                                     lamports=1)))
+
+def testBlockhashRefresh():
+    solana = StubSolana()
+    # Without the background thread every get fetches
+    prefetcher = BlockhashPrefetcher(solana)
+    assert prefetcher.get() == BLOCKHASHES[0]
+    assert solana.blockhash_calls == 1
+    with BlockhashPrefetcher(solana, interval=0.01) as prefetcher:
+        assert prefetcher.get() == BLOCKHASHES[0]
+        calls = solana.blockhash_calls
+        # Reads are served from the prefetched value, never from the node
+        for _ in range(100):
+            prefetcher.get()
+        solana.blockhash = BLOCKHASHES[1]
+        waitFor(lambda: prefetcher.get() == BLOCKHASHES[1])
+        assert solana.blockhash_calls - calls < 100
+    assert prefetcher.thread is None
+
+def testBlockhashExpiry():
+    solana = StubSolana()
+    with BlockhashPrefetcher(solana, interval=0.01, max_age=0.1) as prefetcher:
+        assert prefetcher.get() == BLOCKHASHES[0]
+        # Failed refreshes keep serving the last blockhash until it ages out
+        solana.fail = True
+        waitFor(lambda: prefetcher.error is not None)
+        assert prefetcher.get() == BLOCKHASHES[0]
+        time.sleep(0.15)
+        with pytest.raises(ValueError, match="node down"):
+            prefetcher.get()
+        solana.fail = False
+        waitFor(lambda: prefetcher.error is None)
+        assert prefetcher.get() == BLOCKHASHES[0]
+
+def testBlockhashNeverFetched():
+    with BlockhashPrefetcher(StubSolana(fail=True), interval=0.01) as prefetcher:
+        with pytest.raises(ValueError, match="No blockhash fetched"):
+            prefetcher.get(timeout=0.05)
+
+def testSignatureConfirmation():
+    solana = StubSolana()
+    tracker = SignatureTracker(solana, commitment='confirmed')
+    seen = []
+    tracker.track('confirmed', lambda signature, result: seen.append((signature, result["status"])))
+    tracker.track('failed')
+    tracker.track('unknown')
+    solana.statuses['confirmed'] = status('processed')
+    solana.statuses['failed'] = status('processed', err={"InstructionError": [0, "Custom"]})
+    tracker.poll()
+    # Processed is below the target commitment
+    assert tracker.status('confirmed')["status"] == PENDING
+    assert tracker.status('failed') == {"status": FAILED, "slot": SLOT, "err": {"InstructionError": [0, "Custom"]}}
+    assert tracker.status('unknown')["status"] == PENDING
+    solana.statuses['confirmed'] = status('confirmed')
+    tracker.poll()
+    assert tracker.status('confirmed') == {"status": CONFIRMED, "slot": SLOT, "err": None}
+    assert seen == [('confirmed', CONFIRMED)]
+    # Nodes without confirmationStatus report rooted transactions with a null confirmations count
+    assert tracker.reached({"confirmations": None})
+    assert not tracker.reached({"confirmations": 3})
+
+def testSignatureTimeout():
+    solana = StubSolana()
+    with SignatureTracker(solana, interval=0.01, timeout=0.05) as tracker:
+        tracker.track('dropped')
+        tracker.track('landed')
+        solana.statuses['landed'] = status('finalized')
+        assert tracker.wait('landed', 2.0)["status"] == CONFIRMED
+        assert tracker.wait('dropped', 2.0) == {"status": EXPIRED, "slot": None, "err": None}
+    assert tracker.status('missing') is None
+
+def testRebroadcast():
+    owner = Keypair.from_seed(bytes(range(32)))
+    endpoints = [StubSolana(), StubSolana(fail=True), StubSolana()]
+    blockhashes = BlockhashPrefetcher(endpoints[0], interval=0.01).start()
+    tracker = SignatureTracker(endpoints[0], interval=0.01)
+    with TransactionSender(endpoints, blockhashes, tracker, tx_opts='opts') as sender:
+        transaction = transferTransaction(owner)
+        signature = sender.sendTransaction(transaction, [owner])
+        assert signature == base58.b58encode(transaction.signature()).decode()
+        assert transaction.recent_blockhash == BLOCKHASHES[0]
+        # The same signed bytes go to every endpoint, one of them failing does not fail the send
+        waitFor(lambda: all(endpoint.sent for endpoint in endpoints))
+        assert all(endpoint.sent == [transaction.serialize()] for endpoint in endpoints)
+        assert sender.status(signature)["status"] == PENDING
+        endpoints[0].statuses[signature] = status('confirmed')
+        tracker.start()
+        assert sender.wait(signature, 2.0)["status"] == CONFIRMED
+    blockhashes.stop()
+    tracker.stop()
+
+def testRebroadcastRejected():
+    owner = Keypair.from_seed(bytes(range(32)))
+    endpoints = [StubSolana(fail=True), StubSolana(fail=True)]
+    blockhashes = BlockhashPrefetcher(StubSolana())
+    tracker = SignatureTracker(endpoints[0])
+    with TransactionSender(endpoints, blockhashes, tracker, tx_opts='opts') as sender:
+        signature = sender.sendTransaction(transferTransaction(owner), [owner])
+        # Rejected by every endpoint fails without waiting for the status poll
+        result = sender.wait(signature, 2.0)
+        assert result["status"] == FAILED
+        assert len(result["err"]) == 2
+
+def testAsyncRebroadcast():
+    owner = Keypair.from_seed(bytes(range(32)))
+    endpoints = [AsyncStubSolana(), AsyncStubSolana(fail=True)]
+
+    async def run():
+        tracker = AsyncSignatureTracker(endpoints[0], interval=0.01, timeout=1.0)
+        async with await AsyncTransactionSender.create(endpoints, tracker=tracker, tx_opts='opts') as sender:
+            transaction = transferTransaction(owner)
+            signature = await sender.sendTransaction(transaction, [owner])
+            endpoints[0].statuses[signature] = status('confirmed')
+            tracker.start()
+            result = await sender.wait(signature, 2.0)
+            await tracker.stop()
+            return transaction, signature, result
+
+    transaction, signature, result = asyncio.run(run())
+    assert result["status"] == CONFIRMED
+    assert signature == base58.b58encode(transaction.signature()).decode()
+    assert all(endpoint.sent == [transaction.serialize()] for endpoint in endpoints)
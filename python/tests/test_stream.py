@@ -0,0 +1,138 @@
+import asyncio
+import base64
+import json
+import struct
+import time
+
+import pytest
+import websockets
+
+import bench
+from raydium import RaydiumAmm
+from stream import ReserveStream
+
+# Subscription ids the stub node hands out, offset so they never equal the request ids
+SUBSCRIPTION_OFFSET = 7
+EARLY_SLOT = 50
+EARLY_COIN_AMOUNT = 10 ** 16
+
+@pytest.fixture
+def pool():
+    fixtures = bench.syntheticFixtures(1)
+    token0, token1 = fixtures["pools"][0]["token0"], fixtures["pools"][0]["token1"]
+    return RaydiumAmm(bench.fakeSolana(fixtures), token0, token1)
+
+def tokenAccount(data, amount):
+    data = bytearray(data)
+    struct.pack_into('<Q', data, 64, amount)
+    return bytes(data)
+
+def notification(subscription, data, slot):
+    return json.dumps({"jsonrpc": "2.0",
+                       "method": "accountNotification",
+                       "params": {"subscription": subscription,
+                                  "result": {"context": {"slot": slot},
+                                             "value": {"data": [base64.b64encode(data).decode(), "base64"],
+                                                       "executable": False,
+                                                       "lamports": 0,
+                                                       "owner": "11111111111111111111111111111111",
+                                                       "rentEpoch": 0}}}})
+
+async def serve(handler):
+    server = await websockets.serve(handler, '127.0.0.1', 0)
+    return server, 'ws://127.0.0.1:{}'.format(server.sockets[0].getsockname()[1])
+
+async def firstUpdate(stream):
+    async for update in stream:
+        return update
+
+def testSubscribeEarlyNotificationAndBackoff(pool):
+    connects = []
+    coin_vault = str(pool.pool_coin_token_account)
+    seeded = base64.b64decode(pool.solana.accounts[coin_vault][0])
+    requests = []
+
+    async def handler(websocket, path = None):
+        connects.append(time.monotonic())
+        # The first connections drop before subscribing, as a restarting node would
+        if len(connects) < 4:
+            await websocket.close()
+            return
+        messages = [json.loads(await websocket.recv()) for _ in range(4)]
+        requests.extend(messages)
+        for message in messages:
+            subscription = message['id'] + SUBSCRIPTION_OFFSET
+            await websocket.send(json.dumps({"jsonrpc": "2.0", "id": message['id'], "result": subscription}))
+            # The coin vault changes before the remaining acknowledgements are sent
+            if message['params'][0] == coin_vault:
+                await websocket.send(notification(subscription, tokenAccount(seeded, EARLY_COIN_AMOUNT), EARLY_SLOT))
+        await websocket.wait_closed()
+
+    async def run():
+        server, url = await serve(handler)
+        try:
+            stream = ReserveStream(pool, url, reconnect_delay=0.05, max_reconnect_delay=1.0)
+            return await asyncio.wait_for(firstUpdate(stream), 5)
+        finally:
+            server.close()
+            await server.wait_closed()
+
+    reserves, fees, slot = asyncio.run(run())
+    assert [message['params'][0] for message in requests] == [str(account) for account in ReserveStream(pool, 'ws://unused').accounts]
+    assert all(message['params'][1] == {"encoding": "base64", "commitment": "confirmed"} for message in requests)
+    # The early notification is newer than the seed fetch, so it is applied on top of it
+    assert slot == EARLY_SLOT
+    assert EARLY_COIN_AMOUNT <= reserves[1] < EARLY_COIN_AMOUNT + 10 ** 9
+    assert fees == (10000, 25)
+    # Each reconnect waits twice as long as the one before
+    gaps = [after - before for before, after in zip(connects, connects[1:])]
+    for gap, delay in zip(gaps, [0.05, 0.1, 0.2]):
+        assert gap >= delay * 0.9
+
+def testStaleNotificationIgnored(pool):
+    coin_vault = str(pool.pool_coin_token_account)
+    seeded = base64.b64decode(pool.solana.accounts[coin_vault][0])
+    pool.solana.setSlot(100)
+
+    async def handler(websocket, path = None):
+        messages = [json.loads(await websocket.recv()) for _ in range(4)]
+        for message in messages:
+            subscription = message['id'] + SUBSCRIPTION_OFFSET
+            await websocket.send(json.dumps({"jsonrpc": "2.0", "id": message['id'], "result": subscription}))
+            if message['params'][0] == coin_vault:
+                await websocket.send(notification(subscription, tokenAccount(seeded, EARLY_COIN_AMOUNT), EARLY_SLOT))
+        await websocket.wait_closed()
+
+    async def run():
+        server, url = await serve(handler)
+        try:
+            return await asyncio.wait_for(firstUpdate(ReserveStream(pool, url, reconnect=False)), 5)
+        finally:
+            server.close()
+            await server.wait_closed()
+
+    reserves, _, slot = asyncio.run(run())
+    # Older than the seed fetch, so the seeded vault balance stays
+    assert slot == 100
+    assert reserves[1] < EARLY_COIN_AMOUNT
+
+@pytest.mark.parametrize('request_id, match', [(None, 'accountSubscribe failed'),
+                                               (1, 'accountSubscribe for .* failed')])
+def testSubscribeError(pool, request_id, match):
+    async def handler(websocket, path = None):
+        await websocket.recv()
+        await websocket.send(json.dumps({"jsonrpc": "2.0",
+                                         "id": request_id,
+                                         "error": {"code": -32602, "message": "Invalid params"}}))
+        await websocket.wait_closed()
+
+    async def run():
+        server, url = await serve(handler)
+        try:
+            await asyncio.wait_for(firstUpdate(ReserveStream(pool, url, reconnect=False)), 5)
+        finally:
+            server.close()
+            await server.wait_closed()
+
+    with pytest.raises(ValueError, match=match):
+        asyncio.run(run())
@@ -0,0 +1,59 @@
+import pytest
+from solana.keypair import Keypair
+from solana.publickey import PublicKey
+from solana.transaction import Transaction
+
+import bench
+from raydium import RaydiumAmm, RaydiumApi
+from template import PLACEHOLDER_BLOCKHASH, SwapTemplate
+
+BLOCKHASHES = ['4uQeVj5tqViQh7yWWGStvkEG1Zmhx6uasJtWCJziofM',
+               'EETubP5AKHgjPAhzPAFcb8BAY1hMH639CWCFTqi3hq1k']
+FROM_TOKEN_ACCOUNT = PublicKey(bytes([1] * 32))
+TO_TOKEN_ACCOUNT = PublicKey(bytes([2] * 32))
+
+@pytest.fixture(scope='module')
+def amm():
+    fixtures = bench.syntheticFixtures(1)
+    pool = fixtures["pools"][0]
+    return RaydiumAmm(bench.fakeSolana(fixtures), pool["token0"], pool["token1"])
+
+@pytest.fixture(scope='module')
+def keypair():
+    return Keypair.from_seed(bytes(range(32)))
+
+def signedSwap(amm,
+               keypair,
+               amount_in,
+               min_amount_out,
+               recent_blockhash):
+    transaction = Transaction(recent_blockhash=recent_blockhash, fee_payer=keypair.public_key)
+    transaction = RaydiumApi.swap(amm,
+                                  amount_in,
+                                  min_amount_out,
+                                  amm.pool_info,
+                                  FROM_TOKEN_ACCOUNT,
+                                  TO_TOKEN_ACCOUNT,
+                                  keypair,
+                                  transaction = transaction,
+                                  send_transaction = False)
+    transaction.sign(keypair)
+    return transaction.serialize()
+
+@pytest.mark.parametrize('amount_in, min_amount_out', [(0, 0),
+                                                       (10 ** 6, 990000),
+                                                       (123456789, 1),
+                                                       (2 ** 64 - 1, 2 ** 64 - 1)])
+def testMatchesSolanaPy(amm, keypair, amount_in, min_amount_out):
+    template = SwapTemplate(amm, FROM_TOKEN_ACCOUNT, TO_TOKEN_ACCOUNT, keypair)
+    for recent_blockhash in BLOCKHASHES + [BLOCKHASHES[0], PLACEHOLDER_BLOCKHASH]:
+        expected = signedSwap(amm, keypair, amount_in, min_amount_out, recent_blockhash)
+        assert template.build(amount_in, min_amount_out, recent_blockhash) == expected
+
+def testMatchesPoolSwap(amm, keypair):
+    # The transaction RaydiumAmm.swap sends, with solana-py picking the fee payer
+    template = SwapTemplate(amm, FROM_TOKEN_ACCOUNT, TO_TOKEN_ACCOUNT, keypair)
+    transaction = amm.swap(10 ** 6, 990000, FROM_TOKEN_ACCOUNT, TO_TOKEN_ACCOUNT, keypair, send_transaction=False)
+    transaction.recent_blockhash = BLOCKHASHES[1]
+    transaction.sign(keypair)
+    assert template.build(10 ** 6, 990000, BLOCKHASHES[1]) == transaction.serialize()
@@ -0,0 +1,117 @@
+import http.client
+import json
+import threading
+from urllib.parse import urlparse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from encoding import decodeAccountData
+
+# orjson parses an account response several times faster than json, which stays the fallback
+loads = orjson.loads if orjson is not None else json.loads
+HEADERS = {'Content-Type': 'application/json'}
+# Raised when a kept-alive connection was closed by the node while idle
+STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected,
+                           http.client.CannotSendRequest,
+                           ConnectionResetError,
+                           BrokenPipeError)
+
+# getMultipleAccounts for fixed groups of accounts, sent as one JSON-RPC batch. The body is
+# serialized once per encoding and reused for every poll, so building a request costs nothing.
+class MultipleAccountsRequest:
+    def __init__(self,
+                 account_groups,
+                 commitment = None):
+        self.account_groups = [[str(account) for account in accounts] for accounts in account_groups]
+        self.commitment = commitment
+        self.bodies = {}
+
+    def __len__(self):
+        return len(self.account_groups)
+
+    def body(self, encoding):
+        body = self.bodies.get(encoding)
+        if body is None:
+            config = {"encoding": encoding}
+            if self.commitment is not None:
+                config["commitment"] = self.commitment
+            payload = [{"jsonrpc": "2.0", "id": i, "method": "getMultipleAccounts", "params": [accounts, config]}
+                       for i, accounts in enumerate(self.account_groups)]
+            body = self.bodies[encoding] = json.dumps(payload, separators=(',', ':')).encode()
+        return body
+
+    def parse(self, items):
+        # [(account bytes, or None for a missing account, slot)] per group
+        if not isinstance(items, list):
+            raise ValueError("getMultipleAccounts batch failed: {}".format(items.get('error', items)))
+        results = [None] * len(self.account_groups)
+        for item in items:
+            if 'error' in item:
+                raise ValueError("getMultipleAccounts batch entry {} failed: {}".format(item['id'], item['error']))
+            result = item['result']
+            results[item['id']] = ([decodeAccountData(account_info['data']) if account_info else None
+                                    for account_info in result['value']],
+                                   result['context']['slot'])
+        return results
+
+# Bare HTTP/1.1 JSON-RPC transport for the hot polling calls. Each thread keeps its own
+# connection alive across requests, and the response body is handed back undecoded.
+class RawTransport:
+    def __init__(self,
+                 url,
+                 timeout = 300):
+        parsed = urlparse(url)
+        self.url = url
+        self.https = parsed.scheme == 'https'
+        self.host = parsed.hostname
+        self.port = parsed.port
+        self.path = (parsed.path or '/') + ('?' + parsed.query if parsed.query else '')
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            if self.https:
+                connection = http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout)
+            else:
+                connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            self.local.connection = connection
+        return connection
+
+    def reset(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self.local.connection = None
+
+    def post(self, body):
+        # Only used for reads, so a request on a connection that went stale is sent again once
+        for attempt in range(2):
+            connection = self.connection()
+            try:
+                connection.request('POST', self.path, body, HEADERS)
+                response = connection.getresponse()
+                payload = response.read()
+            except STALE_CONNECTION_ERRORS:
+                self.reset()
+                if attempt:
+                    raise
+                continue
+            except Exception:
+                self.reset()
+                raise
+            if response.status != 200:
+                raise ValueError("RPC request to {} failed with HTTP {}: {}".format(self.url, response.status, payload[:200]))
+            if response.will_close:
+                self.reset()
+            return payload
+
+    def call(self, body):
+        return loads(self.post(body))
+
+    def close(self):
+        self.reset()
@@ -0,0 +1,265 @@
+from concurrent.futures import ProcessPoolExecutor, wait
+from decimal import Decimal
+import multiprocessing
+from multiprocessing import shared_memory
+import os
+import queue
+import threading
+
+import numpy as np
+
+from decoder import decodeReserves
+from encoding import decodeAccountData
+from quote import quoteGrid
+from snapshot import MAX_MULTIPLE_ACCOUNTS, ReserveSnapshotter
+
+RAYDIUM_RESERVE_ACCOUNTS = 4
+MAX_ATTACHED_BUFFERS = 8
+OFFSET_SIZE = 8
+
+# Shared memory blocks a worker process has attached, by name
+attached = {}
+
+def attachBuffer(name):
+    memory = attached.get(name)
+    if memory is None:
+        # Buffers are only replaced when they grow, so old ones can be let go in any order
+        while len(attached) >= MAX_ATTACHED_BUFFERS:
+            attached.pop(next(iter(attached))).close()
+        memory = shared_memory.SharedMemory(name=name)
+        attached[name] = memory
+    return memory
+
+def decodeChunk(name,
+                account_count,
+                first,
+                last,
+                amounts_in):
+    # Runs in a worker: decodes pools [first, last) of a batch and quotes both sides of each.
+    # The buffer holds account_count + 1 offsets followed by the raw account bytes.
+    buffer = attachBuffer(name).buf
+    data_start = (account_count + 1) * OFFSET_SIZE
+    offsets = np.frombuffer(buffer, dtype=np.int64, count=account_count + 1).tolist()
+    reserves = []
+    fees = []
+    for pool in range(first, last):
+        accounts = range(pool * RAYDIUM_RESERVE_ACCOUNTS, (pool + 1) * RAYDIUM_RESERVE_ACCOUNTS)
+        datas = [buffer[data_start + offsets[i]:data_start + offsets[i + 1]] for i in accounts]
+        total_pc, total_coin, fee_denominator, fee_numerator = decodeReserves(*datas)
+        for data in datas:
+            data.release()
+        reserves.append((total_pc, total_coin))
+        fees.append((fee_denominator, fee_numerator))
+    if amounts_in is None or not reserves:
+        return (reserves, fees, None, None)
+    pc = [r[0] for r in reserves]
+    coin = [r[1] for r in reserves]
+    denominators = [f[0] for f in fees]
+    numerators = [f[1] for f in fees]
+    buy = quoteGrid(amounts_in, pc, coin, numerators, denominators)
+    sell = quoteGrid(amounts_in, coin, pc, numerators, denominators)
+    return (reserves, fees, buy, sell)
+
+class SharedBatch:
+    def __init__(self):
+        self.memory = None
+        self.futures = []
+
+    def write(self, account_bytes):
+        offsets = np.zeros(len(account_bytes) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(data) for data in account_bytes])
+        data_start = len(offsets) * OFFSET_SIZE
+        size = data_start + int(offsets[-1])
+        if self.memory is None or self.memory.size < size:
+            self.close()
+            # Headroom so a pool universe that grows a little does not reallocate every batch
+            self.memory = shared_memory.SharedMemory(create=True, size=max(size + size // 2, 1))
+        buffer = self.memory.buf
+        buffer[:data_start] = offsets.tobytes()
+        for data, offset in zip(account_bytes, offsets.tolist()):
+            buffer[data_start + offset:data_start + offset + len(data)] = data
+        return self.memory.name
+
+    def close(self):
+        if self.memory is not None:
+            self.memory.close()
+            self.memory.unlink()
+            self.memory = None
+
+class PendingBatch:
+    def __init__(self,
+                 slot,
+                 futures,
+                 chunks,
+                 inline):
+        self.slot = slot
+        self.futures = futures
+        self.chunks = chunks
+        self.inline = inline
+
+# ReserveSnapshotter whose Raydium pools are decoded and quoted in worker processes. Each batch
+# of raw account bytes goes into one of two shared memory buffers, so the next fetch can be
+# written while workers still read the previous one. Pools the workers cannot decode (other
+# DEXes, or Raydium with the book included) are parsed in this process while the workers run.
+class ParallelSnapshotter(ReserveSnapshotter):
+    def __init__(self,
+                 solana,
+                 pools,
+                 amounts_in = None,
+                 processes = None,
+                 chunk_pools = None,
+                 max_accounts = MAX_MULTIPLE_ACCOUNTS,
+                 max_retries = 3,
+                 start_method = 'spawn'):
+        ReserveSnapshotter.__init__(self, solana, pools, max_accounts, max_retries)
+        self.amounts_in = None if amounts_in is None else [int(amount) for amount in amounts_in]
+        self.processes = processes or os.cpu_count() or 1
+        # Where each pool's accounts sit in the fetched groups
+        self.locations = []
+        for group, pools in enumerate(self.pool_groups):
+            start = 0
+            for pool in pools:
+                end = start + len(pool.reserveAccounts())
+                self.locations.append((pool, group, start, end))
+                start = end
+        self.parallel = [location for location in self.locations if self.supports(location[0])]
+        self.inline = [location for location in self.locations if not self.supports(location[0])]
+        self.chunk_pools = chunk_pools or max(1, -(-len(self.parallel) // self.processes))
+        self.executor = ProcessPoolExecutor(self.processes, mp_context=multiprocessing.get_context(start_method))
+        self.buffers = [SharedBatch(), SharedBatch()]
+        # When the workers decode every pool only raw account bytes are needed, so batches are
+        # fetched over the raw transport from a request serialized once here
+        self.request = None if self.inline else solana.multipleAccountsRequest(self.account_groups)
+        self.batches = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def supports(self, pool):
+        # Workers decode the Raydium AMM, vault and open orders accounts
+        return hasattr(pool, 'amm_open_orders_account') and not getattr(pool, 'include_book', False)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        for buffer in self.buffers:
+            buffer.close()
+
+    def fetch(self):
+        if self.request is None:
+            return ReserveSnapshotter.fetch(self)
+        return self.fetchAtSlot(lambda: self.solana.getMultipleAccountsBytes(self.request))
+
+    def submit(self, results, slot):
+        buffer = self.buffers[self.batches % 2]
+        self.batches += 1
+        # The buffer is reused once the batch written to it two fetches ago is fully decoded
+        wait(buffer.futures)
+        account_bytes = []
+        for pool, group, start, end in self.parallel:
+            account_datas = results[group][0][start:end]
+            for address, account_data in zip(pool.reserveAccounts(), account_datas):
+                if account_data is None:
+                    raise ValueError("Account {} of pool {} does not exist".format(address, pool.pool_info["id"]))
+                if self.request is None:
+                    pool.verifyEncoding(address, account_data[1])
+                    account_data = decodeAccountData(account_data)
+                account_bytes.append(account_data)
+        futures = []
+        chunks = []
+        if self.parallel:
+            name = buffer.write(account_bytes)
+            for first in range(0, len(self.parallel), self.chunk_pools):
+                last = min(first + self.chunk_pools, len(self.parallel))
+                futures.append(self.executor.submit(decodeChunk, name, len(account_bytes), first, last, self.amounts_in))
+                chunks.append((first, last))
+        buffer.futures = futures
+        inline = {}
+        for pool, group, start, end in self.inline:
+            reserves, fees, _ = pool.parsePoolReserves(results[group][0][start:end], slot)
+            inline[pool] = (reserves, fees)
+        return PendingBatch(slot, futures, chunks, inline)
+
+    def quoteInline(self,
+                    pool,
+                    side,
+                    reserves,
+                    fees):
+        # Adapters quote with their own curve and fee rules, Raydium pools with quoteGrid
+        if hasattr(pool, 'curve'):
+            return np.array([pool.amountOut(amount_in, side, reserves, fees) for amount_in in self.amounts_in], dtype=object)
+        reserve_in, reserve_out = (reserves[0], reserves[1]) if side == 'buy' else (reserves[1], reserves[0])
+        return quoteGrid(self.amounts_in, [int(reserve_in)], [int(reserve_out)], [int(fees[1])], [int(fees[0])])[0]
+
+    def collect(self, batch):
+        decoded = {}
+        quotes = {}
+        for future, (first, last) in zip(batch.futures, batch.chunks):
+            reserves, fees, buy, sell = future.result()
+            for i, location in enumerate(self.parallel[first:last]):
+                pool = location[0]
+                fee_denominator, fee_numerator = fees[i]
+                decoded[pool] = (list(reserves[i]), (Decimal(fee_denominator), Decimal(fee_numerator)))
+                if buy is not None:
+                    quotes[pool] = (buy[i], sell[i])
+        if self.amounts_in is not None:
+            for pool, (reserves, fees) in batch.inline.items():
+                quotes[pool] = (self.quoteInline(pool, 'buy', reserves, fees), self.quoteInline(pool, 'sell', reserves, fees))
+        decoded.update(batch.inline)
+        snapshot = {pool: decoded[pool] for pool in self.pools}
+        return snapshot, quotes
+
+    def getQuotes(self):
+        # Reserves and fees per pool as getReserves returns them, plus (buy, sell) quotes for amounts_in
+        if not self.pools:
+            return ({}, {}, None)
+        results, slot = self.fetch()
+        snapshot, quotes = self.collect(self.submit(results, slot))
+        return (snapshot, quotes, slot)
+
+    def getReserves(self):
+        snapshot, _, slot = self.getQuotes()
+        return (snapshot, slot)
+
+    def run(self,
+            callback,
+            batches = None):
+        # A fetcher thread keeps one batch in flight while callback(snapshot, quotes, slot)
+        # handles the previous one, so network time overlaps with decoding
+        pending = queue.Queue(maxsize=1)
+        stop = threading.Event()
+
+        def fetcher():
+            count = 0
+            try:
+                while not stop.is_set() and (batches is None or count < batches):
+                    results, slot = self.fetch()
+                    pending.put(self.submit(results, slot))
+                    count += 1
+            except Exception as e:
+                pending.put(e)
+                return
+            pending.put(None)
+
+        thread = threading.Thread(target=fetcher, name='snapshot-fetcher', daemon=True)
+        thread.start()
+        try:
+            while True:
+                batch = pending.get()
+                if batch is None:
+                    break
+                if isinstance(batch, Exception):
+                    raise batch
+                snapshot, quotes = self.collect(batch)
+                if callback(snapshot, quotes, batch.slot) is False:
+                    break
+        finally:
+            stop.set()
+            while thread.is_alive():
+                try:
+                    pending.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            thread.join()